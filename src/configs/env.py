@@ -18,6 +18,60 @@ GENDER_DETECTION_BEARER_TOKEN = os.getenv("GENDER_DETECTION_BEARER_TOKEN")
 ENDPOINT_WHISPER_API_URL = os.getenv("ENDPOINT_WHISPER_API_URL")
 WHISPER_BEARER_TOKEN = os.getenv("WHISPER_BEARER_TOKEN")
 
+# Whisper batching (a batch is limited by both values, bytes are of base64 payloads, the batch with one chunk
+# is sent as a plain request)
+WHISPER_BATCH_MAX_BYTES = int(os.getenv("WHISPER_BATCH_MAX_BYTES", 8 * 1024 * 1024))
+WHISPER_BATCH_MAX_DURATION_SECONDS = int(os.getenv("WHISPER_BATCH_MAX_DURATION_SECONDS", 5 * 60))
+
+# Translation
+TRANSLATION_MAX_CONCURRENCY = int(os.getenv("TRANSLATION_MAX_CONCURRENCY", 4))
+TRANSLATION_CHUNK_MAX_ATTEMPTS = int(os.getenv("TRANSLATION_CHUNK_MAX_ATTEMPTS", 3))
+# How many times missing or merged segments are requested again
+TRANSLATION_REPAIR_MAX_ATTEMPTS = int(os.getenv("TRANSLATION_REPAIR_MAX_ATTEMPTS", 2))
+# How many tokens the translation takes per token of the source text (Cyrillic, CJK take more tokens than Latin)
+TRANSLATION_OUTPUT_TOKENS_RATIO = float(os.getenv("TRANSLATION_OUTPUT_TOKENS_RATIO", 2.5))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", 200_000))
+
+# Text to speech ("segments" - every segment is synthesized by its own request, "combined" - one request with pauses)
+TTS_SYNTHESIS_MODE = os.getenv("TTS_SYNTHESIS_MODE", "segments")
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 4))
+TTS_SEGMENT_MAX_ATTEMPTS = int(os.getenv("TTS_SEGMENT_MAX_ATTEMPTS", 3))
+# Maximum speed up of speech to fit a segment into the time of the original segment
+TTS_MAX_SPEAKING_RATE = float(os.getenv("TTS_MAX_SPEAKING_RATE", 1.3))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# Folder in Firebase bucket shared by all instances, the shared tier is off if it's not set
+TTS_SHARED_CACHE_BLOB_PREFIX = os.getenv("TTS_SHARED_CACHE_BLOB_PREFIX")
+
+# Provider quotas of one instance (0 - no limit), split account quotas between instances
+OPEN_AI_REQUESTS_PER_MINUTE = int(os.getenv("OPEN_AI_REQUESTS_PER_MINUTE", 500))
+OPEN_AI_TOKENS_PER_MINUTE = int(os.getenv("OPEN_AI_TOKENS_PER_MINUTE", 150_000))
+ELEVEN_LABS_MAX_CONCURRENCY = int(os.getenv("ELEVEN_LABS_MAX_CONCURRENCY", 5))
+ELEVEN_LABS_CHARACTERS_PER_MINUTE = int(os.getenv("ELEVEN_LABS_CHARACTERS_PER_MINUTE", 0))
+MICROSOFT_REQUESTS_PER_MINUTE = int(os.getenv("MICROSOFT_REQUESTS_PER_MINUTE", 12_000))
+MICROSOFT_MAX_CONCURRENCY = int(os.getenv("MICROSOFT_MAX_CONCURRENCY", 20))
+
+# Requests to external APIs (a duplicate request is sent when the request is slower than the latency percentile)
+OPEN_AI_REQUEST_TIMEOUT_SECONDS = int(os.getenv("OPEN_AI_REQUEST_TIMEOUT_SECONDS", 3 * 60))
+WHISPER_REQUEST_TIMEOUT_SECONDS = int(os.getenv("WHISPER_REQUEST_TIMEOUT_SECONDS", 10 * 60))
+ELEVEN_LABS_REQUEST_TIMEOUT_SECONDS = int(os.getenv("ELEVEN_LABS_REQUEST_TIMEOUT_SECONDS", 5 * 60))
+HEDGE_LATENCY_PERCENTILE = float(os.getenv("HEDGE_LATENCY_PERCENTILE", 0.95))
+# Maximum share of requests to one provider which may be duplicated
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1))
+
+# Overlay (time stretch preset: "fast", "balanced" or "quality")
+TIME_STRETCH_PRESET = os.getenv("TIME_STRETCH_PRESET", "balanced")
+TIME_STRETCH_MAX_WORKERS = int(os.getenv("TIME_STRETCH_MAX_WORKERS", os.cpu_count() or 1))
+# Memory for mixing the output audio by blocks, shards rendered at a time split it between their blocks
+RENDER_BLOCK_MEMORY_BYTES = int(os.getenv("RENDER_BLOCK_MEMORY_BYTES", 64 * 1024 * 1024))
+# How many shards of the output audio are rendered at a time
+RENDER_MAX_WORKERS = int(os.getenv("RENDER_MAX_WORKERS", os.cpu_count() or 1))
+
+# Artifacts of jobs (an artifact goes to memory if it fits, then to tmpfs, then to disk of the processing dir),
+# budgets are shared by all jobs of the process
+ARTIFACT_MEMORY_MAX_BYTES = int(os.getenv("ARTIFACT_MEMORY_MAX_BYTES", 256 * 1024 * 1024))
+ARTIFACT_TMPFS_DIR_PATH = os.getenv("ARTIFACT_TMPFS_DIR_PATH", "/dev/shm")
+ARTIFACT_TMPFS_MAX_BYTES = int(os.getenv("ARTIFACT_TMPFS_MAX_BYTES", 1024 * 1024 * 1024))
+
 # Firebase
 CERTIFICATE_CONTENT = json.loads(os.getenv("FIREBASE_CERTIFICATE_CONTENT"))
 BUCKET_NAME = os.getenv("BUCKET_NAME")
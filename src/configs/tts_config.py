@@ -1,10 +1,16 @@
 import json
 import os
-from typing import List
+import pickle
+import tempfile
+import threading
+import time
+from typing import Dict, List
 
 from configs.logger import catch_error
+from constants.files import CACHE_FILES_DIR_PATH
 from constants.log_tags import LogTag
 from models.target_voice import TargetVoice
+from models.voice_provider import VoiceProvider
 
 # Get the absolute path to the current file
 current_file = __file__
@@ -15,13 +21,129 @@ current_folder_path = os.path.dirname(os.path.abspath(current_file))
 # Absolute path to tts-voices config
 tts_config_path = f"{current_folder_path}/tts-voices.json"
 
-try:
-    tts_config_file = open(tts_config_path, "r")
-    # Convert dict to list of TargetVoices
-    tts_config: List[TargetVoice] = [TargetVoice(**voice) for voice in json.load(tts_config_file)]
-    tts_config_file.close()
-except Exception as e:
-    catch_error(
-        tag=LogTag.TTS_CONFIG,
-        error=e,
-    )
+# Validated voices as plain tuples, so next cold starts skip JSON parsing and pydantic validation
+compiled_tts_config_path = f"{CACHE_FILES_DIR_PATH}/tts-voices.pickle"
+
+# Increase when the compiled form changes
+COMPILED_TTS_CONFIG_VERSION = 1
+
+# How often the config file is checked for changes
+RELOAD_CHECK_INTERVAL_IN_SECONDS = 10
+
+
+class VoiceCatalog:
+    """
+    Voices from tts-voices config, indexed by id, language and provider.
+
+    The config is loaded on the first lookup and reloaded when the file changes.
+    """
+
+    def __init__(self, config_path: str, compiled_config_path: str):
+        self.config_path = config_path
+        self.compiled_config_path = compiled_config_path
+        self.lock = threading.Lock()
+        self.config_version: tuple | None = None
+        self.last_check_time = 0.0
+        self.voices_by_id: Dict[int, TargetVoice] = {}
+        self.voices_by_language: Dict[str, List[TargetVoice]] = {}
+        self.voices_by_provider: Dict[VoiceProvider, List[TargetVoice]] = {}
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        if self.config_version is not None and now - self.last_check_time < RELOAD_CHECK_INTERVAL_IN_SECONDS:
+            return
+
+        with self.lock:
+            self.last_check_time = now
+            config_stat = os.stat(self.config_path)
+            config_version = (COMPILED_TTS_CONFIG_VERSION, config_stat.st_mtime_ns, config_stat.st_size)
+            if config_version == self.config_version:
+                return
+
+            try:
+                voices = self.load_voices(config_version)
+            except Exception as e:
+                # Keep serving the previous config if the changed file is broken
+                if self.config_version is not None:
+                    self.config_version = config_version
+                    return
+                catch_error(
+                    tag=LogTag.TTS_CONFIG,
+                    error=e,
+                )
+
+            voices_by_language: Dict[str, List[TargetVoice]] = {}
+            voices_by_provider: Dict[VoiceProvider, List[TargetVoice]] = {}
+            for voice in voices:
+                for language in voice.languages:
+                    voices_by_language.setdefault(language.lower(), []).append(voice)
+                voices_by_provider.setdefault(voice.provider, []).append(voice)
+
+            self.voices_by_id = {voice.voice_id: voice for voice in voices}
+            self.voices_by_language = voices_by_language
+            self.voices_by_provider = voices_by_provider
+            self.config_version = config_version
+
+    def load_voices(self, config_version: tuple) -> List[TargetVoice]:
+        try:
+            with open(self.compiled_config_path, "rb") as compiled_config_file:
+                compiled_config_version, voices_values = pickle.load(compiled_config_file)
+            if compiled_config_version == config_version:
+                # Values were validated when the config was compiled
+                return [
+                    TargetVoice.construct(
+                        voice_id=voice_id,
+                        voice_name=voice_name,
+                        provider=VoiceProvider(provider),
+                        original_id=original_id,
+                        sample=sample,
+                        languages=list(languages)
+                    )
+                    for voice_id, voice_name, provider, original_id, sample, languages in voices_values
+                ]
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+        with open(self.config_path, "r") as tts_config_file:
+            # Convert dict to list of TargetVoices
+            voices = [TargetVoice(**voice) for voice in json.load(tts_config_file)]
+
+        voices_values = [
+            (
+                voice.voice_id,
+                voice.voice_name,
+                voice.provider.value,
+                voice.original_id,
+                voice.sample,
+                tuple(voice.languages)
+            )
+            for voice in voices
+        ]
+        os.makedirs(os.path.dirname(self.compiled_config_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(self.compiled_config_path),
+            suffix=".tmp",
+            delete=False
+        ) as compiled_config_file:
+            pickle.dump((config_version, voices_values), compiled_config_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(compiled_config_file.name, self.compiled_config_path)
+
+        return voices
+
+    def get_voice_by_id(self, voice_id: int) -> TargetVoice | None:
+        self.ensure_loaded()
+        return self.voices_by_id.get(voice_id)
+
+    def get_voices_by_language(self, language: str) -> List[TargetVoice]:
+        self.ensure_loaded()
+        return self.voices_by_language.get(language.lower(), [])
+
+    def get_voices_by_provider(self, provider: VoiceProvider) -> List[TargetVoice]:
+        self.ensure_loaded()
+        return self.voices_by_provider.get(provider, [])
+
+
+voice_catalog = VoiceCatalog(
+    config_path=tts_config_path,
+    compiled_config_path=compiled_tts_config_path
+)
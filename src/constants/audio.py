@@ -0,0 +1,5 @@
+# Working format of synthesized speech, it's kept in memory as raw PCM and encoded to a lossy format
+# only once, for the output file
+PIPELINE_FRAME_RATE = 24000
+PIPELINE_SAMPLE_WIDTH = 2
+PIPELINE_CHANNELS = 1
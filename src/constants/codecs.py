@@ -1,2 +1,9 @@
 MP4_CODEC = "libx264"
 MP3_CODEC = "pcm_s16le"
+
+# Audio codecs of translated videos by container, the video stream is copied as is
+VIDEO_CONTAINERS_AUDIO_CODECS = {
+    "mp4": "aac",
+    "avi": "libmp3lame",
+}
+TRANSLATED_AUDIO_BITRATE = "192k"
@@ -7,6 +7,8 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_dir = os.path.dirname(current_dir)
 
 PROCESSING_FILES_DIR_PATH = f"{project_dir}/tmp"
+# Caches which outlive a single project (translation memory, etc.)
+CACHE_FILES_DIR_PATH = f"{project_dir}/cache"
 
 VIDEO_SUPPORTED_EXTENSIONS = ["mp4", "avi"]
 AUDIO_SUPPORTED_EXTENSIONS = ["mp3"]
@@ -10,16 +10,22 @@ class LogTag(Enum):
     DOWNLOAD_BLOB = "download_blob"
     UPDATE_PROJECT = "update_project"
     UPLOAD_BLOB = "upload_blob"
+    INGEST_SOURCE_AUDIO = "ingest_source_audio"
     SPEECH_TO_TEXT = "speech_to_text"
     WHISPER_ENDPOINT_REQUEST = "whisper_endpoint_request"
     WHISPER_ENDPOINT_RESPONSE = "whisper_endpoint_response"
     SPLIT_TEXT_TO_CHUNKS = "split_text_to_chunks"
     TRANSLATE_TEXT_CHUNK_WITH_GPT = "translate_text_chunk_with_gpt"
     TRANSLATE_TEXT = "translate_text"
+    TRANSLATION_MEMORY = "translation_memory"
+    DETECT_LANGUAGE = "detect_language"
     COMBINE_TEXT_SEGMENTS = "combine_text_segments"
     TEXT_TO_SPEECH = "text_to_speech"
     GET_VOICE_BY_ID = "get_voice_by_id"
+    SYNTHESIZE_TEXT_SEGMENTS = "synthesize_text_segments"
+    TTS_CACHE = "tts_cache"
     ELEVENLABS_PROVIDER = "elevenlabs_provider"
     MICROSOFT_PROVIDER = "microsoft_provider"
     OVERLAY_AUDIO = "overlay_audio"
+    MUX_AUDIO_TO_VIDEO = "mux_audio_to_video"
     UPDATE_USER_TOKENS = "update_user_tokens"
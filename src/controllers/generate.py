@@ -1,3 +1,4 @@
+import io
 import os
 from datetime import datetime
 
@@ -12,10 +13,13 @@ from services.firebase.firestore.project import update_project_status_and_transl
 from services.firebase.firestore.user_tokens import update_user_tokens
 from services.firebase.storage.download_blob import download_blob
 from services.firebase.storage.upload_blob import upload_blob
+from services.ingest.ingest_source_audio import ingest_source_audio
 from services.overlay.overlay_audio_to_video import overlay_audio_to_video
+from services.overlay.segments_stretcher import SegmentsStretcher
 from services.speech_to_text.speech_to_text import speech_to_text
 from services.text_to_speech.text_to_speech import text_to_speech
 from services.translation.translate_text import translate_text
+from utils.artifact_store import ArtifactStore
 from utils.files import get_file_extension, get_file_type, get_file_dir, get_file_name
 
 dub_router = APIRouter(tags=["DUB"])
@@ -29,6 +33,8 @@ def generate(
     original_file_location: str,
     organization_id: str,
     user_email: str,
+    translation_latency_budget_seconds: float | None = None,
+    translation_cost_budget_usd: float | None = None,
 ):
     """
     Generates a dubbed version of the original video or audio file in the target language
@@ -40,6 +46,8 @@ def generate(
     :param original_file_location: The location of the original video file in the cloud storage.
     :param organization_id: The unique identifier of the organization.
     :param user_email: The unique identifier of the organization.
+    :param translation_latency_budget_seconds: Time the translation may take (e.g. for previews), no limit by default.
+    :param translation_cost_budget_usd: Money the translation may cost, no limit by default.
 
     :return: Upload the dubbed video to Firebase Cloud Storage
 
@@ -55,6 +63,11 @@ def generate(
     Check if project_id, organization_id and original_file_location exist in Firebase
     """
 
+    # Intermediate artifacts of the job, they are removed when the job ends, even if it fails
+    artifact_store = ArtifactStore(job_id=project_id)
+    # Stretcher of the overlay, it starts stretching segments while text to speech is still running
+    segments_stretcher = None
+
     try:
         start_time = datetime.now()
         print_info_log(
@@ -106,6 +119,25 @@ def generate(
             message="Project status updated."
         )
 
+        """Decode audio of the file once for all stages"""
+
+        print_info_log(
+            tag=LogTag.MAIN,
+            message="Decoding source audio..."
+        )
+
+        source_audio = ingest_source_audio(
+            file_path=local_original_file_path,
+            artifact_store=artifact_store,
+            project_id=project_id,
+            show_logs=True
+        )
+
+        print_info_log(
+            tag=LogTag.MAIN,
+            message="Decoding completed."
+        )
+
         """Convert file speech to text"""
 
         print_info_log(
@@ -114,7 +146,7 @@ def generate(
         )
 
         original_text_segments, used_tokens_in_seconds = speech_to_text(
-            file_path=local_original_file_path,
+            source_audio=source_audio,
             project_id=project_id,
             show_logs=True
         )
@@ -135,6 +167,8 @@ def generate(
             text_segments=original_text_segments,
             language=target_language,
             project_id=project_id,
+            latency_budget_seconds=translation_latency_budget_seconds,
+            cost_budget_usd=translation_cost_budget_usd,
             show_logs=True
         )
 
@@ -145,7 +179,7 @@ def generate(
 
         # """Detect gender of the voice"""
         #
-        # gender = voice_gender_detection(video_path)
+        # gender = voice_gender_detection(source_audio, project_id)
 
         """Generate audio from translated text"""
 
@@ -154,11 +188,16 @@ def generate(
             message="Text to speech..."
         )
 
-        local_translated_audio_path, translated_text_segments_with_audio_timestamp = text_to_speech(
+        processed_project_is_video = get_file_type(local_original_file_path) == FileType.VIDEO
+        if processed_project_is_video:
+            segments_stretcher = SegmentsStretcher()
+
+        translated_audio, translated_text_segments_with_audio_timestamp = text_to_speech(
             text_segments=translated_text_segments,
             voice_id=voice_id,
             project_id=project_id,
-            show_logs=True
+            show_logs=True,
+            segments_stretcher=segments_stretcher
         )
 
         print_info_log(
@@ -168,7 +207,6 @@ def generate(
 
         """Overlay audio to video"""
 
-        processed_project_is_video = get_file_type(local_original_file_path) == FileType.VIDEO
         # Overlay audio if project is video
         if processed_project_is_video:
             print_info_log(
@@ -176,12 +214,15 @@ def generate(
                 message="Overlay audio to video..."
             )
 
-            local_translated_file_path = overlay_audio_to_video(
+            translated_file_artifact = overlay_audio_to_video(
                 video_path=local_original_file_path,
-                audio_path=local_translated_audio_path,
+                source_audio=source_audio,
+                translated_audio=translated_audio,
                 text_segments_with_audio_timestamp=translated_text_segments_with_audio_timestamp,
+                artifact_store=artifact_store,
                 project_id=project_id,
                 silent_original_audio=False,
+                segments_stretcher=segments_stretcher,
                 show_logs=True
             )
 
@@ -190,9 +231,14 @@ def generate(
                 message="Overlay audio completed."
             )
 
-        # Unless return translated audio
+        # Unless return translated audio, it's encoded only here
         else:
-            local_translated_file_path = local_translated_audio_path
+            translated_audio_buffer = io.BytesIO()
+            translated_audio.export(translated_audio_buffer, format="mp3")
+            translated_file_artifact = artifact_store.put_bytes(
+                name=f"{project_id}-translated.mp3",
+                data=translated_audio_buffer.getvalue()
+            )
 
         """Upload audio to cloud storage"""
 
@@ -209,12 +255,13 @@ def generate(
             message="Uploading translated file to cloud storage..."
         )
 
-        file_public_link = upload_blob(
-            source_file_name=local_translated_file_path,
-            destination_blob_name=destination_blob_name,
-            project_id=project_id,
-            show_logs=True
-        )
+        with translated_file_artifact.open_reader() as translated_file:
+            file_public_link = upload_blob(
+                source_file=translated_file,
+                destination_blob_name=destination_blob_name,
+                project_id=project_id,
+                show_logs=True
+            )
 
         print_info_log(
             tag=LogTag.MAIN,
@@ -230,12 +277,13 @@ def generate(
 
         # Remove original file
         os.remove(local_original_file_path)
-        # Remove translated file
-        if processed_project_is_video:
-            os.remove(local_translated_file_path)
-            os.remove(local_translated_audio_path)
-        else:
-            os.remove(local_translated_file_path)
+        # Remove artifacts: decoded source audio, translated file
+        source_audio.close()
+        print_info_log(
+            tag=LogTag.MAIN,
+            message=f"Artifacts of the job: {artifact_store.get_stats()}"
+        )
+        artifact_store.close()
 
         print_info_log(
             tag=LogTag.MAIN,
@@ -313,6 +361,11 @@ def generate(
             project_id=project_id
         )
 
+    finally:
+        if segments_stretcher is not None:
+            segments_stretcher.close()
+        artifact_store.close()
+
 
 if __name__ == "__main__":
     test_user_id = "z8Z5j71WbmhaioUHDHh5KrBqEO13"
@@ -2,6 +2,12 @@ import uvicorn
 from fastapi import FastAPI
 
 from controllers.generate import dub_router
+from services.text_to_speech.tts_cache import tts_cache
+from services.translation.model_latency_stats import model_latency_stats
+from services.translation.translation_memory import translation_memory
+from utils.artifact_store import artifact_budget
+from utils.hedged_request import get_hedging_stats
+from utils.rate_limiter import get_rate_limiters_stats
 
 app = FastAPI()
 
@@ -13,6 +19,18 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "translation_memory": translation_memory.get_stats(),
+        "translation_models_latency": model_latency_stats.get_stats(),
+        "hedged_requests": get_hedging_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "rate_limiters": get_rate_limiters_stats(),
+        "artifacts_reserved_bytes": artifact_budget.get_stats()
+    }
+
+
 if __name__ == "__main__":
     print("main started")
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
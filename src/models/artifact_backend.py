@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class ArtifactBackend(str, Enum):
+    MEMORY = "memory"
+    TMPFS = "tmpfs"
+    DISK = "disk"
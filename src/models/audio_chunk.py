@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class AudioChunk(BaseModel):
+    start_time_ms: int
+    duration_ms: int
+    data: bytes
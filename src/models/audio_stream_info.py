@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class AudioStreamInfo(BaseModel):
+    """
+    Format of the audio stream of a media file, duration is in seconds, None if the file doesn't have it.
+    """
+
+    frame_rate: int
+    channels: int
+    duration: float | None = None
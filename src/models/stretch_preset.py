@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class StretchPreset(str, Enum):
+    FAST = "fast"
+    BALANCED = "balanced"
+    QUALITY = "quality"
@@ -0,0 +1,18 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class TranslatedSegmentsValidation(BaseModel):
+    missing_ids: List[str]
+    merged_ids: List[str]
+    extra_ids: List[str]
+
+    @property
+    def failed_ids(self) -> List[str]:
+        """Segment ids which must be translated again."""
+        return self.missing_ids + self.merged_ids
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.failed_ids
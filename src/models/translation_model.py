@@ -0,0 +1,11 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class TranslationModel(BaseModel):
+    name: str
+    input_cost_per_1k_tokens: float
+    output_cost_per_1k_tokens: float
+    # Languages which the model translates well, None if the model is good for all languages
+    languages: List[str] | None = None
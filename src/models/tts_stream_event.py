@@ -0,0 +1,13 @@
+from typing import Tuple
+
+from pydantic import BaseModel
+
+
+class TTSStreamEvent(BaseModel):
+    """
+    Piece of streamed synthesis: a chunk of raw PCM audio or the position of a segment in the audio.
+    """
+
+    audio_data: bytes | None = None
+    segment_index: int | None = None
+    audio_timestamp: Tuple[float, float] | None = None
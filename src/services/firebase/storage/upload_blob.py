@@ -1,23 +1,30 @@
+import mimetypes
+from typing import BinaryIO
+
 from configs.firebase import bucket
 from configs.logger import catch_error, print_info_log
 from constants.log_tags import LogTag
 
 
 def upload_blob(
-    source_file_name: str,
+    source_file: str | BinaryIO,
     destination_blob_name: str,
     project_id: str,
     show_logs: bool = False
 ):
     try:
-        if show_logs:
+        if show_logs and isinstance(source_file, str):
             print_info_log(
                 tag=LogTag.UPLOAD_BLOB,
-                message=f"Local file path: {source_file_name}"
+                message=f"Local file path: {source_file}"
             )
 
         blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_file_name)
+        if isinstance(source_file, str):
+            blob.upload_from_filename(source_file)
+        else:
+            # Content type is guessed by the name, as upload_from_filename does it
+            blob.upload_from_file(source_file, content_type=mimetypes.guess_type(destination_blob_name)[0])
 
         if show_logs:
             print_info_log(
@@ -1,23 +1,32 @@
+import io
+
 import requests
 
 from configs.env import GENDER_DETECTION_API_URL, GENDER_DETECTION_BEARER_TOKEN
 from configs.logger import catch_error
+from utils.pcm_file import PCMFile
+
+# The voice is classified by the beginning of the audio, it's sent as 16kHz mono WAV like to Whisper
+GENDER_DETECTION_AUDIO_DURATION_MS = 60 * 1000
+GENDER_DETECTION_SAMPLE_RATE = 16000
 
 headers = {
     "Authorization": f"Bearer {GENDER_DETECTION_BEARER_TOKEN}"
 }
 
 
-# Takes the filename of the audio with the voice
+# Takes the decoded source audio with the voice
 # Returns the voice gender ('female' or 'male'), str type
 
-def voice_gender_detection(filename: str, project_id: str):
-    try:
-        with open(filename, "rb") as f:
-            data = f.read()
-    except FileNotFoundError:
-        print(f"Error: {filename} not found.")
-        return None
+def voice_gender_detection(source_audio: PCMFile, project_id: str):
+    wav_buffer = io.BytesIO()
+    (
+        source_audio.get_audio_segment(0, GENDER_DETECTION_AUDIO_DURATION_MS)
+        .set_frame_rate(GENDER_DETECTION_SAMPLE_RATE)
+        .set_channels(1)
+        .export(wav_buffer, format="wav")
+    )
+    data = wav_buffer.getvalue()
 
     response = requests.post(GENDER_DETECTION_API_URL, headers=headers, data=data)
 
@@ -0,0 +1,79 @@
+import math
+import os
+
+from configs.logger import catch_error, print_info_log
+from constants.audio import PIPELINE_FRAME_RATE, PIPELINE_CHANNELS
+from constants.log_tags import LogTag
+from utils.artifact_store import ArtifactStore
+from utils.media_info import probe_audio_stream
+from utils.pcm_file import PCM_FILE_HEADER_SIZE, PCM_FILE_SAMPLE_WIDTH, PCMFile, decode_to_pcm_file
+
+SOURCE_AUDIO_ARTIFACT_NAME = "source-audio.pcm"
+
+
+def ingest_source_audio(
+    file_path: str,
+    artifact_store: ArtifactStore,
+    project_id: str,
+    show_logs: bool = False
+) -> PCMFile:
+    """
+    Decode the audio of the project file once to a memory-mapped PCM file, which later stages read
+    (speech to text, gender detection, overlay) instead of decoding the file again.
+
+    The audio is decoded to the format in which it's mixed with the translated speech: not less than
+    the frame rate and channels of the pipeline, so the overlay doesn't convert it again.
+
+    :param file_path: Path to the original video or audio file.
+    :param artifact_store: Artifacts of the job, the PCM file is one of them.
+    :param project_id: The id of the processing project.
+    :param show_logs: Determines whether to display logs while decoding.
+
+    :return: The decoded audio.
+    """
+
+    try:
+        if not os.path.exists(file_path):
+            raise ValueError(f"File not found: {file_path}")
+
+        audio_stream_info = probe_audio_stream(file_path)
+        if audio_stream_info is None:
+            raise ValueError(f"File {file_path} has no audio stream.")
+
+        frame_rate = max(audio_stream_info.frame_rate, PIPELINE_FRAME_RATE)
+        channels = max(audio_stream_info.channels, PIPELINE_CHANNELS)
+        # Without the duration the size is not known, so the file goes to disk
+        expected_bytes = None
+        if audio_stream_info.duration is not None:
+            expected_bytes = (
+                PCM_FILE_HEADER_SIZE
+                + math.ceil(audio_stream_info.duration * frame_rate) * channels * PCM_FILE_SAMPLE_WIDTH
+            )
+        # The file is memory-mapped, so it's on tmpfs or disk
+        source_audio_artifact = artifact_store.create(
+            name=SOURCE_AUDIO_ARTIFACT_NAME,
+            expected_bytes=expected_bytes,
+            needs_path=True
+        )
+        source_audio = decode_to_pcm_file(
+            source_path=file_path,
+            pcm_file_path=source_audio_artifact.path,
+            frame_rate=frame_rate,
+            channels=channels
+        )
+
+        if show_logs:
+            print_info_log(
+                tag=LogTag.INGEST_SOURCE_AUDIO,
+                message=f"Audio of {file_path} decoded to {source_audio_artifact.backend.value}: "
+                        f"{source_audio.duration:.2f}s, {source_audio.frame_rate}Hz, {source_audio.channels} channels"
+            )
+
+        return source_audio
+
+    except Exception as e:
+        catch_error(
+            tag=LogTag.INGEST_SOURCE_AUDIO,
+            error=e,
+            project_id=project_id
+        )
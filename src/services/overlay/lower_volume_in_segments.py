@@ -1,35 +1,85 @@
 from typing import List
-from pydub import AudioSegment
+
+import numpy as np
+from pydub.utils import db_to_float
+
 from models.text_segment import TextSegmentWithAudioTimestamp
 
+# Volume goes down a bit before the segment and comes back smoothly after it, instead of hard steps
+DEFAULT_ATTACK_MS = 100
+DEFAULT_RELEASE_MS = 250
+
 
-def lower_volume_in_segments(audio: AudioSegment, segments: List[TextSegmentWithAudioTimestamp],
-                             reduction_dB: float) -> AudioSegment:
+class DuckingEnvelope:
     """
-    Lowers the volume of specified segments in an audio file.
+    Gain envelope which lowers the volume in segments of the timeline.
 
-    :param audio: The original AudioSegment object.
-    :param segments: A list of instances, each containing the start and end times of segments.
-    :param reduction_dB: The amount of volume reduction in decibels.
-    :return: A new AudioSegment with the volume reduced in the specified segments.
+    Reduction of every frame is full inside segments, ramped linearly in dB during attack before and release
+    after a segment, the strongest one where segments overlap. Gain is computed for any range of frames,
+    so the envelope is applied by blocks and memory doesn't grow with the track.
     """
-    # Start with an empty audio segment
-    modified_audio = AudioSegment.silent(duration=0)
-
-    last_end = 0
-    for segment in segments:
-        start, end = segment.original_timestamp
-        start *= 1000
-        end *= 1000
-        # Add the segment before the current affected segment
-        modified_audio += audio[last_end:start]
-
-        # Reduce volume for the current segment and add it
-        affected_segment = audio[start:end] - reduction_dB
-        modified_audio += affected_segment
-
-        last_end = end
-
-    # Add the remaining part of the audio, if any
-    modified_audio += audio[last_end:]
-    return modified_audio
\ No newline at end of file
+
+    def __init__(
+        self,
+        segments: List[TextSegmentWithAudioTimestamp],
+        frame_rate: int,
+        reduction_dB: float,
+        attack_ms: float = DEFAULT_ATTACK_MS,
+        release_ms: float = DEFAULT_RELEASE_MS
+    ):
+        frames_per_ms = frame_rate / 1000.0
+        self.reduction_dB = reduction_dB
+
+        # Segment boundaries in frames, as slicing of AudioSegment computes them
+        segments_starts = np.array(
+            [int(segment.original_timestamp[0] * 1000 * frames_per_ms) for segment in segments], dtype=np.int64
+        )
+        segments_ends = np.array(
+            [int(segment.original_timestamp[1] * 1000 * frames_per_ms) for segment in segments], dtype=np.int64
+        )
+        order = np.argsort(segments_starts)
+        self.segments_starts, self.segments_ends = segments_starts[order], segments_ends[order]
+        self.attack_frames = max(int(attack_ms * frames_per_ms), 1)
+        self.release_frames = max(int(release_ms * frames_per_ms), 1)
+        # Segments can't reach further than the longest one, it bounds the search of segments of a block
+        self.max_reach_frames = (
+            int(np.max(self.segments_ends - self.segments_starts, initial=0)) + self.attack_frames + self.release_frames
+        )
+
+    def get_gain(self, start_frame: int, end_frame: int) -> np.ndarray:
+        """
+        Return gain (float32, not above 1) of every frame in [start_frame, end_frame).
+        """
+
+        frame_indexes = np.arange(start_frame, end_frame)
+        # Share of the reduction for every frame, 0 - original volume, 1 - reduced by reduction_dB
+        ducking = np.zeros(end_frame - start_frame, dtype=np.float32)
+
+        first_segment = np.searchsorted(self.segments_starts, start_frame - self.max_reach_frames)
+        last_segment = np.searchsorted(self.segments_starts, end_frame + self.attack_frames)
+        for segment_start, segment_end in zip(self.segments_starts[first_segment:last_segment],
+                                              self.segments_ends[first_segment:last_segment]):
+            ramp_start = max(segment_start - self.attack_frames, start_frame)
+            ramp_end = min(segment_end + self.release_frames, end_frame)
+            if ramp_start >= ramp_end:
+                continue
+
+            ramp_frame_indexes = frame_indexes[ramp_start - start_frame:ramp_end - start_frame]
+            segment_ducking = np.minimum(
+                (ramp_frame_indexes - (segment_start - self.attack_frames)) / self.attack_frames,
+                (segment_end + self.release_frames - ramp_frame_indexes) / self.release_frames
+            )
+            np.clip(segment_ducking, 0, 1, out=segment_ducking)
+            envelope_part = ducking[ramp_start - start_frame:ramp_end - start_frame]
+            np.maximum(envelope_part, segment_ducking, out=envelope_part)
+
+        return np.power(db_to_float(-self.reduction_dB), ducking, dtype=np.float32)
+
+    def apply(self, samples: np.ndarray, start_frame: int) -> np.ndarray:
+        """
+        Return samples (frames x channels) which start at start_frame of the timeline with the envelope applied.
+        """
+
+        gain = self.get_gain(start_frame, start_frame + len(samples))
+        # Gain is not above 1, so rounded samples stay in the range of the sample type
+        return np.rint(samples * gain[:, np.newaxis]).astype(samples.dtype)
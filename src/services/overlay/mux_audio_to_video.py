@@ -0,0 +1,109 @@
+import subprocess
+import tempfile
+from typing import Callable, Iterable, List
+
+from pydub import AudioSegment
+
+from configs.logger import print_info_log
+from constants.codecs import MP4_CODEC, VIDEO_CONTAINERS_AUDIO_CODECS, TRANSLATED_AUDIO_BITRATE
+from constants.log_tags import LogTag
+from utils.files import get_file_extension
+
+
+def create_mux_command(
+    video_path: str,
+    frame_rate: int,
+    channels: int,
+    output_path: str,
+    copy_video: bool
+) -> List[str]:
+    container = get_file_extension(output_path)
+    command = [
+        # The same ffmpeg binary which pydub uses to decode audio
+        AudioSegment.converter, "-y", "-loglevel", "error",
+        "-i", video_path,
+        # Raw samples come from stdin, so the mixed audio is encoded only once, here
+        "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "-i", "pipe:0",
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy" if copy_video else MP4_CODEC,
+        "-c:a", VIDEO_CONTAINERS_AUDIO_CODECS.get(container, "aac"), "-b:a", TRANSLATED_AUDIO_BITRATE,
+    ]
+    if container == "mp4":
+        # Index at the start of the file, so the video starts playing before it's fully downloaded
+        command += ["-movflags", "+faststart"]
+    return command + [output_path]
+
+
+def run_mux_command(command: List[str], audio_blocks: Iterable[bytes]) -> str | None:
+    """
+    Run ffmpeg and write audio blocks to its stdin as they are rendered, ffmpeg encodes them as they come.
+
+    :return: ffmpeg errors, None if it succeeded.
+    """
+
+    # Errors go to a file, a full stderr pipe would block ffmpeg while blocks are written to stdin
+    with tempfile.TemporaryFile() as stderr_file:
+        muxer = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=stderr_file)
+        try:
+            for block_data in audio_blocks:
+                muxer.stdin.write(block_data)
+        except BrokenPipeError:
+            # ffmpeg exited early, its errors explain why
+            pass
+        finally:
+            try:
+                muxer.stdin.close()
+            except BrokenPipeError:
+                pass
+            return_code = muxer.wait()
+
+        if return_code == 0:
+            return None
+        stderr_file.seek(0)
+        return f"ffmpeg error ({return_code}): {stderr_file.read().decode(errors='replace').strip()}"
+
+
+def mux_audio_to_video(
+    video_path: str,
+    render_audio_blocks: Callable[[], Iterable[bytes]],
+    frame_rate: int,
+    channels: int,
+    output_path: str,
+    show_logs: bool = False
+):
+    """
+    Replace the audio track of the video with the audio, the video stream is copied without re-encoding.
+
+    The audio is streamed to ffmpeg by blocks, so the whole track is never in memory. The video is re-encoded
+    only if ffmpeg can't copy its stream into the output container, the audio is rendered again then.
+
+    :param video_path: Path to the original video.
+    :param render_audio_blocks: Returns 16-bit samples of the new audio track by blocks, it's called for every try.
+    :param frame_rate: Frame rate of the new audio track.
+    :param channels: Channels count of the new audio track.
+    :param output_path: Path to the output video, its extension sets the container.
+    :param show_logs: Determines whether to display logs while muxing.
+    """
+
+    mux_error = run_mux_command(
+        create_mux_command(video_path, frame_rate, channels, output_path, copy_video=True),
+        render_audio_blocks()
+    )
+    if mux_error is None:
+        if show_logs:
+            print_info_log(
+                tag=LogTag.MUX_AUDIO_TO_VIDEO,
+                message=f"Audio muxed to {output_path}, video stream copied."
+            )
+        return
+
+    print_info_log(
+        tag=LogTag.MUX_AUDIO_TO_VIDEO,
+        message=f"Video stream can't be copied, re-encoding with {MP4_CODEC}: {mux_error}"
+    )
+    encode_error = run_mux_command(
+        create_mux_command(video_path, frame_rate, channels, output_path, copy_video=False),
+        render_audio_blocks()
+    )
+    if encode_error is not None:
+        raise Exception(encode_error)
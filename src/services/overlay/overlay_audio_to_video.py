@@ -1,28 +1,33 @@
 import os
-import tempfile
 from typing import List
 
-from audiostretchy.stretch import stretch_audio
-from moviepy.editor import VideoFileClip, AudioFileClip
 from pydub import AudioSegment
 
+from configs.env import ARTIFACT_TMPFS_DIR_PATH
 from configs.logger import catch_error, print_info_log
-from constants.codecs import MP4_CODEC
-from constants.files import VIDEO_SUPPORTED_EXTENSIONS, AUDIO_SUPPORTED_EXTENSIONS, PROCESSING_FILES_DIR_PATH
+from constants.files import VIDEO_SUPPORTED_EXTENSIONS, PROCESSING_FILES_DIR_PATH
 from constants.log_tags import LogTag
 from models.text_segment import TextSegmentWithAudioTimestamp
-from services.overlay.lower_volume_in_segments import lower_volume_in_segments
+from services.overlay.mux_audio_to_video import mux_audio_to_video
+from services.overlay.render_audio_shards import render_blocks_in_shards
+from services.overlay.render_audio_timeline import AudioTimelineRenderer
+from services.overlay.segments_stretcher import SegmentsStretcher
+from utils.artifact_store import Artifact, ArtifactBudget, ArtifactStore
 from utils.files import get_file_extension, get_file_name
+from utils.pcm_file import PCMFile
 
 
 def overlay_audio_to_video(
     video_path: str,
-    audio_path: str,
+    source_audio: PCMFile,
+    translated_audio: AudioSegment,
     text_segments_with_audio_timestamp: List[TextSegmentWithAudioTimestamp],
+    artifact_store: ArtifactStore,
     project_id: str,
     silent_original_audio: bool = True,
+    segments_stretcher: SegmentsStretcher | None = None,
     show_logs: bool = False
-):
+) -> Artifact:
     try:
         if show_logs:
             print_info_log(
@@ -32,7 +37,6 @@ def overlay_audio_to_video(
 
         video_file_name = get_file_name(video_path)
         video_file_suffix = get_file_extension(video_path)
-        audio_file_suffix = get_file_extension(audio_path)
 
         # Check if paths exist
         if not os.path.exists(video_path):
@@ -41,12 +45,6 @@ def overlay_audio_to_video(
                 error=ValueError(f"Video path {video_path} does not exist."),
                 project_id=project_id
             )
-        if not os.path.exists(audio_path):
-            catch_error(
-                tag=LogTag.OVERLAY_AUDIO,
-                error=ValueError(f"Audio path {audio_path} does not exist."),
-                project_id=project_id
-            )
 
         # Check for supported file extensions
         if video_file_suffix not in VIDEO_SUPPORTED_EXTENSIONS:
@@ -57,20 +55,15 @@ def overlay_audio_to_video(
                 ),
                 project_id=project_id
             )
-        if audio_file_suffix not in AUDIO_SUPPORTED_EXTENSIONS:
-            catch_error(
-                tag=LogTag.OVERLAY_AUDIO,
-                error=ValueError(
-                    f"Invalid audio format: {audio_file_suffix}. Only {AUDIO_SUPPORTED_EXTENSIONS} are supported."
-                ),
-                project_id=project_id
-            )
 
-        translated_video_path = f"{PROCESSING_FILES_DIR_PATH}/{video_file_name}-translated.{video_file_suffix}"
+        # ffmpeg writes the video by path, it's about as big as the original one
+        translated_video_artifact = artifact_store.create(
+            name=f"{video_file_name}-translated.{video_file_suffix}",
+            expected_bytes=os.path.getsize(video_path),
+            needs_path=True
+        )
 
-        original_video = VideoFileClip(video_path)
-        original_video_duration = original_video.duration
-        translated_audio = AudioFileClip(audio_path)
+        original_video_duration = source_audio.duration
 
         if show_logs:
             print_info_log(
@@ -79,126 +72,70 @@ def overlay_audio_to_video(
             )
             print_info_log(
                 tag=LogTag.OVERLAY_AUDIO,
-                message=f"Input audio duration: {translated_audio.duration}s"
+                message=f"Input audio duration: {len(translated_audio) / 1000}s"
             )
 
-        final_audio = AudioSegment.from_file(video_path, format=video_file_suffix)
-
         # Remove original video sound
-        if silent_original_audio:
-            if show_logs:
-                print_info_log(
-                    tag=LogTag.OVERLAY_AUDIO,
-                    message=f"Remove original video sound."
-                )
-            final_audio = final_audio.silent(duration=original_video_duration * 1000)
-        else:
-            final_audio = lower_volume_in_segments(final_audio, text_segments_with_audio_timestamp, 15)
-
-        for segment in text_segments_with_audio_timestamp:
-            if show_logs:
-                print_info_log(
-                    tag=LogTag.OVERLAY_AUDIO,
-                    message=f"Processing segment {segment}"
-                )
-
-            video_start_time, video_end_time = segment.original_timestamp
-            video_duration = (video_end_time - video_start_time) * 1000
+        if silent_original_audio and show_logs:
+            print_info_log(
+                tag=LogTag.OVERLAY_AUDIO,
+                message=f"Remove original video sound."
+            )
 
-            audio_start_time, audio_end_time = segment.audio_timestamp
-            audio_segment = AudioSegment.from_file(audio_path)[audio_start_time:audio_end_time]
-            audio_duration = audio_end_time - audio_start_time
+        audio_timeline_renderer = AudioTimelineRenderer(
+            original_audio=source_audio,
+            translated_audio=translated_audio,
+            text_segments_with_audio_timestamp=text_segments_with_audio_timestamp,
+            silent_original_audio=silent_original_audio,
+            segments_stretcher=segments_stretcher
+        )
 
-            if show_logs:
-                print_info_log(
-                    tag=LogTag.OVERLAY_AUDIO,
-                    message=f"Video segment duration: {video_duration:.2f}ms | {video_duration / 1000:.2f}s"
-                )
+        if show_logs:
+            for segment in text_segments_with_audio_timestamp:
+                video_start_time, video_end_time = segment.original_timestamp
+                audio_start_time, audio_end_time = segment.audio_timestamp
                 print_info_log(
                     tag=LogTag.OVERLAY_AUDIO,
-                    message=f"Audio segment duration: {audio_duration:.2f}ms | {audio_duration / 1000:.2f}s"
-                )
-
-            # Speed up audio if it's need
-            if audio_duration - video_duration > 0.5:
-                # ratio = audio_duration / video_duration
-                ratio = video_duration / audio_duration
-                # Do not use "with", because temp file will not be deleted
-                temp_file = tempfile.NamedTemporaryFile(
-                    dir=f"{PROCESSING_FILES_DIR_PATH}/",
-                    suffix=".wav",
-                    delete=True
+                    message=f"Segment {segment}, video duration: {(video_end_time - video_start_time):.2f}s, "
+                            f"audio duration: {(audio_end_time - audio_start_time) / 1000:.2f}s"
                 )
-                stretched_audio_file_path = f"stretched-audio-segment-{project_id}.wav"
-                audio_segment.export(temp_file.name, format="wav")
-                stretch_audio(temp_file.name, stretched_audio_file_path, ratio)
-                audio_segment = AudioSegment.from_file(stretched_audio_file_path)
-                # Close and auto-delete temp file
-                temp_file.close()
-                # Delete stretched audio segment file
-                os.remove(stretched_audio_file_path)
-
-                if show_logs:
+                ratio = audio_timeline_renderer.get_stretch_ratio(segment)
+                if ratio is not None:
                     print_info_log(
                         tag=LogTag.OVERLAY_AUDIO,
                         message=f"Speeding up audio by a factor of: {ratio:.2f}"
                     )
 
-            final_audio = final_audio.overlay(audio_segment, position=video_start_time * 1000)
-            if show_logs:
-                print_info_log(
-                    tag=LogTag.OVERLAY_AUDIO,
-                    message=f"Overlaying audio at {video_start_time:.2f}s in video."
-                )
-
-        if show_logs:
-            print_info_log(
-                tag=LogTag.OVERLAY_AUDIO,
-                message=f"Processing all segments completed."
-            )
-
-        overlay_audio_name = f"overlay-audio-{project_id}.mp3"
-        final_audio.export(overlay_audio_name, format="mp3")
-        final_audio_clip = AudioFileClip(overlay_audio_name)
-
-        # Set the audio of the video to the new audio clip
-        final_video = original_video.set_audio(final_audio_clip)
+        # The output audio is rendered by shards in parallel while ffmpeg encodes it, the video stream
+        # is copied as is
+        mux_audio_to_video(
+            video_path=video_path,
+            render_audio_blocks=lambda: render_blocks_in_shards(audio_timeline_renderer, artifact_store),
+            frame_rate=audio_timeline_renderer.frame_rate,
+            channels=audio_timeline_renderer.channels,
+            output_path=translated_video_artifact.path,
+            show_logs=show_logs
+        )
 
         if show_logs:
             print_info_log(
                 tag=LogTag.OVERLAY_AUDIO,
-                message=f"Output video duration: {final_video.duration}"
+                message=f"Processing all segments completed, clipped samples: "
+                        f"{audio_timeline_renderer.clipped_samples_count}"
             )
+            output_audio_duration = audio_timeline_renderer.frames_count / audio_timeline_renderer.frame_rate
             print_info_log(
                 tag=LogTag.OVERLAY_AUDIO,
-                message=f"Output audio duration: {final_audio_clip.duration}"
+                message=f"Output audio duration: {output_audio_duration}s"
             )
 
-        final_video.write_videofile(
-            filename=translated_video_path,
-            codec=MP4_CODEC,
-            fps=original_video.fps,
-            logger=None
-        )
-
-        # TODO: use clean FFmpeg
-        # input_video = ffmpeg.input(video_path)
-        # input_audio = ffmpeg.input(audio_path)
-        # ffmpeg.concat(input_video, input_audio, v=1, a=1).output(str(translated_video_path)).run()  # Error here
-
-        # Close the clips to free up memory
-        final_video.close()
-        translated_audio.close()
-        # Remove audio overlay file
-        os.remove(overlay_audio_name)
-
         if show_logs:
             print_info_log(
                 tag=LogTag.OVERLAY_AUDIO,
-                message=f"Overlay video saved to {translated_video_path}"
+                message=f"Overlay video saved to {translated_video_artifact.path}"
             )
 
-        return translated_video_path
+        return translated_video_artifact
 
     except Exception as e:
         catch_error(
@@ -272,13 +209,22 @@ if __name__ == "__main__":
         TextSegmentWithAudioTimestamp(original_timestamp=(54.52, 56.84), text='Однако, если солнце немного ярче.',
                                       audio_timestamp=(136943.0, 139977.0))
     ]
+    from services.ingest.ingest_source_audio import ingest_source_audio
+
     test_project_id = "u4eep3w19GImXUqnbPWc"
     test_video_path = f"{PROCESSING_FILES_DIR_PATH}/{test_project_id}.mp4"
     test_audio_path = f"{PROCESSING_FILES_DIR_PATH}/{test_project_id}-translated.mp3"
+    # Artifacts are on disk, so the video stays after the test
+    test_artifact_store = ArtifactStore(
+        job_id=test_project_id,
+        budget=ArtifactBudget(memory_max_bytes=0, tmpfs_dir_path=ARTIFACT_TMPFS_DIR_PATH, tmpfs_max_bytes=0)
+    )
     overlay_audio_to_video(
         video_path=test_video_path,
-        audio_path=test_audio_path,
+        source_audio=ingest_source_audio(test_video_path, test_artifact_store, test_project_id),
+        translated_audio=AudioSegment.from_file(test_audio_path),
         text_segments_with_audio_timestamp=test_text_segments_with_audio_timestamps,
+        artifact_store=test_artifact_store,
         project_id=test_project_id,
         show_logs=True
     )
@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+
+from configs.env import RENDER_MAX_WORKERS
+from services.overlay.render_audio_timeline import AudioTimelineRenderer
+from utils.artifact_store import Artifact, ArtifactStore
+
+# Shorter shards cost more in artifacts and segments stretched at seams than they save
+MIN_SHARD_DURATION_SECONDS = 60
+
+# More shards than workers even out shards of different length, the first shard is streamed sooner too
+SHARDS_PER_WORKER = 2
+
+
+def get_shards_boundaries(renderer: AudioTimelineRenderer, shards_count: int) -> List[Tuple[int, int]]:
+    """
+    Split the timeline into shards of about the same length, at frames which no segment covers.
+
+    A seam between segments doesn't cut any translated audio, so every segment is stretched by one shard
+    only. If there is no such frame near the even split, the seam is at the nearest boundary of segments.
+    Samples at a seam are the same as in one pass anyway, since every frame of the timeline is rendered
+    from the same sources wherever the range starts.
+
+    :param renderer: The renderer of the timeline.
+    :param shards_count: The wanted number of shards.
+
+    :return: (start_frame, end_frame) of every shard, in the order of the timeline.
+    """
+
+    # Ranges of the timeline which translated segments cover, merged where they overlap
+    covered_ranges = []
+    for segment_index in renderer.segments_order:
+        segment_start = renderer.segments_start_frames[segment_index]
+        segment_end = renderer.segments_max_end_frames[segment_index]
+        if covered_ranges and segment_start <= covered_ranges[-1][1]:
+            covered_ranges[-1][1] = max(covered_ranges[-1][1], segment_end)
+        else:
+            covered_ranges.append([segment_start, segment_end])
+
+    seams = []
+    for shard_index in range(1, shards_count):
+        seam = renderer.frames_count * shard_index // shards_count
+        for range_start, range_end in covered_ranges:
+            if range_start < seam < range_end:
+                seam = range_start if seam - range_start <= range_end - seam else range_end
+                break
+        if 0 < seam < renderer.frames_count and (not seams or seam > seams[-1]):
+            seams.append(seam)
+
+    frames_boundaries = [0] + seams + [renderer.frames_count]
+    return list(zip(frames_boundaries[:-1], frames_boundaries[1:]))
+
+
+def render_shard_to_artifact(
+    renderer: AudioTimelineRenderer,
+    artifact_store: ArtifactStore,
+    shard_index: int,
+    start_frame: int,
+    end_frame: int,
+    block_frames: int
+) -> Artifact:
+    shard_artifact = artifact_store.create(
+        name=f"render-shard-{shard_index}.pcm",
+        expected_bytes=(end_frame - start_frame) * renderer.channels * 2
+    )
+    try:
+        with shard_artifact.open_writer() as shard_file:
+            # Shards are rendered in parallel already, so segments of a shard are stretched one by one
+            for block_data in renderer.render_blocks(start_frame, end_frame, block_frames, stretch_max_workers=1):
+                shard_file.write(block_data)
+    except Exception:
+        artifact_store.remove(shard_artifact.name)
+        raise
+    return shard_artifact
+
+
+def render_blocks_in_shards(
+    renderer: AudioTimelineRenderer,
+    artifact_store: ArtifactStore,
+    max_workers: int = RENDER_MAX_WORKERS
+) -> Iterator[bytes]:
+    """
+    Render the timeline by shards in parallel and return its blocks in order.
+
+    Shards are rendered to artifacts by workers, every shard is returned as soon as it and all shards before
+    it are rendered. Raw samples of shards are joined, so the audio is encoded once by the caller and seams
+    have no encoder padding. Workers split the block memory of the renderer, so rendering takes as much
+    memory as one pass.
+
+    :param renderer: The renderer of the timeline.
+    :param artifact_store: Artifacts of the job, rendered shards are kept there until they are returned.
+    :param max_workers: How many shards are rendered at a time.
+
+    :return: 16-bit samples of the timeline by blocks.
+    """
+
+    min_shard_frames = MIN_SHARD_DURATION_SECONDS * renderer.frame_rate
+    shards_count = min(max_workers * SHARDS_PER_WORKER, renderer.frames_count // min_shard_frames)
+    if max_workers <= 1 or shards_count <= 1:
+        yield from renderer.render_blocks()
+        return
+
+    block_bytes_count = renderer.block_frames * renderer.channels * 2
+    shard_block_frames = max(renderer.block_frames // max_workers, 1)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render-shard")
+    shards_futures = [
+        executor.submit(
+            render_shard_to_artifact, renderer, artifact_store, shard_index, start_frame, end_frame, shard_block_frames
+        )
+        for shard_index, (start_frame, end_frame) in enumerate(get_shards_boundaries(renderer, shards_count))
+    ]
+    try:
+        for shard_future in shards_futures:
+            shard_artifact = shard_future.result()
+            with shard_artifact.open_reader() as shard_file:
+                while block_data := shard_file.read(block_bytes_count):
+                    yield block_data
+            artifact_store.remove(shard_artifact.name)
+    finally:
+        # Shards aren't needed if the consumer stopped or a shard failed
+        executor.shutdown(wait=True, cancel_futures=True)
+        for shard_future in shards_futures:
+            if shard_future.done() and not shard_future.cancelled() and shard_future.exception() is None:
+                artifact_store.remove(shard_future.result().name)
+
+
+# Benchmark on a synthetic 1-hour timeline with segments every 4 seconds, the original noise is ducked
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    import numpy as np
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+
+    from models.text_segment import TextSegmentWithAudioTimestamp
+    from utils.pcm_file import write_audio_to_pcm_file
+
+    test_duration_seconds = 60 * 60
+    test_translated_audio = AudioSegment.empty()
+    test_segments = []
+    for start_seconds in range(0, test_duration_seconds, 4):
+        segment_audio = Sine(200 + start_seconds % 300).to_audio_segment(duration=3800, volume=-3)
+        test_segments.append(TextSegmentWithAudioTimestamp(
+            original_timestamp=(start_seconds + 0.5, start_seconds + 3.5),
+            text="",
+            audio_timestamp=(len(test_translated_audio), len(test_translated_audio) + 3800)
+        ))
+        test_translated_audio += segment_audio.set_frame_rate(24000)
+
+    test_artifact_store = ArtifactStore(job_id="render-benchmark", disk_dir_path=tempfile.gettempdir())
+    test_original_samples = np.random.default_rng(0).integers(-3000, 3000, test_duration_seconds * 24000 * 2)
+    test_original_audio = write_audio_to_pcm_file(
+        AudioSegment(data=test_original_samples.astype(np.int16).tobytes(), sample_width=2, frame_rate=24000,
+                     channels=2),
+        pcm_file_path=test_artifact_store.create("original.pcm", needs_path=True).path
+    )
+    del test_original_samples
+
+    def create_test_renderer() -> AudioTimelineRenderer:
+        return AudioTimelineRenderer(
+            original_audio=test_original_audio,
+            translated_audio=test_translated_audio,
+            text_segments_with_audio_timestamp=test_segments,
+            silent_original_audio=False
+        )
+
+    start_time = time.perf_counter()
+    one_pass_audio_data = b"".join(create_test_renderer().render_blocks())
+    one_pass_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    shards_audio_data = b"".join(render_blocks_in_shards(create_test_renderer(), test_artifact_store))
+    shards_seconds = time.perf_counter() - start_time
+
+    test_original_audio.close()
+    test_artifact_store.close()
+    print(f"{test_duration_seconds // 60} min timeline, {len(test_segments)} segments: one pass "
+          f"{one_pass_seconds:.2f}s, {RENDER_MAX_WORKERS} workers {shards_seconds:.2f}s, "
+          f"speedup x{one_pass_seconds / shards_seconds:.1f}, "
+          f"identical output: {one_pass_audio_data == shards_audio_data}")
@@ -0,0 +1,245 @@
+import threading
+from typing import Dict, Iterator, List
+
+import numpy as np
+from pydub import AudioSegment
+
+from configs.env import RENDER_BLOCK_MEMORY_BYTES, TIME_STRETCH_MAX_WORKERS
+from models.text_segment import TextSegmentWithAudioTimestamp
+from services.overlay.lower_volume_in_segments import DuckingEnvelope
+from services.overlay.segments_stretcher import SegmentsStretcher
+from services.overlay.time_stretch import get_stretch_ratio, stretch_audio_segments
+from utils.audio_mixer import add_samples_with_clipping
+from utils.pcm_file import PCMFile
+
+# Volume reduction of the original audio under the translated speech
+ORIGINAL_AUDIO_REDUCTION_DB = 15
+
+# Bytes of block buffers per sample: decoded samples, float samples of ducking, sums of mixing and output
+RENDER_BYTES_PER_SAMPLE = 32
+
+
+class AudioTimelineRenderer:
+    """
+    Renderer of the output audio of a video by blocks of the timeline.
+
+    Every block is read from the memory-mapped original audio, ducked and mixed with the translated segments which
+    overlap it, so memory is bounded by the block size regardless of the duration of the video. Segments
+    are cut from the translated audio and stretched only when the first block which needs them is rendered,
+    and released after the last one. Segments which were stretched while synthesis was running are taken
+    from the segments stretcher.
+    """
+
+    def __init__(
+        self,
+        original_audio: PCMFile,
+        translated_audio: AudioSegment,
+        text_segments_with_audio_timestamp: List[TextSegmentWithAudioTimestamp],
+        silent_original_audio: bool = True,
+        block_memory_bytes: int = RENDER_BLOCK_MEMORY_BYTES,
+        segments_stretcher: SegmentsStretcher | None = None
+    ):
+        self.original_audio = original_audio
+        self.translated_audio = translated_audio
+        self.text_segments = text_segments_with_audio_timestamp
+        self.silent_original_audio = silent_original_audio
+        self.segments_stretcher = segments_stretcher
+
+        # The original audio is decoded in the format of mixing, translated segments are converted to it,
+        # a silent original audio doesn't add its format
+        if silent_original_audio:
+            self.frame_rate = translated_audio.frame_rate
+            self.channels = translated_audio.channels
+            self.frames_count = int(round(original_audio.duration * self.frame_rate))
+        else:
+            self.frame_rate = original_audio.frame_rate
+            self.channels = original_audio.channels
+            self.frames_count = original_audio.frames_count
+        self.block_frames = max(block_memory_bytes // (RENDER_BYTES_PER_SAMPLE * self.channels), 1)
+
+        self.ducking_envelope = None
+        if not silent_original_audio and text_segments_with_audio_timestamp:
+            self.ducking_envelope = DuckingEnvelope(
+                segments=text_segments_with_audio_timestamp,
+                frame_rate=self.frame_rate,
+                reduction_dB=ORIGINAL_AUDIO_REDUCTION_DB
+            )
+
+        # Segments are stretched only to shorten them, so their frames never reach past the unstretched audio
+        self.segments_start_frames = [
+            int(segment.original_timestamp[0] * 1000 * self.frame_rate / 1000.0) for segment in self.text_segments
+        ]
+        self.segments_max_end_frames = [
+            start_frame + int((segment.audio_timestamp[1] - segment.audio_timestamp[0]) * self.frame_rate / 1000.0) + 1
+            for start_frame, segment in zip(self.segments_start_frames, self.text_segments)
+        ]
+        self.segments_order = sorted(
+            range(len(self.text_segments)),
+            key=lambda index: self.segments_start_frames[index]
+        )
+
+        # Ranges of the timeline may be rendered by several threads at a time
+        self.lock = threading.Lock()
+        self.clipped_samples_count = 0
+
+    def get_stretch_ratio(self, segment: TextSegmentWithAudioTimestamp) -> float | None:
+        return get_stretch_ratio(
+            video_duration_ms=(segment.original_timestamp[1] - segment.original_timestamp[0]) * 1000,
+            audio_duration_ms=segment.audio_timestamp[1] - segment.audio_timestamp[0]
+        )
+
+    def prepare_segments(
+        self,
+        segments_indexes: List[int],
+        stretch_max_workers: int = TIME_STRETCH_MAX_WORKERS
+    ) -> Dict[int, np.ndarray]:
+        """
+        Cut segments from the translated audio, stretch overlong ones in parallel and convert them to the
+        format of the timeline.
+
+        :param segments_indexes: Indexes of the segments to prepare.
+        :param stretch_max_workers: How many segments are stretched at a time.
+
+        :return: Samples of every segment by its index, shaped (frames, channels).
+        """
+
+        segments_audios = {}
+        segments_to_stretch = []
+        for segment_index in segments_indexes:
+            segment = self.text_segments[segment_index]
+            ratio = self.get_stretch_ratio(segment)
+            if ratio is not None and self.segments_stretcher is not None:
+                stretched_audio = self.segments_stretcher.pop(segment_index, ratio)
+                if stretched_audio is not None:
+                    segments_audios[segment_index] = stretched_audio
+                    continue
+
+            audio_start_time, audio_end_time = segment.audio_timestamp
+            segments_audios[segment_index] = self.translated_audio[audio_start_time:audio_end_time]
+            if ratio is not None:
+                segments_to_stretch.append((segment_index, ratio))
+
+        stretched_audios = stretch_audio_segments(
+            audios_with_ratios=[(segments_audios[index], ratio) for index, ratio in segments_to_stretch],
+            max_workers=stretch_max_workers
+        )
+        for (segment_index, _), stretched_audio in zip(segments_to_stretch, stretched_audios):
+            segments_audios[segment_index] = stretched_audio
+
+        return {
+            segment_index: np.frombuffer(
+                audio.set_channels(self.channels).set_frame_rate(self.frame_rate).set_sample_width(2).raw_data,
+                dtype=np.int16
+            ).reshape(-1, self.channels)
+            for segment_index, audio in segments_audios.items()
+        }
+
+    def get_original_block(self, start_frame: int, end_frame: int) -> np.ndarray:
+        if self.silent_original_audio:
+            return np.zeros((end_frame - start_frame, self.channels), dtype=np.int16)
+
+        original_samples = self.original_audio.get_samples(start_frame, end_frame)
+        if self.ducking_envelope is not None:
+            return self.ducking_envelope.apply(original_samples, start_frame=start_frame)
+        # Segments are mixed in place, the mapped file is read-only
+        return original_samples.copy()
+
+    def render_blocks(
+        self,
+        start_frame: int = 0,
+        end_frame: int | None = None,
+        block_frames: int | None = None,
+        stretch_max_workers: int = TIME_STRETCH_MAX_WORKERS
+    ) -> Iterator[bytes]:
+        """
+        Render a range of the timeline by blocks.
+
+        :param start_frame: The first frame of the range.
+        :param end_frame: The frame after the range, the end of the timeline by default.
+        :param block_frames: Frames of a block, the size from the memory of the renderer by default.
+        :param stretch_max_workers: How many segments are stretched at a time.
+
+        :return: 16-bit samples of every block in the format of the timeline.
+        """
+
+        end_frame = self.frames_count if end_frame is None else min(end_frame, self.frames_count)
+        block_frames = block_frames or self.block_frames
+        next_segment_order_index = 0
+        active_segments_samples: Dict[int, np.ndarray] = {}
+
+        for block_start in range(start_frame, end_frame, block_frames):
+            block_end = min(block_start + block_frames, end_frame)
+            block_samples = self.get_original_block(block_start, block_end)
+
+            # Segments which start in this block are prepared, segments which ended before it are released
+            new_segments_indexes = []
+            while (
+                next_segment_order_index < len(self.segments_order)
+                and self.segments_start_frames[self.segments_order[next_segment_order_index]] < block_end
+            ):
+                segment_index = self.segments_order[next_segment_order_index]
+                if self.segments_max_end_frames[segment_index] > block_start:
+                    new_segments_indexes.append(segment_index)
+                next_segment_order_index += 1
+            active_segments_samples.update(self.prepare_segments(new_segments_indexes, stretch_max_workers))
+
+            # Segments are mixed in their order in the list, so clipping is the same as of the whole track
+            for segment_index in sorted(active_segments_samples):
+                segment_samples = active_segments_samples[segment_index]
+                segment_start = self.segments_start_frames[segment_index]
+                segment_end = segment_start + len(segment_samples)
+                if segment_end <= block_start:
+                    del active_segments_samples[segment_index]
+                    continue
+
+                mix_start, mix_end = max(segment_start, block_start), min(segment_end, block_end)
+                if mix_start >= mix_end:
+                    continue
+                clipped_samples_count = add_samples_with_clipping(
+                    track_samples=block_samples[mix_start - block_start:mix_end - block_start],
+                    segment_samples=segment_samples[mix_start - segment_start:mix_end - segment_start]
+                )
+                with self.lock:
+                    self.clipped_samples_count += clipped_samples_count
+
+            yield block_samples.tobytes()
+
+
+# Memory benchmark on a synthetic 3-hour timeline with segments every 4 seconds, the original is silent
+if __name__ == "__main__":
+    import resource
+    import tempfile
+    import time
+
+    from pydub.generators import Sine
+
+    from utils.pcm_file import PCM_FILE_HEADER_SIZE, write_pcm_file_header
+
+    test_duration_seconds = 3 * 60 * 60
+    test_segment_audio = Sine(220).to_audio_segment(duration=3800, volume=-6).set_frame_rate(24000)
+    test_segments = [
+        TextSegmentWithAudioTimestamp(
+            original_timestamp=(start_seconds + 0.5, start_seconds + 3.5),
+            text="",
+            audio_timestamp=(0, 3800)
+        )
+        for start_seconds in range(0, test_duration_seconds, 4)
+    ]
+    with tempfile.NamedTemporaryFile(suffix=".pcm") as test_original_file:
+        # Sparse file of silence, so the original audio takes neither memory nor disk
+        write_pcm_file_header(test_original_file, 48000, 2, frames_count=test_duration_seconds * 48000)
+        test_original_file.truncate(PCM_FILE_HEADER_SIZE + test_duration_seconds * 48000 * 2 * 2)
+        test_original_file.flush()
+        test_renderer = AudioTimelineRenderer(
+            original_audio=PCMFile(test_original_file.name),
+            translated_audio=test_segment_audio,
+            text_segments_with_audio_timestamp=test_segments
+        )
+
+        start_time = time.perf_counter()
+        rendered_bytes_count = sum(len(block_data) for block_data in test_renderer.render_blocks())
+        render_seconds = time.perf_counter() - start_time
+
+    print(f"{test_duration_seconds // 3600}h timeline, {len(test_segments)} segments: {render_seconds:.2f}s, "
+          f"rendered {rendered_bytes_count / 1024 ** 3:.2f}GB, "
+          f"peak memory {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
@@ -0,0 +1,77 @@
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from pydub import AudioSegment
+
+from configs.env import TIME_STRETCH_PRESET, TIME_STRETCH_MAX_WORKERS
+from models.stretch_preset import StretchPreset
+from services.overlay.time_stretch import stretch_audio_segment
+
+# Timestamps of the joined track are rounded to frames, so the ratio of a segment may differ a little
+# from the one it was stretched with while synthesis was running
+STRETCH_RATIO_RELATIVE_TOLERANCE = 1e-3
+
+
+class SegmentsStretcher:
+    """
+    Stretcher of overlong translated segments which works while the rest of the text is still synthesized.
+
+    Text to speech gives every segment to it as soon as the audio of the segment is received, and the renderer
+    of the timeline takes the stretched audio instead of stretching the segment itself. A segment is taken only
+    if it's stretched with the same ratio, otherwise (e.g. segments were found in the track again by silence)
+    the renderer stretches it as usual.
+    """
+
+    def __init__(
+        self,
+        preset: StretchPreset = StretchPreset(TIME_STRETCH_PRESET),
+        max_workers: int = TIME_STRETCH_MAX_WORKERS
+    ):
+        self.preset = preset
+        self.executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="segments-stretcher")
+        self.lock = threading.Lock()
+        self.stretched_segments: Dict[int, Tuple[float, Future]] = {}
+
+    def submit(self, segment_index: int, audio: AudioSegment, ratio: float):
+        """
+        Start stretching the audio of the segment in the background.
+
+        :param segment_index: Index of the segment in the list of segments.
+        :param audio: Synthesized audio of the segment.
+        :param ratio: The duration of the result to the duration of the audio.
+        """
+
+        stretch_future = self.executor.submit(stretch_audio_segment, audio, ratio, self.preset)
+        with self.lock:
+            self.stretched_segments[segment_index] = (ratio, stretch_future)
+
+    def pop(self, segment_index: int, ratio: float) -> AudioSegment | None:
+        """
+        Take the stretched audio of the segment, waiting for it if it's still stretched.
+
+        :return: The stretched audio, None if the segment wasn't given or was stretched with another ratio.
+        """
+
+        with self.lock:
+            stretched_segment = self.stretched_segments.pop(segment_index, None)
+        if stretched_segment is None:
+            return None
+
+        stretched_ratio, stretch_future = stretched_segment
+        if not math.isclose(stretched_ratio, ratio, rel_tol=STRETCH_RATIO_RELATIVE_TOLERANCE):
+            stretch_future.cancel()
+            return None
+        return stretch_future.result()
+
+    def clear(self):
+        with self.lock:
+            stretched_segments = list(self.stretched_segments.values())
+            self.stretched_segments.clear()
+        for _, stretch_future in stretched_segments:
+            stretch_future.cancel()
+
+    def close(self):
+        self.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
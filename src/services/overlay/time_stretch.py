@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+from audiostretchy.interface.tdhs import TDHSAudioStretch
+from pydub import AudioSegment
+
+from configs.env import TIME_STRETCH_PRESET, TIME_STRETCH_MAX_WORKERS
+from models.stretch_preset import StretchPreset
+
+# Period range of voice pitch in Hz, a wider range finds better periods of low voices but is slower
+STRETCH_PRESETS_PARAMETERS = {
+    StretchPreset.FAST: {"upper_freq": 333, "lower_freq": 55, "fast_detection": True},
+    StretchPreset.BALANCED: {"upper_freq": 333, "lower_freq": 55, "fast_detection": False},
+    StretchPreset.QUALITY: {"upper_freq": 400, "lower_freq": 40, "fast_detection": False},
+}
+
+# The stretcher needs the dual range mode outside of these ratios
+MIN_SINGLE_RANGE_RATIO = 0.5
+MAX_SINGLE_RANGE_RATIO = 2.0
+
+
+def get_stretch_ratio(video_duration_ms: float, audio_duration_ms: float) -> float | None:
+    """
+    Return the ratio which fits the audio of a segment into its time in the video, None if the audio fits as is.
+    """
+
+    # Speed up audio if it's need
+    if audio_duration_ms - video_duration_ms > 0.5:
+        return video_duration_ms / audio_duration_ms
+    return None
+
+
+def stretch_audio_segment(
+    audio: AudioSegment,
+    ratio: float,
+    preset: StretchPreset = StretchPreset(TIME_STRETCH_PRESET)
+) -> AudioSegment:
+    """
+    Change the duration of the audio without changing its pitch, in memory.
+
+    The same TDHS stretcher as audiostretchy.stretch_audio is used, without temp files. The result is cut
+    to the produced samples, while stretch_audio pads it with silence to the size of its output buffer.
+
+    :param audio: The audio to stretch, it's converted to 16-bit samples which the stretcher supports.
+    :param ratio: The duration of the result to the duration of the audio, less than 1 speeds up the audio.
+    :param preset: Quality and speed of period detection.
+
+    :return: The stretched audio.
+    """
+
+    audio = audio.set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=np.int16)
+    frames_count = len(samples) // audio.channels
+    if frames_count == 0:
+        return audio
+
+    preset_parameters = STRETCH_PRESETS_PARAMETERS[preset]
+    flags = 0
+    if ratio < MIN_SINGLE_RANGE_RATIO or ratio > MAX_SINGLE_RANGE_RATIO:
+        flags |= TDHSAudioStretch.STRETCH_DUAL_FLAG
+    if preset_parameters["fast_detection"]:
+        flags |= TDHSAudioStretch.STRETCH_FAST_FLAG
+
+    stretcher = TDHSAudioStretch(
+        audio.frame_rate // preset_parameters["upper_freq"],
+        audio.frame_rate // preset_parameters["lower_freq"],
+        audio.channels,
+        flags
+    )
+    try:
+        # Counts of the stretcher are in frames, buffers are interleaved samples of all channels
+        stretched_samples = np.zeros(stretcher.output_capacity(frames_count, ratio) * audio.channels, dtype=np.int16)
+        stretched_frames_count = stretcher.process_samples(samples, frames_count, stretched_samples, ratio)
+        stretched_frames_count += stretcher.flush(stretched_samples[stretched_frames_count * audio.channels:])
+    finally:
+        stretcher.deinit()
+
+    return audio._spawn(stretched_samples[:stretched_frames_count * audio.channels].tobytes())
+
+
+def stretch_audio_segments(
+    audios_with_ratios: List[Tuple[AudioSegment, float]],
+    preset: StretchPreset = StretchPreset(TIME_STRETCH_PRESET),
+    max_workers: int = TIME_STRETCH_MAX_WORKERS
+) -> List[AudioSegment]:
+    """
+    Stretch audios in parallel, the stretcher is a C library which releases GIL, so threads use all cores.
+
+    :param audios_with_ratios: (audio, ratio) of every audio to stretch.
+    :param preset: Quality and speed of period detection.
+    :param max_workers: How many audios are stretched at a time.
+
+    :return: Stretched audios in the order of audios_with_ratios.
+    """
+
+    if len(audios_with_ratios) <= 1 or max_workers <= 1:
+        return [stretch_audio_segment(audio, ratio, preset) for audio, ratio in audios_with_ratios]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda audio_with_ratio: stretch_audio_segment(*audio_with_ratio, preset),
+            audios_with_ratios
+        ))
+
+
+# Benchmark against the file-based path on synthetic speech-like segments
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from audiostretchy.stretch import stretch_audio
+    from pydub.generators import Sine
+
+    test_segment_audio = (
+        Sine(180).to_audio_segment(duration=2500, volume=-6)
+        + Sine(260).to_audio_segment(duration=2000, volume=-6)
+    ).set_frame_rate(24000).set_channels(1).set_sample_width(2)
+    test_audios_with_ratios = [(test_segment_audio, 0.7 + (i % 5) * 0.05) for i in range(200)]
+
+    start_time = time.perf_counter()
+    file_stretched_audios = []
+    with tempfile.TemporaryDirectory() as temp_dir_path:
+        for test_index, (test_audio, test_ratio) in enumerate(test_audios_with_ratios):
+            input_file_path = f"{temp_dir_path}/{test_index}.wav"
+            output_file_path = f"{temp_dir_path}/{test_index}-stretched.wav"
+            test_audio.export(input_file_path, format="wav")
+            stretch_audio(input_file_path, output_file_path, test_ratio)
+            file_stretched_audios.append(AudioSegment.from_file(output_file_path))
+    file_seconds = time.perf_counter() - start_time
+
+    print(f"{len(test_audios_with_ratios)} segments of {len(test_segment_audio)}ms, "
+          f"file-based path: {file_seconds:.2f}s")
+    for test_preset in StretchPreset:
+        start_time = time.perf_counter()
+        stretched_audios = stretch_audio_segments(test_audios_with_ratios, preset=test_preset)
+        preset_seconds = time.perf_counter() - start_time
+        durations_errors_ms = [
+            abs(len(stretched_audio) - len(test_audio) * test_ratio)
+            for stretched_audio, (test_audio, test_ratio) in zip(stretched_audios, test_audios_with_ratios)
+        ]
+        print(f"{test_preset.value}: {preset_seconds:.2f}s with {TIME_STRETCH_MAX_WORKERS} workers, "
+              f"speedup x{file_seconds / preset_seconds:.1f}, max duration error {max(durations_errors_ms):.0f}ms")
+
+    # The balanced preset is the file-based path at 24 kHz without the silence padding
+    balanced_audios = stretch_audio_segments(test_audios_with_ratios, preset=StretchPreset.BALANCED)
+    identical_samples = all(
+        file_audio.raw_data.startswith(balanced_audio.raw_data)
+        and not file_audio.raw_data[len(balanced_audio.raw_data):].strip(b"\0")
+        for file_audio, balanced_audio in zip(file_stretched_audios, balanced_audios)
+    )
+    padding_ms = sum(
+        len(file_audio) - len(balanced_audio)
+        for file_audio, balanced_audio in zip(file_stretched_audios, balanced_audios)
+    ) / len(balanced_audios)
+    print(f"Balanced preset matches the file-based path: {identical_samples}, "
+          f"file-based path adds {padding_ms:.0f}ms of silence per segment on average")
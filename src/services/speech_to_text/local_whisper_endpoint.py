@@ -0,0 +1,120 @@
+import base64
+import io
+import json
+import threading
+import time
+import wave
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import requests
+
+from models.audio_chunk import AudioChunk
+from services.speech_to_text.pack_audio_chunks import get_base64_size, pack_audio_chunks_to_batches
+
+# Stand-in for Whisper endpoint to benchmark batch sizing offline.
+# Every request pays a fixed overhead (TLS, auth, model invocation) plus processing time for each second of audio.
+REQUEST_OVERHEAD_IN_SECONDS = 0.8
+PROCESSING_SECONDS_PER_AUDIO_SECOND = 0.01
+
+
+def transcribe_wav_stub(audio_data: bytes) -> dict:
+    """
+    Return a fake Whisper response for the wav file - one chunk which covers the whole audio.
+    """
+
+    with wave.open(io.BytesIO(audio_data), "rb") as wav_file:
+        duration = wav_file.getnframes() / wav_file.getframerate()
+
+    time.sleep(duration * PROCESSING_SECONDS_PER_AUDIO_SECOND)
+    return {
+        "text": " stub transcription",
+        "chunks": [{"timestamp": [0.0, duration], "text": " stub transcription"}]
+    }
+
+
+class LocalWhisperRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(REQUEST_OVERHEAD_IN_SECONDS)
+
+        # Batch request - {"inputs": ["<base64>", ...]}, otherwise the body is one audio file
+        if self.headers["Content-Type"] == "application/json":
+            audio_files = [base64.b64decode(payload) for payload in json.loads(body)["inputs"]]
+            response = [transcribe_wav_stub(audio_data) for audio_data in audio_files]
+        else:
+            response = transcribe_wav_stub(body)
+
+        response_body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_local_whisper_endpoint(port: int = 0) -> ThreadingHTTPServer:
+    """
+    Start the stand-in endpoint in a background thread, the endpoint url is http://127.0.0.1:{server.server_port}.
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), LocalWhisperRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_silent_wav(duration_ms: int, frame_rate: int = 16000) -> bytes:
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(frame_rate)
+        wav_file.writeframes(bytes(duration_ms * frame_rate // 1000 * 2))
+    return wav_buffer.getvalue()
+
+
+def benchmark_batch_sizes(endpoint_url: str, audio_chunks: List[AudioChunk], batch_durations_ms: List[int]):
+    for max_batch_duration_ms in batch_durations_ms:
+        # 16kHz mono wav is 32 bytes per ms, plus wav headers, sent in base64 - only the duration budget limits
+        # batches here
+        audio_batches = pack_audio_chunks_to_batches(
+            audio_chunks=audio_chunks,
+            max_batch_bytes=get_base64_size(max_batch_duration_ms * 32 + 1024 * len(audio_chunks)),
+            max_batch_duration_ms=max_batch_duration_ms
+        )
+
+        request_time = datetime.now()
+        for audio_batch in audio_batches:
+            if len(audio_batch) == 1:
+                requests.post(endpoint_url, headers={"Content-Type": "audio/wav"}, data=audio_batch[0].data)
+            else:
+                requests.post(endpoint_url, json={
+                    "inputs": [base64.b64encode(audio_chunk.data).decode("ascii") for audio_chunk in audio_batch]
+                })
+        time_difference = datetime.now() - request_time
+
+        print(
+            f"Batch duration {max_batch_duration_ms / 1000:.0f}s: "
+            f"{len(audio_batches)} requests, total time {time_difference}"
+        )
+
+
+if __name__ == "__main__":
+    test_server = start_local_whisper_endpoint()
+    test_endpoint_url = f"http://127.0.0.1:{test_server.server_port}"
+
+    # 20 minutes of audio split by 1 minute, like in speech_to_text
+    test_audio_chunks = [
+        AudioChunk(start_time_ms=i * 60_000, duration_ms=60_000, data=create_silent_wav(60_000))
+        for i in range(20)
+    ]
+    benchmark_batch_sizes(
+        endpoint_url=test_endpoint_url,
+        audio_chunks=test_audio_chunks,
+        batch_durations_ms=[60_000, 2 * 60_000, 5 * 60_000, 10 * 60_000]
+    )
+    test_server.shutdown()
@@ -0,0 +1,67 @@
+import math
+from typing import List
+
+from models.audio_chunk import AudioChunk
+
+
+def get_base64_size(bytes_count: int) -> int:
+    return 4 * math.ceil(bytes_count / 3)
+
+
+def pack_audio_chunks_to_batches(
+    audio_chunks: List[AudioChunk],
+    max_batch_bytes: int,
+    max_batch_duration_ms: int
+) -> List[List[AudioChunk]]:
+    """
+    Pack consecutive audio chunks into batches for Whisper endpoint.
+
+    A batch is closed when the next chunk would exceed the bytes or the duration budget.
+    A chunk which is bigger than the budget on its own gets a batch for itself. Chunks of a batch are sent
+    in base64, so the bytes budget is checked on their base64 size.
+
+    :param audio_chunks: The list of encoded audio chunks in timeline order.
+    :param max_batch_bytes: Maximum size of base64 payloads of one batch.
+    :param max_batch_duration_ms: Maximum duration of audio in one batch in milliseconds.
+
+    :return: The list of batches, chunks keep their original order.
+    """
+
+    batches: List[List[AudioChunk]] = []
+    current_batch: List[AudioChunk] = []
+    current_batch_bytes = 0
+    current_batch_duration_ms = 0
+
+    for audio_chunk in audio_chunks:
+        chunk_bytes = get_base64_size(len(audio_chunk.data))
+        exceeds_budget = (
+            current_batch_bytes + chunk_bytes > max_batch_bytes
+            or current_batch_duration_ms + audio_chunk.duration_ms > max_batch_duration_ms
+        )
+        if current_batch and exceeds_budget:
+            batches.append(current_batch)
+            current_batch = []
+            current_batch_bytes = 0
+            current_batch_duration_ms = 0
+
+        current_batch.append(audio_chunk)
+        current_batch_bytes += chunk_bytes
+        current_batch_duration_ms += audio_chunk.duration_ms
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+if __name__ == "__main__":
+    test_audio_chunks = [
+        AudioChunk(start_time_ms=i * 60_000, duration_ms=60_000, data=bytes(1_920_000))
+        for i in range(7)
+    ]
+    test_batches = pack_audio_chunks_to_batches(
+        audio_chunks=test_audio_chunks,
+        max_batch_bytes=8 * 1024 * 1024,
+        max_batch_duration_ms=5 * 60 * 1000
+    )
+    print([[chunk.start_time_ms for chunk in batch] for batch in test_batches])
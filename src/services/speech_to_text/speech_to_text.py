@@ -1,33 +1,32 @@
-import os
-import tempfile
-from pathlib import Path
+import io
 from typing import List, Tuple
 
-from pydub import AudioSegment
-
+from configs.env import WHISPER_BATCH_MAX_BYTES, WHISPER_BATCH_MAX_DURATION_SECONDS
 from constants.files import PROCESSING_FILES_DIR_PATH
 from constants.log_tags import LogTag
+from models.audio_chunk import AudioChunk
 from models.text_segment import TextSegment
-from services.speech_to_text.whisper_endpoint import send_request_to_whisper_endpoint
+from services.speech_to_text.pack_audio_chunks import pack_audio_chunks_to_batches
+from services.speech_to_text.whisper_endpoint import (
+    send_request_to_whisper_endpoint,
+    send_batch_request_to_whisper_endpoint
+)
+from utils.pcm_file import PCMFile
 from configs.logger import catch_error, print_info_log
 
 MINIMUM_AUDIO_LENGTH_MS = 100  # 0.1 seconds in milliseconds
+WHISPER_SAMPLE_RATE = 16000
 
 
-def speech_to_text(file_path: str, project_id: str, show_logs: bool = False) -> Tuple[List[TextSegment], int]:
-    """Convert the audio content of file into text."""
+def speech_to_text(
+    source_audio: PCMFile,
+    project_id: str,
+    show_logs: bool = False
+) -> Tuple[List[TextSegment], int]:
+    """Convert the audio content of file into text, the audio is read from the decoded source audio."""
 
     try:
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            raise ValueError(f"File not found: {file_path}")
-
-        file = Path(file_path)
-        file_format = file.suffix.replace('.', '')  # Strip the dot from the suffix
-
-        # Extract Audio from Video
-        audio_segment = AudioSegment.from_file(file_path, format=file_format)
-        audio_len_in_seconds = len(audio_segment) // 1000
+        audio_len_in_seconds = len(source_audio) // 1000
 
         # Determine the 1-minute Mark
         one_minute_in_ms = 1 * 60 * 1000
@@ -35,42 +34,68 @@ def speech_to_text(file_path: str, project_id: str, show_logs: bool = False) ->
         # Initialize an Empty Transcript parts
         transcript_parts: List[TextSegment] = []
 
-        # Loop Through 10-minute Segments
-        elapsed_time = 0  # in milliseconds
-
         if show_logs:
             print_info_log(
                 tag=LogTag.SPEECH_TO_TEXT,
-                message=f"Converting speech to text of {file_path}"
+                message=f"Converting speech to text of {source_audio.path}"
             )
 
-        for start_time in range(0, len(audio_segment), one_minute_in_ms):
-            end_time = min(len(audio_segment), start_time + one_minute_in_ms)
-            current_segment = audio_segment[start_time:end_time]
+        # Encode 1-minute chunks in memory, Whisper works with 16kHz mono audio
+        audio_chunks: List[AudioChunk] = []
+        for start_time in range(0, len(source_audio), one_minute_in_ms):
+            end_time = min(len(source_audio), start_time + one_minute_in_ms)
+            # Only the chunk is copied from the mapped file
+            current_segment = source_audio.get_audio_segment(start_time, end_time)
 
             # Check if segment length is at least 0.1 seconds - Whisper won't accept small files
             if len(current_segment) < MINIMUM_AUDIO_LENGTH_MS:
                 continue
 
-            # Use a temporary file to avoid overwriting conflicts
-            with tempfile.NamedTemporaryFile(
-                dir=PROCESSING_FILES_DIR_PATH,
-                suffix=".wav",
-                delete=True
-            ) as temp_file:
-                current_segment.export(temp_file.name, format="wav")
-
-                # Use OpenAI's Whisper ASR to transcribe
-                json_response = send_request_to_whisper_endpoint(
-                    temp_file_name=temp_file.name,
+            wav_buffer = io.BytesIO()
+            current_segment.set_frame_rate(WHISPER_SAMPLE_RATE).set_channels(1).export(wav_buffer, format="wav")
+            audio_chunks.append(
+                AudioChunk(
+                    start_time_ms=start_time,
+                    duration_ms=len(current_segment),
+                    data=wav_buffer.getvalue()
+                )
+            )
+
+        # Pack chunks to batches to pay request overhead once per batch instead of once per chunk
+        audio_batches = pack_audio_chunks_to_batches(
+            audio_chunks=audio_chunks,
+            max_batch_bytes=WHISPER_BATCH_MAX_BYTES,
+            max_batch_duration_ms=WHISPER_BATCH_MAX_DURATION_SECONDS * 1000
+        )
+
+        if show_logs:
+            print_info_log(
+                tag=LogTag.SPEECH_TO_TEXT,
+                message=f"Sending {len(audio_chunks)} audio chunks in {len(audio_batches)} requests"
+            )
+
+        for audio_batch in audio_batches:
+            # Use OpenAI's Whisper ASR to transcribe
+            if len(audio_batch) == 1:
+                json_responses = [
+                    send_request_to_whisper_endpoint(
+                        audio_data=audio_batch[0].data,
+                        show_logs=show_logs
+                    )
+                ]
+            else:
+                json_responses = send_batch_request_to_whisper_endpoint(
+                    audio_chunks=[audio_chunk.data for audio_chunk in audio_batch],
                     show_logs=show_logs
                 )
 
-                # Adjust the timestamps by adding the elapsed_time
+            # Demultiplex responses back to chunks of the timeline
+            for audio_chunk, json_response in zip(audio_batch, json_responses):
+                # Adjust the timestamps by adding the chunk start time
                 for chunk in json_response['chunks']:
                     # Convert milliseconds to seconds
-                    chunk['timestamp'][0] += elapsed_time / 1000
-                    chunk['timestamp'][1] += elapsed_time / 1000
+                    chunk['timestamp'][0] += audio_chunk.start_time_ms / 1000
+                    chunk['timestamp'][1] += audio_chunk.start_time_ms / 1000
                     segment = {
                         "original_timestamp": tuple(chunk['timestamp']),
                         "text": chunk['text']
@@ -81,9 +106,6 @@ def speech_to_text(file_path: str, project_id: str, show_logs: bool = False) ->
                         TextSegment(**segment)
                     )
 
-            # Update the elapsed_time
-            elapsed_time += one_minute_in_ms
-
         return transcript_parts, audio_len_in_seconds
 
     except ValueError as ve:
@@ -95,10 +117,13 @@ def speech_to_text(file_path: str, project_id: str, show_logs: bool = False) ->
 
 
 if __name__ == "__main__":
+    from services.ingest.ingest_source_audio import ingest_source_audio
+    from utils.artifact_store import ArtifactStore
+
     test_project_id = "07fsfECkwma6fVTDyqQf"
     test_file_path = f"{PROCESSING_FILES_DIR_PATH}/{test_project_id}.mp4"
     test_transcript_parts, test_used_tokens_in_seconds = speech_to_text(
-        file_path=test_file_path,
+        source_audio=ingest_source_audio(test_file_path, ArtifactStore(job_id=test_project_id), test_project_id),
         project_id=test_project_id,
         show_logs=True
     )
@@ -1,27 +1,43 @@
+import base64
 import time
 from datetime import datetime
+from typing import List
 
 import requests
-from requests.exceptions import SSLError
+from requests.exceptions import SSLError, Timeout
 
-from configs.env import WHISPER_BEARER_TOKEN, ENDPOINT_WHISPER_API_URL
+from configs.env import WHISPER_BEARER_TOKEN, ENDPOINT_WHISPER_API_URL, WHISPER_REQUEST_TIMEOUT_SECONDS
 from configs.logger import print_info_log, catch_error
 from constants.log_tags import LogTag
+from utils.hedged_request import hedged_request
 
 headers = {
     "Authorization": f"Bearer {WHISPER_BEARER_TOKEN}",
     "Content-Type": "audio/m4a"
 }
 
+batch_headers = {
+    "Authorization": f"Bearer {WHISPER_BEARER_TOKEN}",
+    "Content-Type": "application/json"
+}
+
 DELAY_TO_REPEAT_REQUEST_IN_SECONDS = 3 * 60
 DELAY_FOR_UNKNOWN_ERRORS_IN_SECONDS = 5
 
 
-def send_request_to_whisper_endpoint(temp_file_name: str, show_logs: bool):
-    try:
-        with open(temp_file_name, "rb") as f:
-            data = f.read()
+def post_to_whisper_endpoint(request_headers: dict, show_logs: bool, data: bytes = None, json: dict = None):
+    """
+    Send a request to Whisper endpoint and repeat it while the endpoint is waking up or the connection fails.
 
+    :param request_headers: Headers of the request (auth and content type).
+    :param show_logs: Determines whether to display logs while sending the request.
+    :param data: Raw request body (single audio file).
+    :param json: JSON request body (batch of audio files).
+
+    :return: Decoded JSON response of Whisper endpoint.
+    """
+
+    try:
         if show_logs:
             print_info_log(
                 tag=LogTag.WHISPER_ENDPOINT_REQUEST,
@@ -29,7 +45,16 @@ def send_request_to_whisper_endpoint(temp_file_name: str, show_logs: bool):
             )
 
         request_time = datetime.now()
-        response = requests.post(ENDPOINT_WHISPER_API_URL, headers=headers, data=data)
+        response = hedged_request(
+            provider="whisper",
+            request=lambda: requests.post(
+                ENDPOINT_WHISPER_API_URL,
+                headers=request_headers,
+                data=data,
+                json=json,
+                timeout=WHISPER_REQUEST_TIMEOUT_SECONDS
+            )
+        )
         response_time = datetime.now()
         time_difference = response_time - request_time
 
@@ -58,9 +83,11 @@ def send_request_to_whisper_endpoint(temp_file_name: str, show_logs: bool):
                         tag=LogTag.WHISPER_ENDPOINT_RESPONSE,
                         message=f"Trying to send request to Whisper endpoint again..."
                     )
-                return send_request_to_whisper_endpoint(
-                    temp_file_name=temp_file_name,
-                    show_logs=show_logs
+                return post_to_whisper_endpoint(
+                    request_headers=request_headers,
+                    show_logs=show_logs,
+                    data=data,
+                    json=json
                 )
 
             # Some other error with Whisper endpoint
@@ -91,27 +118,85 @@ def send_request_to_whisper_endpoint(temp_file_name: str, show_logs: bool):
             tag=LogTag.WHISPER_ENDPOINT_REQUEST,
             message=f"Trying to send request to Whisper endpoint again..."
         )
-        return send_request_to_whisper_endpoint(
-            temp_file_name=temp_file_name,
-            show_logs=show_logs
+        return post_to_whisper_endpoint(
+            request_headers=request_headers,
+            show_logs=show_logs,
+            data=data,
+            json=json
         )
 
-    except ConnectionResetError as cre:
+    except (ConnectionResetError, Timeout) as cre:
         # Try again because something went wrong
         print_info_log(
             tag=LogTag.WHISPER_ENDPOINT_RESPONSE,
-            message=f"ConnectionResetError: {str(cre)}"
+            message=f"{type(cre).__name__}: {str(cre)}"
         )
         print_info_log(
             tag=LogTag.WHISPER_ENDPOINT_RESPONSE,
-            message="Wait {DELAY_FOR_UNKNOWN_ERRORS_IN_SECONDS} seconds to repeat..."
+            message=f"Wait {DELAY_FOR_UNKNOWN_ERRORS_IN_SECONDS} seconds to repeat..."
         )
         time.sleep(DELAY_FOR_UNKNOWN_ERRORS_IN_SECONDS)
         print_info_log(
             tag=LogTag.WHISPER_ENDPOINT_RESPONSE,
             message="Trying to send request to Whisper endpoint again..."
         )
-        return send_request_to_whisper_endpoint(
-            temp_file_name=temp_file_name,
-            show_logs=show_logs
+        return post_to_whisper_endpoint(
+            request_headers=request_headers,
+            show_logs=show_logs,
+            data=data,
+            json=json
         )
+
+
+def send_request_to_whisper_endpoint(audio_data: bytes, show_logs: bool) -> dict:
+    """
+    Transcribe one audio file with Whisper endpoint.
+
+    :param audio_data: The encoded audio file (wav bytes).
+    :param show_logs: Determines whether to display logs while sending the request.
+
+    :return: Whisper response with 'text' and 'chunks' keys.
+    """
+
+    return post_to_whisper_endpoint(
+        request_headers=headers,
+        show_logs=show_logs,
+        data=audio_data
+    )
+
+
+def send_batch_request_to_whisper_endpoint(audio_chunks: List[bytes], show_logs: bool) -> List[dict]:
+    """
+    Transcribe several audio files with one request to Whisper endpoint.
+
+    The files are sent as a JSON array of base64 payloads - {"inputs": ["<base64>", ...]},
+    the endpoint answers with a list of transcriptions in the same order.
+
+    :param audio_chunks: The list of encoded audio files (wav bytes).
+    :param show_logs: Determines whether to display logs while sending the request.
+
+    :return: The list of Whisper responses (with 'text' and 'chunks' keys), one per audio file.
+    """
+
+    if show_logs:
+        print_info_log(
+            tag=LogTag.WHISPER_ENDPOINT_REQUEST,
+            message=f"Batching {len(audio_chunks)} audio chunks into one request..."
+        )
+
+    json_response = post_to_whisper_endpoint(
+        request_headers=batch_headers,
+        show_logs=show_logs,
+        json={"inputs": [base64.b64encode(audio_chunk).decode("ascii") for audio_chunk in audio_chunks]}
+    )
+
+    if not isinstance(json_response, list) or len(json_response) != len(audio_chunks):
+        catch_error(
+            tag=LogTag.WHISPER_ENDPOINT_RESPONSE,
+            error=Exception(
+                f"Whisper batch response does not match the request: sent {len(audio_chunks)} audio chunks, "
+                f"received {len(json_response) if isinstance(json_response, list) else json_response}"
+            )
+        )
+
+    return json_response
@@ -1,66 +1,284 @@
-import time
-from typing import List
+import base64
+import json
+from typing import Iterator, List, Tuple
 
-from elevenlabs import APIError, generate as generate_audio, set_api_key, RateLimitError
+import requests
 
 from configs.logger import print_info_log, catch_error
+from constants.audio import PIPELINE_FRAME_RATE
 from constants.log_tags import LogTag
 from models.text_segment import TextSegment
-from configs.env import ELEVEN_LABS_API_KEY
+from models.tts_stream_event import TTSStreamEvent
+from configs.env import (
+    ELEVEN_LABS_API_KEY,
+    ELEVEN_LABS_REQUEST_TIMEOUT_SECONDS,
+    ELEVEN_LABS_MAX_CONCURRENCY,
+    ELEVEN_LABS_CHARACTERS_PER_MINUTE
+)
+from utils.hedged_request import hedged_request
+from utils.rate_limiter import RateLimitSlot, get_rate_limiter, get_retry_after_seconds
 
-set_api_key(ELEVEN_LABS_API_KEY)
+# Wait time after 429 answer without Retry-After header
+DELAY_AFTER_RATE_LIMIT_IN_SECONDS = 10
+RATE_LIMIT_MAX_RETRIES = 10
 
-DELAY_TO_WAIT_IN_SECONDS = 5 * 60
+ELEVEN_LABS_MODEL = "eleven_multilingual_v2"
 
+# Raw samples in the working format of the pipeline instead of mp3, so audio is not decoded and encoded again
+ELEVEN_LABS_OUTPUT_FORMAT = f"pcm_{PIPELINE_FRAME_RATE}"
 
-def generate_audio_with_elevenlabs_provider(
-    output_audio_file_path: str,
+ELEVEN_LABS_TEXT_TO_SPEECH_URL = "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+ELEVEN_LABS_TEXT_TO_SPEECH_STREAM_WITH_TIMESTAMPS_URL = (
+    "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream/with-timestamps"
+)
+
+rate_limiter = get_rate_limiter(
+    provider="elevenlabs",
+    api_key=ELEVEN_LABS_API_KEY,
+    characters_per_minute=ELEVEN_LABS_CHARACTERS_PER_MINUTE,
+    max_concurrency=ELEVEN_LABS_MAX_CONCURRENCY
+)
+
+
+class ElevenLabsResponse:
+    """
+    Answer of 11labs which owns the concurrent slot of the rate limit until the response is closed.
+
+    The slot of a streamed request is held while its body is read by the caller, the slot of a buffered request
+    is already released when its body is received, so it's None.
+    """
+
+    def __init__(self, response: requests.Response, rate_limit_slot: RateLimitSlot | None = None):
+        self.response = response
+        self.rate_limit_slot = rate_limit_slot
+
+    def close(self):
+        try:
+            self.response.close()
+        finally:
+            if self.rate_limit_slot is not None:
+                self.rate_limit_slot.release()
+
+    def __enter__(self) -> "ElevenLabsResponse":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def post_to_elevenlabs(
+    url: str,
+    text: str,
+    speaking_rate: float = 1.0,
+    stream: bool = False,
+    show_logs: bool = False
+) -> ElevenLabsResponse:
+    """
+    Send a text to speech request to 11labs within the shared rate limit.
+
+    Requests are sent directly instead of the 11labs client, because the client does not give Retry-After
+    of 429 answers. After 429 all requests to 11labs wait for Retry-After, then this request is repeated.
+
+    :param url: The endpoint url with voice id.
+    :param text: The text to synthesize.
+    :param speaking_rate: The rate of speech, 1.0 is normal.
+    :param stream: Return the response as soon as headers are received, the body is read by the caller,
+        which must close the returned answer to free the concurrent slot of the rate limit.
+    :param show_logs: Determines whether to display logs while sending the request.
+
+    :return: Successful response of 11labs, audio is raw PCM in the working format of the pipeline.
+    """
+
+    request_json = {
+        "text": text,
+        "model_id": ELEVEN_LABS_MODEL
+    }
+    if speaking_rate != 1.0:
+        # Other settings are left out, so the voice keeps its own stability and similarity
+        request_json["voice_settings"] = {"speed": speaking_rate}
+
+    def send_request() -> requests.Response:
+        return requests.post(
+            url,
+            params={"output_format": ELEVEN_LABS_OUTPUT_FORMAT},
+            headers={"xi-api-key": ELEVEN_LABS_API_KEY},
+            json=request_json,
+            timeout=ELEVEN_LABS_REQUEST_TIMEOUT_SECONDS,
+            stream=stream
+        )
+
+    def send_streamed_request(rate_limit_slot: RateLimitSlot) -> ElevenLabsResponse:
+        try:
+            response = send_request()
+        except BaseException:
+            rate_limit_slot.release()
+            raise
+        # The streamed body is read by the caller, so the concurrent slot is held until the answer is closed
+        return ElevenLabsResponse(response=response, rate_limit_slot=rate_limit_slot)
+
+    elevenlabs_response = None
+    for _ in range(RATE_LIMIT_MAX_RETRIES):
+        if elevenlabs_response is not None:
+            # 429 answer of the previous try
+            elevenlabs_response.close()
+
+        # The slot and quota are waited for before the request, so the wait is counted neither in its timeout
+        # nor in its latency
+        rate_limit_slot = rate_limiter.acquire_slot(characters=len(text))
+        if stream:
+            # A streamed request lasts as long as the synthesis of the whole text, so it's not duplicated
+            elevenlabs_response = send_streamed_request(rate_limit_slot)
+        else:
+            # The slots of the request and its hedge are released by the hedged request when they are done
+            elevenlabs_response = ElevenLabsResponse(response=hedged_request(
+                provider="elevenlabs",
+                request=send_request,
+                timeout_seconds=ELEVEN_LABS_REQUEST_TIMEOUT_SECONDS,
+                primary_slot=rate_limit_slot,
+                try_acquire_hedge_slot=lambda: rate_limiter.try_acquire_slot(characters=len(text))
+            ))
+        if elevenlabs_response.response.status_code != 429:
+            break
+
+        retry_after_seconds = get_retry_after_seconds(
+            headers=elevenlabs_response.response.headers,
+            default_seconds=DELAY_AFTER_RATE_LIMIT_IN_SECONDS
+        )
+        rate_limiter.pause(retry_after_seconds)
+        if show_logs:
+            print_info_log(
+                tag=LogTag.ELEVENLABS_PROVIDER,
+                message=f"Too many requests to 11labs, repeat after {retry_after_seconds} seconds..."
+            )
+
+    if not elevenlabs_response.response.ok:
+        with elevenlabs_response:
+            response = elevenlabs_response.response
+            raise Exception(f"11labs API Error ({response.status_code}): {response.text}")
+
+    return elevenlabs_response
+
+
+class SegmentsAlignmentTracker:
+    """
+    Incremental search of segments in character alignment of 11labs, which comes in chunks with streamed audio.
+
+    Segments are searched in order in the aligned characters, so the alignment may include or skip pause tags.
+    """
+
+    def __init__(self, text_segments: List[TextSegment]):
+        self.text_segments = text_segments
+        self.aligned_text = ""
+        self.characters_starts_seconds: List[float] = []
+        self.characters_ends_seconds: List[float] = []
+        self.search_position = 0
+        self.next_segment_index = 0
+
+    def add_alignment(self, alignment: dict) -> List[Tuple[int, Tuple[float, float]]]:
+        """
+        Add an alignment chunk and return segments which are found in the aligned text since the previous chunk.
+
+        :param alignment: 11labs alignment with 'characters', 'character_start_times_seconds'
+            and 'character_end_times_seconds' keys, times are counted from the start of the whole audio.
+
+        :return: (index, (start, end)) of found segments, timestamps are in milliseconds.
+        """
+
+        self.aligned_text += "".join(alignment["characters"])
+        self.characters_starts_seconds.extend(alignment["character_start_times_seconds"])
+        self.characters_ends_seconds.extend(alignment["character_end_times_seconds"])
+
+        found_segments: List[Tuple[int, Tuple[float, float]]] = []
+        while self.next_segment_index < len(self.text_segments):
+            segment_text = self.text_segments[self.next_segment_index].text.strip()
+            segment_position = self.aligned_text.find(segment_text, self.search_position)
+            # The segment is not aligned yet, or never will be if its text differs in the alignment
+            if not segment_text or segment_position == -1:
+                break
+
+            self.search_position = segment_position + len(segment_text)
+            found_segments.append((
+                self.next_segment_index,
+                (
+                    self.characters_starts_seconds[segment_position] * 1000,
+                    self.characters_ends_seconds[self.search_position - 1] * 1000
+                )
+            ))
+            self.next_segment_index += 1
+
+        return found_segments
+
+
+def stream_audio_with_elevenlabs_provider(
     text_segments: List[TextSegment],
     voice_id: str,
     pause_duration_ms: int,
     project_id: str,
     show_logs: bool = False
-):
-    pause_tag = f" <break time=\"{pause_duration_ms / 1000}s\"/> "
-    combined_text = ""
+) -> Iterator[TTSStreamEvent]:
+    """
+    Synthesize all segments with one request and yield audio chunks and segment positions as they arrive.
 
-    for segment in text_segments:
-        combined_text += segment.text + pause_tag
+    :return: Events with raw PCM chunks and (start, end) of segments in milliseconds taken from character alignment.
+    """
+
+    pause_tag = f" <break time=\"{pause_duration_ms / 1000}s\"/> "
+    combined_text = pause_tag.join(segment.text.strip() for segment in text_segments)
 
     try:
-        audio = generate_audio(
+        elevenlabs_response = post_to_elevenlabs(
+            url=ELEVEN_LABS_TEXT_TO_SPEECH_STREAM_WITH_TIMESTAMPS_URL.format(voice_id=voice_id),
             text=combined_text,
-            voice=voice_id,
-            model="eleven_multilingual_v2"
+            stream=True,
+            show_logs=show_logs
+        )
+    except Exception as e:
+        catch_error(
+            tag=LogTag.ELEVENLABS_PROVIDER,
+            error=e,
+            project_id=project_id
+        )
+
+    alignment_tracker = SegmentsAlignmentTracker(text_segments=text_segments)
+    # Every line of the answer is a JSON chunk with audio and alignment of its characters
+    with elevenlabs_response:
+        for line in elevenlabs_response.response.iter_lines():
+            if not line:
+                continue
+
+            chunk = json.loads(line)
+            if chunk.get("audio_base64"):
+                yield TTSStreamEvent(audio_data=base64.b64decode(chunk["audio_base64"]))
+            if chunk.get("alignment"):
+                for segment_index, audio_timestamp in alignment_tracker.add_alignment(chunk["alignment"]):
+                    yield TTSStreamEvent(segment_index=segment_index, audio_timestamp=audio_timestamp)
+
+    if alignment_tracker.next_segment_index < len(text_segments):
+        print_info_log(
+            tag=LogTag.ELEVENLABS_PROVIDER,
+            message=f"Only {alignment_tracker.next_segment_index} of {len(text_segments)} segments found in alignment."
         )
-        with open(output_audio_file_path, 'wb') as f:
-            f.write(audio)
-
-    except APIError as api_error:
-        print("(elevenlabs_provider) API Error:", str(api_error))
-
-        # If too many requests to 11labs, wait and then try again
-        if isinstance(api_error, RateLimitError):
-            if show_logs:
-                print_info_log(
-                    tag=LogTag.ELEVENLABS_PROVIDER,
-                    message=f"Wait {DELAY_TO_WAIT_IN_SECONDS} seconds and then repeat request to 11labs..."
-                )
-            time.sleep(DELAY_TO_WAIT_IN_SECONDS)
-            return generate_audio_with_elevenlabs_provider(
-                output_audio_file_path=output_audio_file_path,
-                text_segments=text_segments,
-                voice_id=voice_id,
-                pause_duration_ms=pause_duration_ms,
-                project_id=project_id,
-                show_logs=show_logs
-            )
-        else:
-            catch_error(
-                tag=LogTag.ELEVENLABS_PROVIDER,
-                error=api_error,
-                project_id=project_id
-            )
+
+
+def synthesize_text_with_elevenlabs_provider(text: str, voice_id: str, speaking_rate: float = 1.0) -> bytes:
+    """
+    Synthesize one text segment with 11labs.
+
+    Errors are raised to the caller, so a failed segment can be repeated on its own.
+
+    :param text: The text of the segment.
+    :param voice_id: The id of the voice in 11labs.
+    :param speaking_rate: The rate of speech, 1.0 is normal.
+
+    :return: Synthesized audio (raw PCM bytes, 24 kHz 16-bit mono).
+    """
+
+    with post_to_elevenlabs(
+        url=ELEVEN_LABS_TEXT_TO_SPEECH_URL.format(voice_id=voice_id),
+        text=text,
+        speaking_rate=speaking_rate
+    ) as elevenlabs_response:
+        return elevenlabs_response.response.content
 
 
 # Example usage
@@ -92,14 +310,16 @@ if __name__ == "__main__":
         TextSegment(timestamp=(52.2, 54.52), text='потому что моим глазам это не причинит большой боли.'),
         TextSegment(timestamp=(54.52, 56.84), text='Однако, если солнце немного ярче.')
     ]
-    test_output_audio_file_path = "translated-test.mp3"
     test_voice_id = "N2lVS1w4EtoT3dr4eOWO"
     test_project_id = "07fsfECkwma6fVTDyqQf"
-    generate_audio_with_elevenlabs_provider(
-        output_audio_file_path=test_output_audio_file_path,
+    for test_event in stream_audio_with_elevenlabs_provider(
         text_segments=test_text_segments,
         voice_id=test_voice_id,
         project_id=test_project_id,
         pause_duration_ms=3000,
         show_logs=True
-    )
+    ):
+        if test_event.audio_data:
+            print(f"Audio chunk: {len(test_event.audio_data)} bytes")
+        else:
+            print(f"Segment {test_event.segment_index}: {test_event.audio_timestamp}")
@@ -1,18 +1,41 @@
-from typing import List
+import queue
+from typing import Dict, Iterator, List
+from xml.sax.saxutils import escape
 
-from azure.cognitiveservices.speech import SpeechConfig, SpeechSynthesizer, ResultReason, CancellationReason
-from azure.cognitiveservices.speech.audio import AudioOutputConfig
+from azure.cognitiveservices.speech import (
+    SpeechConfig,
+    SpeechSynthesizer,
+    ResultReason,
+    SpeechSynthesisOutputFormat
+)
 
 from configs.logger import catch_error, print_info_log
 from constants.log_tags import LogTag
 from models.text_segment import TextSegment
-from configs.env import SPEECH_REGION, SPEECH_KEY
+from models.tts_stream_event import TTSStreamEvent
+from configs.env import SPEECH_REGION, SPEECH_KEY, MICROSOFT_REQUESTS_PER_MINUTE, MICROSOFT_MAX_CONCURRENCY
+from utils.rate_limiter import get_rate_limiter
 
 # This example requires environment variables named "SPEECH_KEY" and "SPEECH_REGION"
 speech_config = SpeechConfig(
     subscription=SPEECH_KEY,
     region=SPEECH_REGION
 )
+# Raw samples in the working format of the pipeline, without header and lossy encoding
+speech_config.set_speech_synthesis_output_format(SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
+
+rate_limiter = get_rate_limiter(
+    provider="azure",
+    api_key=SPEECH_KEY,
+    requests_per_minute=MICROSOFT_REQUESTS_PER_MINUTE,
+    max_concurrency=MICROSOFT_MAX_CONCURRENCY
+)
+
+# Azure SDK does not give Retry-After of throttled requests, so requests wait this time after throttling
+DELAY_AFTER_RATE_LIMIT_IN_SECONDS = 10
+
+# Output format of audio synthesized into memory, it's a part of TTS cache key
+MICROSOFT_OUTPUT_FORMAT = "raw-24khz-16bit-mono-pcm"
 
 
 # languages can be found at https://learn.microsoft.com/en-us/azure/ai-services/speech-service/language-support?tabs=tts
@@ -23,7 +46,7 @@ def create_ssml_with_pauses(
     pause_duration_ms: int,
 ):
     """
-    Create an SSML string with pauses and voice specification for Azure's Speech Service.
+    Create an SSML string with pauses, segment bookmarks and voice specification for Azure's Speech Service.
 
     :param text_segments: A list of dictionaries with 'text' keys.
     :param voice_id: The name of the voice to be used for speech synthesis.
@@ -38,23 +61,32 @@ def create_ssml_with_pauses(
         f'<voice name="{voice_id}">',
         f'<break time="{pause_duration_ms}ms"/>'
     ]
-    for segment in text_segments:
-        ssml_parts.append(segment.text)
+    # Bookmarks around every segment report where the segment is in the synthesized audio
+    for segment_index, segment in enumerate(text_segments):
+        ssml_parts.append(f'<bookmark mark="{segment_index}-start"/>')
+        ssml_parts.append(escape(segment.text))
+        ssml_parts.append(f'<bookmark mark="{segment_index}-end"/>')
         ssml_parts.append(f'<break time="{pause_duration_ms}ms"/>')
     ssml_parts.append('</voice></speak>')
     return ''.join(ssml_parts)
 
 
-def generate_audio_with_microsoft_provider(
-    output_audio_file_path: str,
+def stream_audio_with_microsoft_provider(
     text_segments: List[TextSegment],
     voice_id: str,
     language: str,
     pause_duration_ms: int,
     project_id: str,
     show_logs: bool
-):
-    audio_config = AudioOutputConfig(filename=output_audio_file_path)
+) -> Iterator[TTSStreamEvent]:
+    """
+    Synthesize all segments with one request and yield audio chunks and segment positions as they arrive.
+
+    Azure reports audio chunks and SSML bookmarks in its own threads, they are passed to the caller through a queue,
+    so the caller processes the beginning of the audio while the rest is synthesized.
+
+    :return: Events with raw PCM chunks and (start, end) of segments in milliseconds taken from SSML bookmarks.
+    """
 
     if show_logs:
         print_info_log(
@@ -62,11 +94,35 @@ def generate_audio_with_microsoft_provider(
             message=f"Initializing speech synthesizer..."
         )
 
+    # Without audio config the synthesizer gives audio in events instead of playing or saving it
     speech_synthesizer = SpeechSynthesizer(
         speech_config=speech_config,
-        audio_config=audio_config
+        audio_config=None
     )
 
+    # None marks the end of synthesis
+    events_queue: "queue.Queue[TTSStreamEvent | None]" = queue.Queue()
+    segments_starts_ms: Dict[int, float] = {}
+
+    def on_bookmark_reached(event):
+        segment_index, mark = event.text.split("-")
+        # Bookmark offsets are in ticks of 100 nanoseconds
+        offset_ms = event.audio_offset / 10_000
+        if mark == "start":
+            segments_starts_ms[int(segment_index)] = offset_ms
+        elif int(segment_index) in segments_starts_ms:
+            events_queue.put(TTSStreamEvent(
+                segment_index=int(segment_index),
+                audio_timestamp=(segments_starts_ms[int(segment_index)], offset_ms)
+            ))
+
+    speech_synthesizer.synthesizing.connect(
+        lambda event: events_queue.put(TTSStreamEvent(audio_data=event.result.audio_data))
+    )
+    speech_synthesizer.bookmark_reached.connect(on_bookmark_reached)
+    speech_synthesizer.synthesis_completed.connect(lambda event: events_queue.put(None))
+    speech_synthesizer.synthesis_canceled.connect(lambda event: events_queue.put(None))
+
     if show_logs:
         print_info_log(
             tag=LogTag.MICROSOFT_PROVIDER,
@@ -87,7 +143,14 @@ def generate_audio_with_microsoft_provider(
             message=f"Synthesizing text - {text_for_synthesizing}"
         )
 
-    speech_synthesis_result = speech_synthesizer.speak_ssml_async(text_for_synthesizing).get()
+    segments_count = 0
+    with rate_limiter.acquire(characters=len(text_for_synthesizing)):
+        speech_synthesis_future = speech_synthesizer.speak_ssml_async(text_for_synthesizing)
+        while (event := events_queue.get()) is not None:
+            if event.segment_index is not None:
+                segments_count += 1
+            yield event
+        speech_synthesis_result = speech_synthesis_future.get()
 
     # If synthesizing completed
     if speech_synthesis_result.reason == ResultReason.SynthesizingAudioCompleted:
@@ -97,22 +160,69 @@ def generate_audio_with_microsoft_provider(
                 message=f"Speech synthesized completed."
             )
 
+        if segments_count < len(text_segments):
+            print_info_log(
+                tag=LogTag.MICROSOFT_PROVIDER,
+                message=f"Bookmarks of only {segments_count} of {len(text_segments)} segments reached."
+            )
+
     # If synthesizing canceled
     elif speech_synthesis_result.reason == ResultReason.Canceled:
         cancellation_details = speech_synthesis_result.cancellation_details
+        if "429" in (cancellation_details.error_details or ""):
+            rate_limiter.pause(DELAY_AFTER_RATE_LIMIT_IN_SECONDS)
         catch_error(
             tag=LogTag.MICROSOFT_PROVIDER,
-            error=Exception(f"Speech synthesis canceled: {cancellation_details.reason}"),
+            error=Exception(
+                f"Speech synthesis canceled: {cancellation_details.reason}. {cancellation_details.error_details or ''}"
+            ),
             project_id=project_id
         )
 
-        if cancellation_details.reason == CancellationReason.Error:
-            if cancellation_details.error_details:
-                catch_error(
-                    tag=LogTag.MICROSOFT_PROVIDER,
-                    error=Exception(f"Error details: {cancellation_details.error_details}"),
-                    project_id=project_id
-                )
+
+def synthesize_text_with_microsoft_provider(
+    text: str,
+    voice_id: str,
+    language: str,
+    speaking_rate: float = 1.0
+) -> bytes:
+    """
+    Synthesize one text segment with Azure Speech Service into memory.
+
+    Errors are raised to the caller, so a failed segment can be repeated on its own.
+
+    :param text: The text of the segment.
+    :param voice_id: The name of the voice in Azure.
+    :param language: Language value in format expected from Microsoft.
+    :param speaking_rate: The rate of speech, 1.0 is normal.
+
+    :return: Synthesized audio (raw PCM bytes, 24 kHz 16-bit mono).
+    """
+
+    # Without audio config the synthesizer keeps audio in the result instead of playing or saving it
+    speech_synthesizer = SpeechSynthesizer(
+        speech_config=speech_config,
+        audio_config=None
+    )
+    text_ssml = escape(text)
+    if speaking_rate != 1.0:
+        text_ssml = f'<prosody rate="{speaking_rate}">{text_ssml}</prosody>'
+    ssml = (
+        '<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts"'
+        f' xml:lang="{language}"><voice name="{voice_id}">{text_ssml}</voice></speak>'
+    )
+    with rate_limiter.acquire(characters=len(ssml)):
+        speech_synthesis_result = speech_synthesizer.speak_ssml_async(ssml).get()
+
+    if speech_synthesis_result.reason == ResultReason.Canceled:
+        cancellation_details = speech_synthesis_result.cancellation_details
+        if "429" in (cancellation_details.error_details or ""):
+            rate_limiter.pause(DELAY_AFTER_RATE_LIMIT_IN_SECONDS)
+        raise Exception(
+            f"Speech synthesis canceled: {cancellation_details.reason}. {cancellation_details.error_details or ''}"
+        )
+
+    return speech_synthesis_result.audio_data
 
 
 # For local test
@@ -144,16 +254,18 @@ if __name__ == "__main__":
         TextSegment(timestamp=(52.2, 54.52), text='потому что моим глазам это не причинит большой боли.'),
         TextSegment(timestamp=(54.52, 56.84), text='Однако, если солнце немного ярче.')
     ]
-    test_output_audio_file_path = "translated-test.mp3"
     test_voice_id = "ru-RU-DmitryNeural"
     test_language = "russian"
     test_project_id = "07fsfECkwma6fVTDyqQf"
-    generate_audio_with_microsoft_provider(
-        output_audio_file_path=test_output_audio_file_path,
+    for test_event in stream_audio_with_microsoft_provider(
         text_segments=test_text_segments,
         voice_id=test_voice_id,
         language=test_language,
         pause_duration_ms=3000,
         project_id=test_project_id,
         show_logs=True
-    )
+    ):
+        if test_event.audio_data:
+            print(f"Audio chunk: {len(test_event.audio_data)} bytes")
+        else:
+            print(f"Segment {test_event.segment_index}: {test_event.audio_timestamp}")
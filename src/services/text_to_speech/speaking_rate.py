@@ -0,0 +1,120 @@
+import math
+import os
+import sqlite3
+import threading
+
+from configs.env import TTS_MAX_SPEAKING_RATE
+from constants.files import CACHE_FILES_DIR_PATH
+from models.target_voice import TargetVoice
+from models.voice_provider import VoiceProvider
+
+SPEAKING_RATES_DB_PATH = f"{CACHE_FILES_DIR_PATH}/speaking-rates.sqlite3"
+
+# Speed of a voice without samples, characters per second of normal speech
+DEFAULT_CHARACTERS_PER_SECOND = 15.0
+
+# Weight of a new sample in the moving average of voice speed
+SAMPLE_WEIGHT = 0.1
+
+# Short texts are mostly pauses around words, they don't show the voice speed
+MIN_SAMPLE_TEXT_LENGTH = 20
+
+# Rates are rounded, so segments of the same text hit TTS cache more often
+SPEAKING_RATE_STEP = 0.05
+
+# 11labs accepts speed only in this range
+PROVIDERS_MAX_SPEAKING_RATE = {
+    VoiceProvider.ELEVEN_LABS: 1.2,
+}
+
+
+class SpeakingRateModel:
+    """
+    Persistent per-voice speed of speech (characters per second at normal rate), learned from synthesized segments.
+    """
+
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS speaking_rates (
+                voice_key TEXT PRIMARY KEY,
+                characters_per_second REAL NOT NULL,
+                samples_count INTEGER NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.characters_per_second = dict(
+            self.connection.execute("SELECT voice_key, characters_per_second FROM speaking_rates").fetchall()
+        )
+
+    def get_characters_per_second(self, voice: TargetVoice) -> float:
+        with self.lock:
+            return self.characters_per_second.get(get_voice_key(voice), DEFAULT_CHARACTERS_PER_SECOND)
+
+    def record(self, voice: TargetVoice, text: str, duration_ms: float, speaking_rate: float):
+        """
+        Save the speed of the synthesized segment, the duration is converted back to normal rate.
+        """
+
+        text_length = len(text.strip())
+        if text_length < MIN_SAMPLE_TEXT_LENGTH or duration_ms <= 0:
+            return
+
+        sample_characters_per_second = text_length / (duration_ms * speaking_rate / 1000)
+        voice_key = get_voice_key(voice)
+        with self.lock:
+            previous_characters_per_second = self.characters_per_second.get(voice_key)
+            characters_per_second = (
+                sample_characters_per_second if previous_characters_per_second is None
+                else previous_characters_per_second * (1 - SAMPLE_WEIGHT) + sample_characters_per_second * SAMPLE_WEIGHT
+            )
+            self.characters_per_second[voice_key] = characters_per_second
+            self.connection.execute(
+                """
+                INSERT INTO speaking_rates (voice_key, characters_per_second, samples_count) VALUES (?, ?, 1)
+                ON CONFLICT (voice_key) DO UPDATE SET
+                    characters_per_second = excluded.characters_per_second,
+                    samples_count = samples_count + 1
+                """,
+                (voice_key, characters_per_second)
+            )
+            self.connection.commit()
+
+
+def get_voice_key(voice: TargetVoice) -> str:
+    return f"{voice.provider.value}:{voice.original_id}"
+
+
+speaking_rate_model = SpeakingRateModel(db_path=SPEAKING_RATES_DB_PATH)
+
+
+def get_speaking_rate(voice: TargetVoice, text: str, target_duration_ms: float | None) -> float:
+    """
+    Choose the rate of speech, so the segment fits into the time of the original segment.
+
+    Speech is only sped up, a segment which fits at normal rate is synthesized at normal rate.
+
+    :param voice: The voice from tts-configs.
+    :param text: The text of the segment.
+    :param target_duration_ms: The duration of the original segment, None if there is no limit.
+
+    :return: The rate of speech, 1.0 is normal.
+    """
+
+    if not target_duration_ms or target_duration_ms <= 0:
+        return 1.0
+
+    expected_duration_ms = len(text.strip()) / speaking_rate_model.get_characters_per_second(voice) * 1000
+    max_speaking_rate = min(
+        TTS_MAX_SPEAKING_RATE,
+        PROVIDERS_MAX_SPEAKING_RATE.get(voice.provider, TTS_MAX_SPEAKING_RATE)
+    )
+    speaking_rate = min(max(expected_duration_ms / target_duration_ms, 1.0), max_speaking_rate)
+    # Round up, so the segment rather ends a bit earlier than a bit later
+    steps_count = math.ceil(round(speaking_rate / SPEAKING_RATE_STEP, 6))
+    return min(round(steps_count * SPEAKING_RATE_STEP, 2), max_speaking_rate)
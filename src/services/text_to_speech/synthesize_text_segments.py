@@ -0,0 +1,251 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Tuple
+
+from pydub import AudioSegment
+
+from configs.env import TTS_MAX_CONCURRENCY, TTS_SEGMENT_MAX_ATTEMPTS
+from configs.logger import catch_error, print_info_log
+from constants.audio import PIPELINE_FRAME_RATE, PIPELINE_SAMPLE_WIDTH, PIPELINE_CHANNELS
+from constants.log_tags import LogTag
+from models.target_voice import TargetVoice
+from models.text_segment import TextSegment
+from models.voice_provider import VoiceProvider
+from services.text_to_speech.providers.elevenlabs import (
+    synthesize_text_with_elevenlabs_provider,
+    ELEVEN_LABS_MODEL,
+    ELEVEN_LABS_OUTPUT_FORMAT
+)
+from services.text_to_speech.providers.microsoft import (
+    synthesize_text_with_microsoft_provider,
+    MICROSOFT_OUTPUT_FORMAT
+)
+from services.text_to_speech.speaking_rate import get_speaking_rate, speaking_rate_model
+from services.text_to_speech.tts_cache import tts_cache, get_tts_cache_key, TTSCacheJobStats
+
+DELAY_TO_REPEAT_REQUEST_IN_SECONDS = 5
+
+# Audio of the same text differs between models and output formats, so they are a part of TTS cache key
+PROVIDERS_MODELS = {
+    VoiceProvider.ELEVEN_LABS: f"{ELEVEN_LABS_MODEL}:{ELEVEN_LABS_OUTPUT_FORMAT}",
+    VoiceProvider.MICROSOFT: MICROSOFT_OUTPUT_FORMAT,
+}
+
+
+def create_audio_from_pcm(audio_data: bytes) -> AudioSegment:
+    """
+    Wrap raw PCM of providers (the working format of the pipeline) into AudioSegment without decoding.
+    """
+
+    frame_width = PIPELINE_SAMPLE_WIDTH * PIPELINE_CHANNELS
+    # A cut stream may end in the middle of a frame
+    audio_data = audio_data[:len(audio_data) - len(audio_data) % frame_width]
+    return AudioSegment(
+        data=audio_data,
+        sample_width=PIPELINE_SAMPLE_WIDTH,
+        frame_rate=PIPELINE_FRAME_RATE,
+        channels=PIPELINE_CHANNELS
+    )
+
+
+def synthesize_text_segment(
+    text: str,
+    voice: TargetVoice,
+    target_duration_ms: float | None = None,
+    cache_job_stats: TTSCacheJobStats | None = None
+) -> AudioSegment:
+    """
+    Synthesize one text segment with the voice provider, failed requests are repeated with backoff.
+
+    Speech is sped up by the voice speed model, so the segment fits into target_duration_ms without stretching.
+    Audio is taken from TTS cache if the same text was already synthesized with the same voice and rate.
+
+    :param text: The text of the segment.
+    :param voice: The voice from tts-configs.
+    :param target_duration_ms: The duration of the original segment, None if there is no limit.
+    :param cache_job_stats: TTS cache statistics of the job.
+
+    :return: Synthesized audio of the segment without pauses around it.
+    """
+
+    # Providers fail on empty text, and there is nothing to say anyway
+    if not text.strip():
+        return AudioSegment.empty()
+
+    if voice.provider not in [VoiceProvider.ELEVEN_LABS, VoiceProvider.MICROSOFT]:
+        raise ValueError(f"Voice provider {voice.provider} does not support segments synthesis")
+
+    speaking_rate = get_speaking_rate(
+        voice=voice,
+        text=text,
+        target_duration_ms=target_duration_ms
+    )
+    cache_key = get_tts_cache_key(
+        provider=voice.provider.value,
+        voice_id=voice.original_id,
+        model=PROVIDERS_MODELS[voice.provider],
+        language=voice.languages[0],
+        text=text,
+        speaking_rate=speaking_rate
+    )
+    audio_data = tts_cache.get(cache_key, job_stats=cache_job_stats)
+    if audio_data is not None:
+        return create_audio_from_pcm(audio_data)
+
+    attempt = 1
+    while True:
+        try:
+            if voice.provider == VoiceProvider.ELEVEN_LABS:
+                audio_data = synthesize_text_with_elevenlabs_provider(
+                    text=text,
+                    voice_id=voice.original_id,
+                    speaking_rate=speaking_rate
+                )
+            else:
+                audio_data = synthesize_text_with_microsoft_provider(
+                    text=text,
+                    voice_id=voice.original_id,
+                    language=voice.languages[0],
+                    speaking_rate=speaking_rate
+                )
+
+            audio = create_audio_from_pcm(audio_data)
+            # Empty answer is not cached, so the segment is synthesized again next time
+            if len(audio) == 0:
+                raise ValueError(f"{voice.provider} returned empty audio")
+            tts_cache.put(cache_key, audio_data)
+            speaking_rate_model.record(
+                voice=voice,
+                text=text,
+                duration_ms=len(audio),
+                speaking_rate=speaking_rate
+            )
+            return audio
+
+        except Exception as error:
+            if attempt >= TTS_SEGMENT_MAX_ATTEMPTS:
+                raise error
+
+            delay_in_seconds = DELAY_TO_REPEAT_REQUEST_IN_SECONDS * 2 ** (attempt - 1)
+            print_info_log(
+                tag=LogTag.SYNTHESIZE_TEXT_SEGMENTS,
+                message=f"{voice.provider} error: {str(error)}. Wait {delay_in_seconds} seconds to repeat..."
+            )
+            time.sleep(delay_in_seconds)
+            attempt += 1
+
+
+def synthesize_text_segments(
+    text_segments: List[TextSegment],
+    voice: TargetVoice,
+    project_id: str,
+    show_logs: bool = False,
+    on_segment_synthesized: Callable[[int, AudioSegment], None] | None = None
+) -> List[AudioSegment]:
+    """
+    Synthesize every text segment with its own request, requests are sent concurrently.
+
+    :param text_segments: The list of TextSegments to synthesize.
+    :param voice: The voice from tts-configs.
+    :param project_id: The id of the processing project.
+    :param show_logs: Determines whether to display logs while synthesizing.
+    :param on_segment_synthesized: Called with the index and the audio of every segment as soon as it's synthesized.
+
+    :return: The list of synthesized audios in the order of text_segments.
+    """
+
+    try:
+        if show_logs:
+            print_info_log(
+                tag=LogTag.SYNTHESIZE_TEXT_SEGMENTS,
+                message=f"Synthesizing {len(text_segments)} segments with {voice.provider}, "
+                        f"{TTS_MAX_CONCURRENCY} at a time..."
+            )
+
+        # Audios are kept in the original order of segments, but given to the callback in order of readiness
+        cache_job_stats = TTSCacheJobStats()
+        segments_audios: List[AudioSegment | None] = [None] * len(text_segments)
+        with ThreadPoolExecutor(max_workers=TTS_MAX_CONCURRENCY) as executor:
+            segments_indexes_by_future = {
+                executor.submit(
+                    synthesize_text_segment,
+                    text=segment.text,
+                    voice=voice,
+                    target_duration_ms=(segment.original_timestamp[1] - segment.original_timestamp[0]) * 1000,
+                    cache_job_stats=cache_job_stats
+                ): segment_index
+                for segment_index, segment in enumerate(text_segments)
+            }
+            for segment_future in as_completed(segments_indexes_by_future):
+                segment_index = segments_indexes_by_future[segment_future]
+                segments_audios[segment_index] = segment_future.result()
+                if on_segment_synthesized is not None:
+                    on_segment_synthesized(segment_index, segments_audios[segment_index])
+
+        print_info_log(
+            tag=LogTag.TTS_CACHE,
+            message=f"TTS cache stats of the project {project_id}: {cache_job_stats.get_stats()}"
+        )
+
+        if show_logs:
+            print_info_log(
+                tag=LogTag.SYNTHESIZE_TEXT_SEGMENTS,
+                message=f"Segments synthesized, total duration {sum(len(audio) for audio in segments_audios)}ms."
+            )
+
+        return segments_audios
+
+    except Exception as e:
+        catch_error(
+            tag=LogTag.SYNTHESIZE_TEXT_SEGMENTS,
+            error=e,
+            project_id=project_id
+        )
+
+
+def join_segments_audios(
+    segments_audios: List[AudioSegment],
+    pause_duration_ms: int
+) -> Tuple[AudioSegment, List[Tuple[float, float]]]:
+    """
+    Join audios of segments into one track with pauses between them.
+
+    Segments are already in the working format of the pipeline, raw samples are joined at once instead of adding AudioSegments one by one, which copies the track every time.
+
+    :param segments_audios: The list of synthesized audios of segments.
+    :param pause_duration_ms: The duration of silence between segments in milliseconds.
+
+    :return: The joined track and (start, end) of every segment in it in milliseconds.
+    """
+
+    frame_width = PIPELINE_SAMPLE_WIDTH * PIPELINE_CHANNELS
+    pause_data = b"\0" * (int(PIPELINE_FRAME_RATE * pause_duration_ms / 1000) * frame_width)
+    track_parts: List[bytes] = []
+    audio_timestamps: List[Tuple[float, float]] = []
+    track_frames_count = 0
+
+    for segment_audio in segments_audios:
+        segment_data = (
+            segment_audio
+            .set_frame_rate(PIPELINE_FRAME_RATE)
+            .set_channels(PIPELINE_CHANNELS)
+            .set_sample_width(PIPELINE_SAMPLE_WIDTH)
+            .raw_data
+        )
+        segment_frames_count = len(segment_data) // frame_width
+        audio_timestamps.append((
+            track_frames_count * 1000 / PIPELINE_FRAME_RATE,
+            (track_frames_count + segment_frames_count) * 1000 / PIPELINE_FRAME_RATE
+        ))
+
+        track_parts.append(segment_data)
+        track_parts.append(pause_data)
+        track_frames_count += segment_frames_count + len(pause_data) // frame_width
+
+    track = AudioSegment(
+        data=b"".join(track_parts),
+        sample_width=PIPELINE_SAMPLE_WIDTH,
+        frame_rate=PIPELINE_FRAME_RATE,
+        channels=PIPELINE_CHANNELS
+    )
+    return track, audio_timestamps
@@ -0,0 +1,90 @@
+from typing import Dict, Iterator, List, Tuple
+
+from pydub import AudioSegment
+
+from constants.audio import PIPELINE_FRAME_RATE, PIPELINE_SAMPLE_WIDTH, PIPELINE_CHANNELS
+from models.text_segment import TextSegment, TextSegmentWithAudioTimestamp
+from models.tts_stream_event import TTSStreamEvent
+
+FRAME_WIDTH = PIPELINE_SAMPLE_WIDTH * PIPELINE_CHANNELS
+
+
+class SynthesizedSpeechStream:
+    """
+    Consumer of streamed synthesis, it collects audio chunks and gives the position of every segment as soon as
+    it's synthesized.
+
+    Providers report the position of a segment before or after its audio arrives, so a segment is given
+    when both its position is known and the audio is received up to its end. The audio of a segment is copied
+    out with slice_audio only when the consumer needs it before the whole track.
+    """
+
+    def __init__(self, events: Iterator[TTSStreamEvent], text_segments: List[TextSegment]):
+        self.events = events
+        self.text_segments = text_segments
+        self.audio_data = bytearray()
+        self.pending_audio_timestamps: Dict[int, Tuple[float, float]] = {}
+        self.segments_with_audio_timestamp: Dict[int, TextSegmentWithAudioTimestamp] = {}
+
+    def get_received_duration_ms(self) -> float:
+        return len(self.audio_data) // FRAME_WIDTH * 1000 / PIPELINE_FRAME_RATE
+
+    def create_audio(self, start_frame: int, end_frame: int) -> AudioSegment:
+        return AudioSegment(
+            data=bytes(self.audio_data[start_frame * FRAME_WIDTH:end_frame * FRAME_WIDTH]),
+            sample_width=PIPELINE_SAMPLE_WIDTH,
+            frame_rate=PIPELINE_FRAME_RATE,
+            channels=PIPELINE_CHANNELS
+        )
+
+    def slice_audio(self, start_ms: float, end_ms: float) -> AudioSegment:
+        # The same frames as slicing of the whole track
+        return self.create_audio(
+            start_frame=int(start_ms * PIPELINE_FRAME_RATE / 1000.0),
+            end_frame=int(end_ms * PIPELINE_FRAME_RATE / 1000.0)
+        )
+
+    def pop_ready_segments(self, is_finished: bool) -> Iterator[Tuple[int, TextSegmentWithAudioTimestamp]]:
+        received_duration_ms = self.get_received_duration_ms()
+        for segment_index, audio_timestamp in sorted(self.pending_audio_timestamps.items()):
+            if not is_finished and audio_timestamp[1] > received_duration_ms:
+                continue
+
+            del self.pending_audio_timestamps[segment_index]
+            segment_with_audio_timestamp = TextSegmentWithAudioTimestamp(
+                **self.text_segments[segment_index].dict(),
+                audio_timestamp=audio_timestamp
+            )
+            self.segments_with_audio_timestamp[segment_index] = segment_with_audio_timestamp
+            yield segment_index, segment_with_audio_timestamp
+
+    def __iter__(self) -> Iterator[Tuple[int, TextSegmentWithAudioTimestamp]]:
+        """
+        Consume provider events and yield (index, segment with audio timestamp) in order of readiness.
+        """
+
+        for event in self.events:
+            if event.audio_data:
+                self.audio_data.extend(event.audio_data)
+            if event.segment_index is not None and event.audio_timestamp is not None:
+                self.pending_audio_timestamps[event.segment_index] = event.audio_timestamp
+            yield from self.pop_ready_segments(is_finished=False)
+
+        # Positions after the end of audio are given as is, the segment is cut at the end of the track
+        yield from self.pop_ready_segments(is_finished=True)
+
+    def get_audio(self) -> AudioSegment:
+        """
+        Return all received audio, the stream must be consumed before.
+        """
+
+        return self.create_audio(start_frame=0, end_frame=len(self.audio_data) // FRAME_WIDTH)
+
+    def get_segments_with_audio_timestamp(self) -> List[TextSegmentWithAudioTimestamp] | None:
+        """
+        Return segments with audio timestamps in the original order, None if the provider didn't report some of them.
+        """
+
+        if len(self.segments_with_audio_timestamp) < len(self.text_segments):
+            return None
+        return [self.segments_with_audio_timestamp[i] for i in range(len(self.text_segments))]
@@ -1,33 +1,41 @@
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 
 from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
 
-from constants.files import PROCESSING_FILES_DIR_PATH
+from configs.env import TTS_SYNTHESIS_MODE
 from constants.log_tags import LogTag
-from services.text_to_speech.providers.elevenlabs import generate_audio_with_elevenlabs_provider
-from services.text_to_speech.providers.microsoft import generate_audio_with_microsoft_provider
+from services.overlay.segments_stretcher import SegmentsStretcher
+from services.overlay.time_stretch import get_stretch_ratio
+from services.text_to_speech.providers.elevenlabs import stream_audio_with_elevenlabs_provider
+from services.text_to_speech.providers.microsoft import stream_audio_with_microsoft_provider
+from services.text_to_speech.synthesize_text_segments import synthesize_text_segments, join_segments_audios
+from services.text_to_speech.synthesized_speech_stream import SynthesizedSpeechStream
 from models.text_segment import TextSegment, TextSegmentWithAudioTimestamp
 from models.voice_provider import VoiceProvider
 from configs.logger import catch_error, print_info_log
-from configs.tts_config import tts_config
+from configs.tts_config import voice_catalog
+from utils.silence import detect_nonsilent
 
 DELAY_TO_WAIT_IN_SECONDS = 5 * 60
 
-AUDIO_SEGMENT_PAUSE = 3000  # 3 sec
+# Segment boundaries come from provider markers (bookmarks, character alignment), so the pause is only a gap
+# between sentences. Silence detection, when markers are missing, looks for pauses longer than most of this gap.
+AUDIO_SEGMENT_PAUSE = 500
+# Segments synthesized separately have exact boundaries, so the pause only separates them when listening
+SYNTHESIZED_SEGMENTS_PAUSE = 100
 
 
 def add_audio_timestamps_to_segments(
-    audio_file_path: str,
+    audio: AudioSegment,
     text_segments: List[TextSegment],
     min_silence_len=2000,
     silence_thresh=-30,
     padding=500
 ):
     """
-    Detects pauses in an audio file and adds audio_timestamps to segments.
+    Detects pauses in an audio and adds audio_timestamps to segments.
 
-    :param audio_file_path: Path to the audio file.
+    :param audio: Synthesized audio of all segments.
     :param text_segments: A list of text segments with 'timestamp' and 'text' keys.
     :param min_silence_len: Minimum length of silence to consider as a pause in milliseconds.
     :param silence_thresh: Silence threshold in dB.
@@ -35,7 +43,6 @@ def add_audio_timestamps_to_segments(
     :return: A list of tuples where each tuple is (start, end) time of pauses.
     """
 
-    audio = AudioSegment.from_file(audio_file_path)
     speak_times = detect_nonsilent(
         audio_segment=audio,
         min_silence_len=min_silence_len,
@@ -70,6 +77,44 @@ def add_audio_timestamps_to_segments(
     #         print(f'Time gap discrepancy between segments {i} and {i + 1}: {time_diff}ms')
 
 
+def create_text_segments_with_audio_timestamps(
+    text_segments: List[TextSegment],
+    audio_timestamps: List[Tuple[float, float]]
+) -> List[TextSegmentWithAudioTimestamp]:
+    return [
+        TextSegmentWithAudioTimestamp(
+            **segment.dict(),
+            audio_timestamp=audio_timestamp
+        )
+        for segment, audio_timestamp in zip(text_segments, audio_timestamps)
+    ]
+
+
+def submit_overlong_segment(
+    segments_stretcher: SegmentsStretcher | None,
+    segment_index: int,
+    text_segment: TextSegment,
+    audio_duration_ms: float,
+    get_audio: Callable[[], AudioSegment]
+):
+    """
+    Give the segment to the stretcher of the overlay if its audio is longer than its time in the video,
+    so it's stretched while the rest of the text is still synthesized.
+
+    :param get_audio: Returns the audio of the segment, it's called only if the segment is stretched.
+    """
+
+    if segments_stretcher is None:
+        return
+
+    stretch_ratio = get_stretch_ratio(
+        video_duration_ms=(text_segment.original_timestamp[1] - text_segment.original_timestamp[0]) * 1000,
+        audio_duration_ms=audio_duration_ms
+    )
+    if stretch_ratio is not None:
+        segments_stretcher.submit(segment_index, get_audio(), stretch_ratio)
+
+
 def get_voice_by_id(voice_id: int):
     """
     Return voice from tts-configs by specified voice_id
@@ -79,11 +124,10 @@ def get_voice_by_id(voice_id: int):
     :returns: Voice object from tts-configs
     """
 
-    for voice_from_config in tts_config:
-        if voice_from_config.voice_id == voice_id:
-            return voice_from_config
+    voice_from_config = voice_catalog.get_voice_by_id(voice_id)
+    if voice_from_config is not None:
+        return voice_from_config
 
-    # If voice not returned after loop
     catch_error(
         tag=LogTag.GET_VOICE_BY_ID,
         error=Exception(f"Voice with id {voice_id} is not found in tts-config.")
@@ -94,23 +138,70 @@ def text_to_speech(
     text_segments: List[TextSegment],
     voice_id: int,
     project_id: str,
-    show_logs: bool = False
-):
-    translated_audio_file_path = f"{PROCESSING_FILES_DIR_PATH}/{project_id}-translated.mp3"
+    show_logs: bool = False,
+    segments_stretcher: SegmentsStretcher | None = None
+) -> Tuple[AudioSegment, List[TextSegmentWithAudioTimestamp]]:
+    """
+    Synthesize translated segments with the voice and find every segment in the synthesized audio.
+
+    Audio stays in memory in the working format of the pipeline (raw PCM), it's encoded only once
+    for the output file.
+
+    :param segments_stretcher: Stretcher of the overlay, overlong segments are given to it as soon as
+        they are synthesized.
+
+    :return: Synthesized audio and segments with their (start, end) in it in milliseconds.
+    """
+
     try:
         voice_from_config = get_voice_by_id(voice_id)
         original_voice_id = voice_from_config.original_id
         voice_provider = voice_from_config.provider
         voice_language = voice_from_config.languages[0]
 
+        if TTS_SYNTHESIS_MODE == "segments":
+            if show_logs:
+                print_info_log(
+                    tag=LogTag.TEXT_TO_SPEECH,
+                    message=f"Processing text to speech by segments for voice with id {voice_id} with {voice_provider}"
+                )
+            segments_audios = synthesize_text_segments(
+                text_segments=text_segments,
+                voice=voice_from_config,
+                project_id=project_id,
+                show_logs=show_logs,
+                on_segment_synthesized=lambda segment_index, segment_audio: submit_overlong_segment(
+                    segments_stretcher=segments_stretcher,
+                    segment_index=segment_index,
+                    text_segment=text_segments[segment_index],
+                    audio_duration_ms=segment_audio.frame_count() * 1000 / segment_audio.frame_rate,
+                    get_audio=lambda: segment_audio
+                )
+            )
+            translated_audio, audio_timestamps = join_segments_audios(
+                segments_audios=segments_audios,
+                pause_duration_ms=SYNTHESIZED_SEGMENTS_PAUSE
+            )
+
+            if show_logs:
+                print_info_log(
+                    tag=LogTag.TEXT_TO_SPEECH,
+                    message=f"Translated audio synthesized, duration {len(translated_audio)}ms"
+                )
+
+            translated_text_segments_with_audio_timestamp = create_text_segments_with_audio_timestamps(
+                text_segments=text_segments,
+                audio_timestamps=audio_timestamps
+            )
+            return translated_audio, translated_text_segments_with_audio_timestamp
+
         if voice_provider == VoiceProvider.ELEVEN_LABS:
             if show_logs:
                 print_info_log(
                     tag=LogTag.TEXT_TO_SPEECH,
                     message=f"Processing text to speech for voice with id {voice_id} with {voice_provider}"
                 )
-            generate_audio_with_elevenlabs_provider(
-                output_audio_file_path=translated_audio_file_path,
+            synthesis_events = stream_audio_with_elevenlabs_provider(
                 text_segments=text_segments,
                 voice_id=original_voice_id,
                 pause_duration_ms=AUDIO_SEGMENT_PAUSE,
@@ -123,8 +214,7 @@ def text_to_speech(
                     tag=LogTag.TEXT_TO_SPEECH,
                     message=f"Processing text to speech for voice with id {voice_id} with {voice_provider}"
                 )
-            generate_audio_with_microsoft_provider(
-                output_audio_file_path=translated_audio_file_path,
+            synthesis_events = stream_audio_with_microsoft_provider(
                 text_segments=text_segments,
                 voice_id=original_voice_id,
                 language=voice_language,
@@ -139,17 +229,50 @@ def text_to_speech(
                 project_id=project_id
             )
 
+        # Segments are taken from the stream while the rest of the text is still synthesized
+        speech_stream = SynthesizedSpeechStream(
+            events=synthesis_events,
+            text_segments=text_segments
+        )
+        for segment_index, segment_with_audio_timestamp in speech_stream:
+            if show_logs:
+                print_info_log(
+                    tag=LogTag.TEXT_TO_SPEECH,
+                    message=f"Segment synthesized at {segment_with_audio_timestamp.audio_timestamp}, "
+                            f"{speech_stream.get_received_duration_ms():.0f}ms of audio received"
+                )
+            audio_start_time, audio_end_time = segment_with_audio_timestamp.audio_timestamp
+            submit_overlong_segment(
+                segments_stretcher=segments_stretcher,
+                segment_index=segment_index,
+                text_segment=segment_with_audio_timestamp,
+                audio_duration_ms=audio_end_time - audio_start_time,
+                get_audio=lambda: speech_stream.slice_audio(audio_start_time, audio_end_time)
+            )
+        translated_audio = speech_stream.get_audio()
+
         if show_logs:
             print_info_log(
                 tag=LogTag.TEXT_TO_SPEECH,
-                message=f"Translated audio save to {translated_audio_file_path}"
+                message=f"Translated audio synthesized, duration {len(translated_audio)}ms"
             )
 
-        translated_text_segments_with_audio_timestamp = add_audio_timestamps_to_segments(
-            audio_file_path=translated_audio_file_path,
-            text_segments=text_segments
-        )
-        return translated_audio_file_path, translated_text_segments_with_audio_timestamp
+        translated_text_segments_with_audio_timestamp = speech_stream.get_segments_with_audio_timestamp()
+        if translated_text_segments_with_audio_timestamp is None:
+            print_info_log(
+                tag=LogTag.TEXT_TO_SPEECH,
+                message="Provider did not return segments alignment, detecting segments by silence..."
+            )
+            # Segments given to the stretcher have timestamps of the alignment, not the ones found by silence
+            if segments_stretcher is not None:
+                segments_stretcher.clear()
+            translated_text_segments_with_audio_timestamp = add_audio_timestamps_to_segments(
+                audio=translated_audio,
+                text_segments=text_segments,
+                min_silence_len=int(AUDIO_SEGMENT_PAUSE * 0.8),
+                padding=AUDIO_SEGMENT_PAUSE // 5
+            )
+        return translated_audio, translated_text_segments_with_audio_timestamp
 
     except Exception as e:
         catch_error(
@@ -191,11 +314,11 @@ if __name__ == "__main__":
     # test_voice_id = 559  # 11labs voice
     test_voice_id = 165  # microsoft voice
     test_project_id = "07fsfECkwma6fVTDyqQf"
-    test_translated_audio_file_path, test_translated_text_segments_with_audio_timestamp = text_to_speech(
+    test_translated_audio, test_translated_text_segments_with_audio_timestamp = text_to_speech(
         text_segments=test_text_segments,
         voice_id=test_voice_id,
         project_id=test_project_id,
         show_logs=True
     )
-    print(test_translated_audio_file_path)
+    test_translated_audio.export("translated-test.mp3", format="mp3")
     print(test_translated_text_segments_with_audio_timestamp)
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+
+from configs.env import TTS_CACHE_MAX_BYTES, TTS_SHARED_CACHE_BLOB_PREFIX
+from configs.logger import print_info_log
+from constants.files import CACHE_FILES_DIR_PATH
+from constants.log_tags import LogTag
+from utils.text import normalize_text
+
+TTS_CACHE_DIR_PATH = f"{CACHE_FILES_DIR_PATH}/tts"
+TTS_CACHE_FILE_EXTENSION = "zz"
+
+# Share of the size limit which stays after eviction, so eviction doesn't run on every insert
+EVICTION_KEEP_RATIO = 0.9
+
+
+def get_tts_cache_key(
+    provider: str,
+    voice_id: str,
+    model: str,
+    language: str,
+    text: str,
+    speaking_rate: float = 1.0
+) -> str:
+    key_source = "\n".join([provider, voice_id, model, language.lower(), normalize_text(text)])
+    # Keys of normal rate stay the same as before speaking rate was added
+    if speaking_rate != 1.0:
+        key_source += f"\n{speaking_rate}"
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class TTSCacheJobStats:
+    """
+    TTS cache hits, misses and saved bytes of synthesized audio of one job.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def record_hit(self, bytes_count: int):
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += bytes_count
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            requests_count = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests_count if requests_count else 0.0,
+                "bytes_saved": self.bytes_saved
+            }
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    Audio is stored zlib-compressed on local disk, the least recently used files are evicted when the cache
+    is bigger than max_bytes. If shared_blob_prefix is set, audio is also stored in Firebase bucket,
+    so instances share synthesized audio with each other.
+    """
+
+    def __init__(self, dir_path: str, max_bytes: int, shared_blob_prefix: str | None):
+        self.dir_path = dir_path
+        self.max_bytes = max_bytes
+        self.shared_blob_prefix = shared_blob_prefix
+        self.lock = threading.Lock()
+        self.stats = TTSCacheJobStats()
+
+        os.makedirs(dir_path, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(file_path) for file_path, _ in self.list_files())
+
+    def list_files(self):
+        for entry in os.scandir(self.dir_path):
+            if entry.is_file() and entry.name.endswith(f".{TTS_CACHE_FILE_EXTENSION}"):
+                yield entry.path, entry.stat()
+
+    def get_file_path(self, key: str) -> str:
+        return f"{self.dir_path}/{key}.{TTS_CACHE_FILE_EXTENSION}"
+
+    def get_shared_bucket(self):
+        # Firebase is initialized on import, so it's imported only when the shared tier is used
+        from configs.firebase import bucket
+        return bucket
+
+    def get(self, key: str, job_stats: TTSCacheJobStats | None = None) -> bytes | None:
+        """
+        Return cached audio by key from local disk or from the shared tier, None if it's not cached.
+        """
+
+        compressed_audio = self.read_local(key)
+
+        if compressed_audio is None and self.shared_blob_prefix:
+            try:
+                blob = self.get_shared_bucket().blob(f"{self.shared_blob_prefix}/{key}.{TTS_CACHE_FILE_EXTENSION}")
+                if blob.exists():
+                    compressed_audio = blob.download_as_bytes()
+                    self.write_local(key, compressed_audio)
+            except Exception as e:
+                # Cache must not fail the job
+                print_info_log(
+                    tag=LogTag.TTS_CACHE,
+                    message=f"Shared TTS cache is not available: {str(e)}"
+                )
+
+        if compressed_audio is None:
+            for stats in [self.stats, job_stats]:
+                if stats is not None:
+                    stats.record_miss()
+            return None
+
+        audio = zlib.decompress(compressed_audio)
+        for stats in [self.stats, job_stats]:
+            if stats is not None:
+                stats.record_hit(len(audio))
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        compressed_audio = zlib.compress(audio)
+        self.write_local(key, compressed_audio)
+
+        if self.shared_blob_prefix:
+            try:
+                blob = self.get_shared_bucket().blob(f"{self.shared_blob_prefix}/{key}.{TTS_CACHE_FILE_EXTENSION}")
+                blob.upload_from_string(compressed_audio, content_type="application/octet-stream")
+            except Exception as e:
+                print_info_log(
+                    tag=LogTag.TTS_CACHE,
+                    message=f"Audio is not saved to shared TTS cache: {str(e)}"
+                )
+
+    def read_local(self, key: str) -> bytes | None:
+        file_path = self.get_file_path(key)
+        try:
+            with open(file_path, "rb") as f:
+                compressed_audio = f.read()
+            # Modification time is the last use time for eviction
+            os.utime(file_path)
+            return compressed_audio
+        except FileNotFoundError:
+            return None
+
+    def write_local(self, key: str, compressed_audio: bytes):
+        file_path = self.get_file_path(key)
+        previous_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        # Write to temp file and rename, so readers never see a partly written file
+        with tempfile.NamedTemporaryFile(dir=self.dir_path, suffix=".tmp", delete=False) as temp_file:
+            temp_file.write(compressed_audio)
+        os.replace(temp_file.name, file_path)
+
+        with self.lock:
+            self.total_bytes += len(compressed_audio) - previous_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        files = sorted(self.list_files(), key=lambda file: file[1].st_mtime)
+        for file_path, file_stat in files:
+            if self.total_bytes <= self.max_bytes * EVICTION_KEEP_RATIO:
+                break
+            try:
+                os.remove(file_path)
+                self.total_bytes -= file_stat.st_size
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats.get_stats(),
+            "size_bytes": self.total_bytes
+        }
+
+
+tts_cache = TTSCache(
+    dir_path=TTS_CACHE_DIR_PATH,
+    max_bytes=TTS_CACHE_MAX_BYTES,
+    shared_blob_prefix=TTS_SHARED_CACHE_BLOB_PREFIX
+)
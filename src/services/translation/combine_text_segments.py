@@ -1,18 +1,18 @@
-from typing import List
+import json
+from typing import Dict
 
 from configs.logger import print_info_log
 from constants.log_tags import LogTag
-from models.text_segment import TextSegment
 
 
-def combine_text_segments(text_segments: List[TextSegment], show_logs: bool) -> str:
+def combine_text_segments(text_segments: Dict[str, str], show_logs: bool) -> str:
     """
-    Combine the given TextSegments to the string, where segments are divided by [ and ] symbols.
+    Combine the given text segments to the JSON object, where keys are segment ids and values are segment texts.
 
-    :param text_segments: The list of dictionaries with text segments and timestamps.
+    :param text_segments: The dictionary with segment ids and texts.
     :param show_logs: Determines whether to display logs while combining.
 
-    :return: The string, where all text segments are divided by \\n symbol.
+    :return: The JSON string, for example {"0": "First segment", "1": "Second segment"}.
     """
 
     if show_logs:
@@ -21,9 +21,7 @@ def combine_text_segments(text_segments: List[TextSegment], show_logs: bool) ->
             message=f"Combining text chunks: {text_segments}"
         )
 
-    formatted_text = ""
-    for segment in text_segments:
-        formatted_text += f"[{segment.text}]"
+    formatted_text = json.dumps(text_segments, ensure_ascii=False)
 
     if show_logs:
         print_info_log(
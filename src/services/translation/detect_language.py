@@ -0,0 +1,110 @@
+from functools import lru_cache
+from typing import List
+
+from lingua import Language, LanguageDetector, LanguageDetectorBuilder
+
+from configs.logger import print_info_log, catch_error
+from constants.log_tags import LogTag
+from models.text_segment import TextSegment
+
+# Shorter texts are detected unreliably, such segments follow the language of the whole text
+MIN_DETECTION_TEXT_LENGTH = 20
+SAME_LANGUAGE_MIN_CONFIDENCE = 0.9
+
+
+@lru_cache(maxsize=None)
+def get_language_detector() -> LanguageDetector:
+    # Low accuracy mode uses only trigram models - it's fast and good enough for sentences
+    return LanguageDetectorBuilder.from_all_languages().with_low_accuracy_mode().build()
+
+
+def get_language_by_name(language: str) -> Language | None:
+    """
+    Return lingua Language by its english name, for example "Russian" or "english".
+    """
+
+    return getattr(Language, language.strip().upper().replace(" ", "_"), None)
+
+
+def detect_text_language(text: str) -> str | None:
+    """
+    Return the lowercase english name of the text language, for example "russian", None if it's not detected.
+    """
+
+    detected_language = get_language_detector().detect_language_of(text)
+    return detected_language.name.lower() if detected_language is not None else None
+
+
+def detect_segments_in_language(
+    text_segments: List[TextSegment],
+    language: str,
+    project_id: str,
+    show_logs: bool = False
+) -> List[bool]:
+    """
+    Detect which text segments are already in the specified language, locally without any API.
+
+    :param text_segments: The list of TextSegments to check.
+    :param language: The target language of translation.
+    :param project_id: The id of the processing project.
+    :param show_logs: Determines whether to display logs while detecting.
+
+    :return: The list of flags, True if the segment is already in the language.
+    """
+
+    try:
+        target_language = get_language_by_name(language)
+        if target_language is None:
+            if show_logs:
+                print_info_log(
+                    tag=LogTag.DETECT_LANGUAGE,
+                    message=f"Language {language} is not supported by language detector."
+                )
+            return [False] * len(text_segments)
+
+        language_detector = get_language_detector()
+        combined_text = " ".join(segment.text for segment in text_segments)
+        text_is_in_language = language_detector.compute_language_confidence(
+            combined_text,
+            target_language
+        ) >= SAME_LANGUAGE_MIN_CONFIDENCE
+
+        segments_in_language = []
+        for segment in text_segments:
+            if len(segment.text.strip()) < MIN_DETECTION_TEXT_LENGTH:
+                segments_in_language.append(text_is_in_language)
+                continue
+
+            segment_confidence = language_detector.compute_language_confidence(segment.text, target_language)
+            segments_in_language.append(segment_confidence >= SAME_LANGUAGE_MIN_CONFIDENCE)
+
+        if show_logs:
+            print_info_log(
+                tag=LogTag.DETECT_LANGUAGE,
+                message=f"Segments already in {language}: {sum(segments_in_language)} of {len(text_segments)}"
+            )
+
+        return segments_in_language
+
+    except Exception as e:
+        catch_error(
+            tag=LogTag.DETECT_LANGUAGE,
+            error=e,
+            project_id=project_id
+        )
+
+
+if __name__ == "__main__":
+    test_text_segments = [
+        TextSegment(original_timestamp=(0.0, 3.36), text=' I wake up in the morning and I want to reach for my phone,'),
+        TextSegment(original_timestamp=(3.36, 5.74), text='но я знаю, что даже если бы я прибавил яркость'),
+        TextSegment(original_timestamp=(5.74, 7.0), text=' on that phone screen,'),
+        TextSegment(original_timestamp=(7.0, 8.0), text=' Да.'),
+    ]
+    test_segments_in_language = detect_segments_in_language(
+        text_segments=test_text_segments,
+        language="Russian",
+        project_id="07fsfECkwma6fVTDyqQf",
+        show_logs=True
+    )
+    print(test_segments_in_language)
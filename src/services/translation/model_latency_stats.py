@@ -0,0 +1,59 @@
+import threading
+from collections import deque
+from statistics import median
+from typing import Deque, Dict, Tuple
+
+# Latency samples kept for each model
+LATENCY_WINDOW_SIZE = 50
+
+# Initial estimates until the model has its own samples: (request overhead seconds, seconds per output token)
+DEFAULT_LATENCY_ESTIMATES = {
+    "gpt-4": (1.5, 0.06),
+    "gpt-3.5-turbo-16k": (0.5, 0.015),
+}
+FALLBACK_LATENCY_ESTIMATE = (1.5, 0.06)
+
+
+class ModelLatencyStats:
+    """
+    Rolling per-model statistics of GPT response time used to predict latency of the next request.
+    """
+
+    def __init__(self, window_size: int):
+        self.lock = threading.Lock()
+        self.window_size = window_size
+        self.samples: Dict[str, Deque[Tuple[int, float]]] = {}
+
+    def record(self, model: str, output_tokens_count: int, seconds: float):
+        with self.lock:
+            self.samples.setdefault(model, deque(maxlen=self.window_size)).append((output_tokens_count, seconds))
+
+    def estimate_seconds(self, model: str, output_tokens_count: int) -> float:
+        """
+        Predict response time of the model for the answer with the given tokens count.
+        """
+
+        overhead_seconds, seconds_per_token = DEFAULT_LATENCY_ESTIMATES.get(model, FALLBACK_LATENCY_ESTIMATE)
+        with self.lock:
+            samples = list(self.samples.get(model, []))
+
+        if samples:
+            seconds_per_token = median(
+                max(seconds - overhead_seconds, 0) / max(tokens_count, 1) for tokens_count, seconds in samples
+            )
+
+        return overhead_seconds + seconds_per_token * output_tokens_count
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                model: {
+                    "requests": len(samples),
+                    "median_seconds": median(seconds for _, seconds in samples),
+                    "median_seconds_per_token": median(seconds / max(tokens, 1) for tokens, seconds in samples),
+                }
+                for model, samples in self.samples.items() if samples
+            }
+
+
+model_latency_stats = ModelLatencyStats(window_size=LATENCY_WINDOW_SIZE)
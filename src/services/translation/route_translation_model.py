@@ -0,0 +1,85 @@
+from typing import List
+
+from configs.env import TRANSLATION_OUTPUT_TOKENS_RATIO
+from models.translation_model import TranslationModel
+from services.translation.model_latency_stats import model_latency_stats
+from services.translation.split_text_to_chunks import CONTEXT_TOKENS_COUNT, DEFAULT_CONTEXT_TOKENS_COUNT
+
+# Models in order of translation quality, the first one is used when the job has no budget
+TRANSLATION_MODELS: List[TranslationModel] = [
+    TranslationModel(
+        name="gpt-4",
+        input_cost_per_1k_tokens=0.03,
+        output_cost_per_1k_tokens=0.06,
+    ),
+    TranslationModel(
+        name="gpt-3.5-turbo-16k",
+        input_cost_per_1k_tokens=0.003,
+        output_cost_per_1k_tokens=0.004,
+        # The fast tier translates well only between widely used languages
+        languages=[
+            "english", "spanish", "french", "german", "italian", "portuguese", "dutch", "polish",
+            "russian", "ukrainian", "turkish", "chinese", "japanese", "korean",
+        ],
+    ),
+]
+
+DEFAULT_TRANSLATION_MODEL = TRANSLATION_MODELS[0].name
+
+
+def route_translation_model(
+    chunk_tokens_count: int,
+    prompt_tokens_count: int,
+    source_language: str | None,
+    target_language: str,
+    latency_budget_seconds: float | None = None,
+    cost_budget_usd: float | None = None
+) -> str:
+    """
+    Choose the model to translate one text chunk.
+
+    The best model which fits into the chunk budgets and supports the language pair is chosen.
+    If no model fits into the budgets, the fastest model is chosen.
+
+    :param chunk_tokens_count: Tokens count of the text chunk.
+    :param prompt_tokens_count: Tokens count of the prompt without text chunk.
+    :param source_language: The language of the text chunk, None if it's unknown.
+    :param target_language: The target language of translation.
+    :param latency_budget_seconds: Time the chunk translation may take, None for no limit.
+    :param cost_budget_usd: Money the chunk translation may cost, None for no limit.
+
+    :return: The name of the model.
+    """
+
+    if latency_budget_seconds is None and cost_budget_usd is None:
+        return DEFAULT_TRANSLATION_MODEL
+
+    output_tokens_count = int(chunk_tokens_count * TRANSLATION_OUTPUT_TOKENS_RATIO)
+    language_pair = [target_language.lower()] + ([source_language.lower()] if source_language else [])
+
+    fitting_models = [
+        model for model in TRANSLATION_MODELS
+        if prompt_tokens_count + chunk_tokens_count + output_tokens_count
+        <= CONTEXT_TOKENS_COUNT.get(model.name, DEFAULT_CONTEXT_TOKENS_COUNT)
+    ] or TRANSLATION_MODELS[:1]
+
+    for model in fitting_models:
+        if model.languages is not None and not all(language in model.languages for language in language_pair):
+            continue
+
+        estimated_seconds = model_latency_stats.estimate_seconds(model.name, output_tokens_count)
+        estimated_cost_usd = (
+            chunk_tokens_count * model.input_cost_per_1k_tokens
+            + output_tokens_count * model.output_cost_per_1k_tokens
+        ) / 1000
+
+        fits_latency_budget = latency_budget_seconds is None or estimated_seconds <= latency_budget_seconds
+        fits_cost_budget = cost_budget_usd is None or estimated_cost_usd <= cost_budget_usd
+        if fits_latency_budget and fits_cost_budget:
+            return model.name
+
+    # Budget can't be met, so at least make it as fast as possible
+    return min(
+        fitting_models,
+        key=lambda model: model_latency_stats.estimate_seconds(model.name, output_tokens_count)
+    ).name
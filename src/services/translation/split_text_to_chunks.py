@@ -1,43 +1,105 @@
-from typing import List
+import json
+from functools import lru_cache
+from typing import Dict, List
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import tiktoken
 
+from configs.env import TRANSLATION_OUTPUT_TOKENS_RATIO
 from configs.logger import print_info_log, catch_error
 from constants.log_tags import LogTag
 
-CONTEXT_TOKENS_COUNT = 4000
+# Context window of the model, it's shared by the prompt, the text chunk and the translated text chunk
+CONTEXT_TOKENS_COUNT = {
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+}
+DEFAULT_CONTEXT_TOKENS_COUNT = 4096
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=CONTEXT_TOKENS_COUNT,
-    chunk_overlap=0,
-    separators=["."]
-)
 
+@lru_cache(maxsize=None)
+def get_model_encoding(model: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model)
 
-def split_text_to_chunks(text: str, project_id: str, show_logs: bool) -> List[str]:
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_model_encoding(model).encode(text))
+
+
+def get_chunk_tokens_budget(model: str, prompt_tokens_count: int) -> int:
+    """
+    Return how many tokens of source text fit in one request, leaving room for the translated text.
+
+    :param model: The model which translates chunks.
+    :param prompt_tokens_count: Tokens count of the prompt without text chunk.
+
+    :return: Maximum tokens count of one text chunk.
+    """
+
+    context_tokens_count = CONTEXT_TOKENS_COUNT.get(model, DEFAULT_CONTEXT_TOKENS_COUNT)
+    # Translation takes about TRANSLATION_OUTPUT_TOKENS_RATIO times more tokens than the source text
+    return int((context_tokens_count - prompt_tokens_count) / (1 + TRANSLATION_OUTPUT_TOKENS_RATIO))
+
+
+def split_text_to_chunks(
+    text_segments: Dict[str, str],
+    model: str,
+    prompt_tokens_count: int,
+    project_id: str,
+    show_logs: bool
+) -> List[Dict[str, str]]:
     """
-    Splits a given text into chunks.
+    Packs whole text segments into chunks which fit into the model context.
+
+    Segments are counted in model tokens as they are sent to the model - as "id": "text" pairs of JSON object.
+    A segment is never split, a segment bigger than the budget becomes a chunk on its own.
 
-    :param text: The text to split.
+    :param text_segments: The dictionary with segment ids and texts to pack, in timeline order.
+    :param model: The model which translates chunks.
+    :param prompt_tokens_count: Tokens count of the prompt without text chunk.
     :param project_id: The id of the processing project.
     :param show_logs: Determines whether to display logs while splitting text.
 
-    :return: The list of string text chunks.
+    :return: The list of chunks, each chunk is the dictionary of consecutive segments.
     """
 
     try:
+        chunk_tokens_budget = get_chunk_tokens_budget(
+            model=model,
+            prompt_tokens_count=prompt_tokens_count
+        )
+
         if show_logs:
             print_info_log(
                 tag=LogTag.SPLIT_TEXT_TO_CHUNKS,
-                message=f"Splitting text by {CONTEXT_TOKENS_COUNT} tokens..."
+                message=f"Splitting text by {chunk_tokens_budget} tokens..."
             )
 
-        text_chunks = text_splitter.split_text(text)
+        text_chunks: List[Dict[str, str]] = []
+        current_chunk: Dict[str, str] = {}
+        current_chunk_tokens_count = 0
+
+        for segment_id, segment_text in text_segments.items():
+            segment_tokens_count = count_tokens(
+                f"{json.dumps(segment_id)}: {json.dumps(segment_text, ensure_ascii=False)}, ",
+                model
+            )
+
+            if current_chunk and current_chunk_tokens_count + segment_tokens_count > chunk_tokens_budget:
+                text_chunks.append(current_chunk)
+                current_chunk = {}
+                current_chunk_tokens_count = 0
+
+            current_chunk[segment_id] = segment_text
+            current_chunk_tokens_count += segment_tokens_count
+
+        if current_chunk:
+            text_chunks.append(current_chunk)
 
         if show_logs:
             print_info_log(
                 tag=LogTag.SPLIT_TEXT_TO_CHUNKS,
-                message=f"Text splitting completed."
+                message=f"Text splitting completed, {len(text_chunks)} chunks."
             )
 
         return text_chunks
@@ -1,18 +1,38 @@
-import re
-from typing import List
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
+from configs.env import TRANSLATION_MAX_CONCURRENCY, TRANSLATION_REPAIR_MAX_ATTEMPTS
 from configs.logger import catch_error, print_info_log
 from constants.log_tags import LogTag
 from models.text_segment import TextSegment
 from services.translation.combine_text_segments import combine_text_segments
-from services.translation.split_text_to_chunks import split_text_to_chunks
-from services.translation.translate_text_chunk_with_gpt import translate_text_chunk_with_gpt
+from services.translation.detect_language import detect_segments_in_language, detect_text_language
+from services.translation.route_translation_model import (
+    route_translation_model,
+    DEFAULT_TRANSLATION_MODEL,
+    TRANSLATION_MODELS
+)
+from services.translation.split_text_to_chunks import split_text_to_chunks, count_tokens
+from services.translation.translate_text_chunk_with_gpt import (
+    translate_text_chunk_with_gpt,
+    translation_gpt_prompt,
+    TRANSLATION_PROMPT_VERSION
+)
+from services.translation.translation_memory import translation_memory
+from services.translation.validate_translated_segments import (
+    parse_translated_segments,
+    validate_translated_segments
+)
 
 
 def translate_text(
     text_segments: List[TextSegment],
     language: str,
     project_id: str,
+    latency_budget_seconds: float | None = None,
+    cost_budget_usd: float | None = None,
     show_logs: bool = False
 ) -> List[TextSegment]:
     """
@@ -21,100 +41,235 @@ def translate_text(
     :param language: The target language for translation.
     :param text_segments: The list of TextSegments with original text segments and timestamps.
     :param project_id: The id of the processing project.
+    :param latency_budget_seconds: Time the translation may take, faster models are used to fit it.
+    :param cost_budget_usd: Money the translation may cost, cheaper models are used to fit it.
     :param show_logs: Determines whether to display logs while translating.
 
     :returns: The list of dictionaries with translated text segments and timestamps.
     """
 
     try:
-        combined_text = combine_text_segments(
+        # Segments which are already in the target language are not sent to the model
+        segments_in_language = detect_segments_in_language(
             text_segments=text_segments,
+            language=language,
+            project_id=project_id,
             show_logs=show_logs
         )
-        text_chunks = split_text_to_chunks(
-            text=combined_text,
+        if all(segments_in_language):
+            print_info_log(
+                tag=LogTag.TRANSLATE_TEXT,
+                message=f"Text is already in {language}, translation is skipped."
+            )
+            return text_segments
+
+        segments_to_translate = [
+            segment for segment, segment_in_language in zip(text_segments, segments_in_language)
+            if not segment_in_language
+        ]
+
+        # Take translations of already translated segments from translation memory,
+        # translations of faster models are accepted only if the job has a budget
+        job_has_budget = latency_budget_seconds is not None or cost_budget_usd is not None
+        cached_translations = translation_memory.get_many(
+            texts=[segment.text for segment in segments_to_translate],
+            language=language,
+            models=[model.name for model in TRANSLATION_MODELS] if job_has_budget else [DEFAULT_TRANSLATION_MODEL],
+            prompt_version=TRANSLATION_PROMPT_VERSION
+        )
+        missed_text_segments = [
+            segment for segment, cached_translation in zip(segments_to_translate, cached_translations)
+            if cached_translation is None
+        ]
+
+        hits_count = len(segments_to_translate) - len(missed_text_segments)
+        print_info_log(
+            tag=LogTag.TRANSLATION_MEMORY,
+            message=f"Translation memory hits: {hits_count} of {len(segments_to_translate)} segments, "
+                    f"total hit rate: {translation_memory.get_stats()['hit_rate']:.2f}"
+        )
+
+        # Send only cache misses to the model
+        translated_missed_segments = translate_missed_text_segments(
+            text_segments=missed_text_segments,
+            language=language,
             project_id=project_id,
+            latency_budget_seconds=latency_budget_seconds,
+            cost_budget_usd=cost_budget_usd,
             show_logs=show_logs
         )
 
-        if show_logs:
+        # Splice translations from memory and from the model back into their places
+        translated_missed_segments_iterator = iter(translated_missed_segments)
+        for segment, cached_translation in zip(segments_to_translate, cached_translations):
+            if cached_translation is not None:
+                segment.text = cached_translation
+            else:
+                segment.text = next(translated_missed_segments_iterator)
+
+        return text_segments
+
+    except Exception as e:
+        catch_error(
+            tag=LogTag.TRANSLATE_TEXT,
+            error=e,
+            project_id=project_id
+        )
+
+
+def translate_missed_text_segments(
+    text_segments: List[TextSegment],
+    language: str,
+    project_id: str,
+    latency_budget_seconds: float | None,
+    cost_budget_usd: float | None,
+    show_logs: bool
+) -> List[str]:
+    """
+    Translate text segments with the model and save translations to translation memory.
+
+    Segments are sent with ids, the answer is validated by ids and only missing or merged segments are requested again.
+    Segments which are still not translated after all repair attempts keep the original text.
+    The model of each chunk is chosen by the job budgets, the chunk size and the language pair.
+
+    :returns: The list of translated texts in the order of text_segments.
+    """
+
+    if not text_segments:
+        return []
+
+    source_segments = {str(segment_index): segment.text for segment_index, segment in enumerate(text_segments)}
+    translated_segments: Dict[str, str] = {}
+    translated_segments_models: Dict[str, str] = {}
+    pending_segments = source_segments
+    prompt_tokens_count = count_tokens(
+        translation_gpt_prompt.format(language=language, text_chunk=""),
+        DEFAULT_TRANSLATION_MODEL
+    )
+
+    # Repair rounds share the latency budget of the job, every round gets the time left after the previous ones
+    latency_deadline = time.monotonic() + latency_budget_seconds if latency_budget_seconds is not None else None
+
+    for attempt in range(1 + TRANSLATION_REPAIR_MAX_ATTEMPTS):
+        if attempt > 0:
             print_info_log(
                 tag=LogTag.TRANSLATE_TEXT,
-                message=f"Translating text chunks - {text_chunks}"
+                message=f"Repair attempt {attempt}: translating segments {list(pending_segments.keys())} again..."
             )
 
-        translated_text_chunks = []
-        for chuck in text_chunks:
-            translated_chunk = translate_text_chunk_with_gpt(
-                language=language,
-                text_chunk=chuck,
-                project_id=project_id,
+        segment_chunks = split_text_to_chunks(
+            text_segments=pending_segments,
+            model=DEFAULT_TRANSLATION_MODEL,
+            prompt_tokens_count=prompt_tokens_count,
+            project_id=project_id,
+            show_logs=show_logs
+        )
+        text_chunks = [
+            combine_text_segments(
+                text_segments=segment_chunk,
                 show_logs=show_logs
             )
-            translated_text_chunks.append(translated_chunk)
+            for segment_chunk in segment_chunks
+        ]
 
-        if show_logs:
-            print_info_log(
-                tag=LogTag.TRANSLATE_TEXT,
-                message=f"Translated text chunks: {translated_text_chunks}"
-            )
-            print_info_log(
-                tag=LogTag.TRANSLATE_TEXT,
-                message=f"Splitting translated chunks to segments by [ and ] symbols..."
+        # Chunks are translated concurrently, so the job takes as long as the slowest chunk of each wave
+        chunks_tokens_counts = [count_tokens(text_chunk, DEFAULT_TRANSLATION_MODEL) for text_chunk in text_chunks]
+        waves_count = math.ceil(len(text_chunks) / TRANSLATION_MAX_CONCURRENCY)
+        # An exhausted budget routes chunks to the fastest model
+        wave_latency_budget_seconds = (
+            max(latency_deadline - time.monotonic(), 0) / waves_count if latency_deadline is not None else None
+        )
+        chunks_models = [
+            route_translation_model(
+                chunk_tokens_count=chunk_tokens_count,
+                prompt_tokens_count=prompt_tokens_count,
+                source_language=detect_text_language(" ".join(segment_chunk.values())),
+                target_language=language,
+                latency_budget_seconds=wave_latency_budget_seconds,
+                cost_budget_usd=(
+                    cost_budget_usd * chunk_tokens_count / sum(chunks_tokens_counts) if cost_budget_usd else None
+                )
             )
-
-        # Split translated text to get original segments
-        final_translated_text = "".join(translated_text_chunks)
-        translated_text_segments: List[str] = re.findall(r"[^\[\]]+", final_translated_text)
+            for segment_chunk, chunk_tokens_count in zip(segment_chunks, chunks_tokens_counts)
+        ]
 
         if show_logs:
             print_info_log(
                 tag=LogTag.TRANSLATE_TEXT,
-                message=f"Split translated text segments: {translated_text_segments}"
+                message=f"Translating text chunks with models {chunks_models} - {text_chunks}"
             )
 
-        original_segments_count = len(text_segments)
-        translated_segments_count = len(translated_text_segments)
-
-        # Check if segments count is different
-        if original_segments_count != translated_segments_count:
-            # for i in range(min(original_segments_count, translated_segments_count)):
-            #     print_info_log(
-            #         tag=LogTag.TRANSLATE_TEXT,
-            #         message=f"Original segment: {text_segments[i]}"
-            #     )
-            #     print_info_log(
-            #         tag=LogTag.TRANSLATE_TEXT,
-            #         message=f"Translated segment: {translated_text_segments[i]}\n"
-            #     )
+        # Translate chunks concurrently, map() returns translations in the original order of chunks
+        with ThreadPoolExecutor(max_workers=TRANSLATION_MAX_CONCURRENCY) as executor:
+            translated_text_chunks = list(executor.map(
+                lambda text_chunk, chunk_model: translate_text_chunk_with_gpt(
+                    language=language,
+                    text_chunk=text_chunk,
+                    model=chunk_model,
+                    project_id=project_id,
+                    show_logs=show_logs
+                ),
+                text_chunks,
+                chunks_models
+            ))
 
+        if show_logs:
             print_info_log(
                 tag=LogTag.TRANSLATE_TEXT,
-                message=f"Original count: {original_segments_count}"
-            )
-            print_info_log(
-                tag=LogTag.TRANSLATE_TEXT,
-                message=f"Translated count: {translated_segments_count}"
+                message=f"Translated text chunks: {translated_text_chunks}"
             )
-            print_info_log(
-                tag=LogTag.TRANSLATE_TEXT,
-                message=f"Segments count not match.\n"
+
+        failed_segment_ids: List[str] = []
+        for segment_chunk, translated_text_chunk, chunk_model in zip(
+            segment_chunks,
+            translated_text_chunks,
+            chunks_models
+        ):
+            translated_chunk_segments = parse_translated_segments(translated_text_chunk)
+            validation = validate_translated_segments(
+                text_segments=segment_chunk,
+                translated_segments=translated_chunk_segments
             )
-            # raise Exception(f"Segments count not match.")
 
-        for segment_index in range(min(original_segments_count, translated_segments_count)):
-            translated_segment = translated_text_segments[segment_index]
-            text_segments[segment_index].text = translated_segment
+            if not validation.is_valid or validation.extra_ids:
+                print_info_log(
+                    tag=LogTag.TRANSLATE_TEXT,
+                    message=f"Segments not match. Missing: {validation.missing_ids}, "
+                            f"merged: {validation.merged_ids}, extra: {validation.extra_ids}"
+                )
 
-        return text_segments
+            for segment_id in segment_chunk:
+                if segment_id in validation.failed_ids:
+                    failed_segment_ids.append(segment_id)
+                elif segment_id in translated_chunk_segments:
+                    translated_segments[segment_id] = translated_chunk_segments[segment_id]
+                    translated_segments_models[segment_id] = chunk_model
 
-    except Exception as e:
-        catch_error(
+        pending_segments = {segment_id: source_segments[segment_id] for segment_id in failed_segment_ids}
+        if not pending_segments:
+            break
+
+    if pending_segments:
+        print_info_log(
             tag=LogTag.TRANSLATE_TEXT,
-            error=e,
-            project_id=project_id
+            message=f"Segments {list(pending_segments.keys())} are not translated, original text is kept."
         )
 
+    # Only segments translated by the model are saved, segments with original text must be translated next time
+    for model in set(translated_segments_models.values()):
+        model_segment_ids = [
+            segment_id for segment_id, segment_model in translated_segments_models.items() if segment_model == model
+        ]
+        translation_memory.put_many(
+            texts=[source_segments[segment_id] for segment_id in model_segment_ids],
+            translations=[translated_segments[segment_id] for segment_id in model_segment_ids],
+            language=language,
+            model=model,
+            prompt_version=TRANSLATION_PROMPT_VERSION
+        )
+
+    return [translated_segments.get(segment_id, source_text) for segment_id, source_text in source_segments.items()]
+
 
 if __name__ == "__main__":
     test_text_segments = [
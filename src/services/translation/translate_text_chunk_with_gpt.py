@@ -1,28 +1,46 @@
+import time
 from datetime import datetime
 
 import openai
 
-from configs.env import OPEN_AI_API_KEY
+from configs.env import (
+    OPEN_AI_API_KEY,
+    TRANSLATION_CHUNK_MAX_ATTEMPTS,
+    OPEN_AI_REQUEST_TIMEOUT_SECONDS,
+    OPEN_AI_REQUESTS_PER_MINUTE,
+    OPEN_AI_TOKENS_PER_MINUTE,
+    TRANSLATION_OUTPUT_TOKENS_RATIO
+)
 from configs.logger import print_info_log, catch_error
 from constants.log_tags import LogTag
+from services.translation.model_latency_stats import model_latency_stats
+from services.translation.split_text_to_chunks import count_tokens
+from utils.hedged_request import hedged_request
+from utils.rate_limiter import get_rate_limiter, get_retry_after_seconds
 
 # Set OpenAI API key
 openai.api_key = OPEN_AI_API_KEY
 
-gpt_model = "gpt-4"
-# gpt_model = "gpt-3.5-turbo"
+DELAY_TO_REPEAT_REQUEST_IN_SECONDS = 5
+
+# Rate limit answers are repeated after Retry-After and don't count as failed attempts, up to this number
+RATE_LIMIT_MAX_RETRIES = 10
+
+# Increase when the prompt changes, so translation memory does not return translations made with the old prompt
+TRANSLATION_PROMPT_VERSION = 2
 
 translation_gpt_prompt = """
 You are a professional text translator.
 You understand the meaning of the text well.
 You are able to select the most appropriate formulations so that they fit the context of the text you are translating.
-I need you to translate the text below to {language} language.
-If the text is already in {language}, you must write this text in the answer without translation.
-If you are not able to translate this text, you must write this text in the answer without translation.
-You must remain all [] symbols on their places in original text.
-Your answer must be only translated text.
+I need you to translate the text segments below to {language} language.
+The segments are given as a JSON object, where keys are segment ids and values are segment texts.
+If a segment is already in {language}, you must write this segment in the answer without translation.
+If you are not able to translate a segment, you must write this segment in the answer without translation.
+You must translate every segment separately, do not merge, split or skip segments.
+Your answer must be only a JSON object with the same keys, where values are translated segments.
 
-The text you need to translate to {language} language:
+The text segments you need to translate to {language} language:
 {text_chunk}
 """
 
@@ -30,6 +48,7 @@ The text you need to translate to {language} language:
 def translate_text_chunk_with_gpt(
     language: str,
     text_chunk: str,
+    model: str,
     project_id: str,
     show_logs: bool
 ) -> str:
@@ -37,36 +56,99 @@ def translate_text_chunk_with_gpt(
     Translates a given text into the specified language using OpenAI's model.
 
     :param language: The target language for translation.
-    :param text_chunk: The text chunks to be translated.
+    :param text_chunk: JSON object with segment ids and texts to be translated.
+    :param model: The name of OpenAI's model.
     :param project_id: The id of the processing project.
     :param show_logs: Determines whether to display logs while translating with gpt.
 
     Returns:
-    - str: Translated text or original text if translation is not possible.
+    - str: Model answer, JSON object with segment ids and translated texts.
       """
 
     try:
         if show_logs:
             print_info_log(
                 tag=LogTag.TRANSLATE_TEXT_CHUNK_WITH_GPT,
-                message=f"Translating text chunk: '{text_chunk}'"
+                message=f"Translating text chunk with {model}: '{text_chunk}'"
             )
 
         query_content = translation_gpt_prompt.format(
             language=language,
             text_chunk=text_chunk
         )
-        response = openai.ChatCompletion.create(
-            model=gpt_model,
-            messages=[{
-                "role": "user",
-                "content": query_content
-            }],
+
+        # OpenAI quotas are per model, the limit counts the prompt and the expected answer
+        rate_limiter = get_rate_limiter(
+            provider=f"openai:{model}",
+            api_key=OPEN_AI_API_KEY,
+            requests_per_minute=OPEN_AI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=OPEN_AI_TOKENS_PER_MINUTE
+        )
+        request_tokens_count = count_tokens(query_content, model) + int(
+            count_tokens(text_chunk, model) * TRANSLATION_OUTPUT_TOKENS_RATIO
         )
-        request_time = datetime.now()
+
+        def create_chat_completion():
+            return openai.ChatCompletion.create(
+                model=model,
+                messages=[{
+                    "role": "user",
+                    "content": query_content
+                }],
+                request_timeout=OPEN_AI_REQUEST_TIMEOUT_SECONDS,
+            )
+
+        # Repeat only this chunk if request failed, other chunks are translated independently
+        attempt = 1
+        rate_limit_retries = 0
+        while True:
+            try:
+                # The quota is waited for before the request, so the wait is not counted as latency of the model
+                rate_limit_slot = rate_limiter.acquire_slot(tokens=request_tokens_count)
+                request_time = datetime.now()
+                # Translation of the same chunk can be requested twice, so a slow request is hedged
+                response = hedged_request(
+                    provider=f"openai:{model}",
+                    request=create_chat_completion,
+                    primary_slot=rate_limit_slot,
+                    try_acquire_hedge_slot=lambda: rate_limiter.try_acquire_slot(tokens=request_tokens_count)
+                )
+                response_time = datetime.now()
+                break
+            except openai.error.RateLimitError as rate_limit_error:
+                if rate_limit_retries >= RATE_LIMIT_MAX_RETRIES:
+                    raise rate_limit_error
+
+                # All requests to the model wait, the next acquire() returns when the quota is free again
+                retry_after_seconds = get_retry_after_seconds(
+                    headers=rate_limit_error.headers,
+                    default_seconds=DELAY_TO_REPEAT_REQUEST_IN_SECONDS
+                )
+                rate_limiter.pause(retry_after_seconds)
+                print_info_log(
+                    tag=LogTag.TRANSLATE_TEXT_CHUNK_WITH_GPT,
+                    message=f"OpenAI rate limit: {str(rate_limit_error)}. Repeat after {retry_after_seconds} seconds..."
+                )
+                rate_limit_retries += 1
+            except openai.error.OpenAIError as openai_error:
+                if attempt >= TRANSLATION_CHUNK_MAX_ATTEMPTS:
+                    raise openai_error
+
+                delay_in_seconds = DELAY_TO_REPEAT_REQUEST_IN_SECONDS * 2 ** (attempt - 1)
+                print_info_log(
+                    tag=LogTag.TRANSLATE_TEXT_CHUNK_WITH_GPT,
+                    message=f"OpenAI error: {str(openai_error)}. Wait {delay_in_seconds} seconds to repeat..."
+                )
+                time.sleep(delay_in_seconds)
+                attempt += 1
+
         translated_text = response['choices'][0]['message']['content']
-        response_time = datetime.now()
         time_difference = response_time - request_time
+        model_latency_stats.record(
+            model=model,
+            output_tokens_count=response['usage']['completion_tokens'],
+            seconds=time_difference.total_seconds()
+        )
 
         if show_logs:
             print_info_log(
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from configs.env import TRANSLATION_MEMORY_MAX_ENTRIES
+from constants.files import CACHE_FILES_DIR_PATH
+from utils.text import normalize_text
+
+TRANSLATION_MEMORY_DB_PATH = f"{CACHE_FILES_DIR_PATH}/translation-memory.sqlite3"
+
+# Share of the entries which stays after eviction, so eviction doesn't run on every insert
+EVICTION_KEEP_RATIO = 0.9
+
+
+def get_translation_key(text: str, language: str, model: str, prompt_version: int) -> str:
+    key_source = "\n".join([normalize_text(text), language.lower(), model, str(prompt_version)])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Persistent segment-level translation cache with least-recently-used eviction.
+
+    The key is (normalized source text, target language, model, prompt version).
+    """
+
+    def __init__(self, db_path: str, max_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                translated_text TEXT NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS translations_last_used_at ON translations (last_used_at)"
+        )
+        self.connection.commit()
+
+    def get_many(
+        self,
+        texts: List[str],
+        language: str,
+        models: List[str],
+        prompt_version: int
+    ) -> List[Optional[str]]:
+        """
+        Return cached translations for texts, None for texts which are not in the memory.
+
+        :param models: Models whose translations are accepted, a translation of the first model is preferred.
+        """
+
+        keys_by_model = [
+            [get_translation_key(text, language, model, prompt_version) for text in texts]
+            for model in models
+        ]
+        all_keys = [key for model_keys in keys_by_model for key in model_keys]
+        with self.lock:
+            found_translations = {}
+            # Stay below SQLite limit of variables in one query
+            for i in range(0, len(all_keys), 500):
+                keys_part = all_keys[i:i + 500]
+                placeholders = ",".join("?" * len(keys_part))
+                rows = self.connection.execute(
+                    f"SELECT key, translated_text FROM translations WHERE key IN ({placeholders})",
+                    keys_part
+                ).fetchall()
+                found_translations.update(rows)
+
+            translations = []
+            used_keys = []
+            for text_keys in zip(*keys_by_model):
+                found_key = next((key for key in text_keys if key in found_translations), None)
+                translations.append(found_translations[found_key] if found_key is not None else None)
+                if found_key is not None:
+                    used_keys.append(found_key)
+
+            self.connection.executemany(
+                "UPDATE translations SET last_used_at = ? WHERE key = ?",
+                [(time.time(), key) for key in used_keys]
+            )
+            self.connection.commit()
+
+            self.hits += len(used_keys)
+            self.misses += len(texts) - len(used_keys)
+
+        return translations
+
+    def put_many(self, texts: List[str], translations: List[str], language: str, model: str, prompt_version: int):
+        now = time.time()
+        rows = [
+            (get_translation_key(text, language, model, prompt_version), translation, now)
+            for text, translation in zip(texts, translations)
+        ]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO translations (key, translated_text, last_used_at) VALUES (?, ?, ?)",
+                rows
+            )
+
+            entries_count = self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            if entries_count > self.max_entries:
+                self.connection.execute(
+                    """
+                    DELETE FROM translations WHERE key IN (
+                        SELECT key FROM translations ORDER BY last_used_at ASC LIMIT ?
+                    )
+                    """,
+                    (entries_count - int(self.max_entries * EVICTION_KEEP_RATIO),)
+                )
+            self.connection.commit()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            requests_count = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests_count if requests_count else 0.0
+            }
+
+
+translation_memory = TranslationMemory(
+    db_path=TRANSLATION_MEMORY_DB_PATH,
+    max_entries=TRANSLATION_MEMORY_MAX_ENTRIES
+)
@@ -0,0 +1,126 @@
+import json
+import re
+from statistics import median
+from typing import Dict
+
+from models.translated_segments_validation import TranslatedSegmentsValidation
+
+# Translation is considered merged with a missing neighbour if it's longer than expected
+# at least by this share of the expected length of the missing neighbour
+MERGED_SEGMENT_EXCESS_SHARE = 0.5
+
+
+def parse_translated_segments(translated_text: str) -> Dict[str, str]:
+    """
+    Parse the model answer into the dictionary of segment ids and translated texts.
+
+    :param translated_text: The model answer, JSON object (optionally wrapped into a markdown code block).
+
+    :return: The dictionary with segment ids and texts, empty if the answer is not a JSON object.
+    """
+
+    json_text = re.sub(r"^\s*```(?:json)?|```\s*$", "", translated_text).strip()
+    try:
+        translated_segments = json.loads(json_text)
+    except json.JSONDecodeError:
+        return {}
+
+    if not isinstance(translated_segments, dict):
+        return {}
+
+    return {
+        str(segment_id): segment_text
+        for segment_id, segment_text in translated_segments.items()
+        if isinstance(segment_text, str)
+    }
+
+
+def validate_translated_segments(
+    text_segments: Dict[str, str],
+    translated_segments: Dict[str, str]
+) -> TranslatedSegmentsValidation:
+    """
+    Compare requested and translated segments by their ids.
+
+    - missing: the requested id is absent or its translation is empty;
+    - merged: the translation next to a missing segment is much longer than it should be,
+      so the model probably put the text of the missing segment into it;
+    - extra: the id which was not requested.
+
+    :param text_segments: The dictionary with requested segment ids and source texts, in timeline order.
+    :param translated_segments: The dictionary with segment ids and translated texts.
+
+    :return: The validation result with ids of missing, merged and extra segments.
+    """
+
+    segment_ids = list(text_segments.keys())
+    missing_ids = [
+        segment_id for segment_id in segment_ids
+        if not translated_segments.get(segment_id, "").strip() and text_segments[segment_id].strip()
+    ]
+    extra_ids = [segment_id for segment_id in translated_segments if segment_id not in text_segments]
+
+    length_ratios = {
+        segment_id: len(translated_segments.get(segment_id, "")) / max(len(text_segments[segment_id]), 1)
+        for segment_id in segment_ids
+        if segment_id not in missing_ids
+    }
+    merged_ids = []
+    if missing_ids and length_ratios:
+        missing_neighbours_lengths = {}
+        for index, segment_id in enumerate(segment_ids):
+            neighbour_ids = segment_ids[max(index - 1, 0):index] + segment_ids[index + 1:index + 2]
+            missing_neighbours_lengths[segment_id] = sum(
+                len(text_segments[neighbour_id]) for neighbour_id in neighbour_ids if neighbour_id in missing_ids
+            )
+
+        # Expected translation length is the source length multiplied by the median ratio
+        # of segments which could not absorb a missing neighbour
+        baseline_length_ratios = [
+            length_ratio for segment_id, length_ratio in length_ratios.items()
+            if not missing_neighbours_lengths[segment_id]
+        ] or list(length_ratios.values())
+        median_length_ratio = median(baseline_length_ratios)
+
+        for segment_id in length_ratios:
+            if not missing_neighbours_lengths[segment_id]:
+                continue
+
+            excess_length = (
+                len(translated_segments.get(segment_id, "")) - len(text_segments[segment_id]) * median_length_ratio
+            )
+            expected_missing_length = missing_neighbours_lengths[segment_id] * median_length_ratio
+            if excess_length >= MERGED_SEGMENT_EXCESS_SHARE * expected_missing_length:
+                merged_ids.append(segment_id)
+
+    return TranslatedSegmentsValidation(
+        missing_ids=missing_ids,
+        merged_ids=merged_ids,
+        extra_ids=extra_ids
+    )
+
+
+if __name__ == "__main__":
+    test_text_segments = {
+        "0": " I wake up in the morning and I want to reach for my phone,",
+        "1": " but I know that even if I were to crank up the brightness",
+        "2": " on that phone screen,",
+        "3": " it's not bright enough to trigger that cortisol spike.",
+        "4": " And for me to be at my most alert and focused throughout",
+    }
+    test_translated_text = """```json
+    {
+        "0": "Я просыпаюсь утром и хочу потянуться к своему телефону,",
+        "1": "но я знаю, что даже если бы я прибавил яркость на экране этого телефона,",
+        "3": "она все равно не достаточно ярка, чтобы вызвать резкий прилив кортизола.",
+        "4": "И чтобы мне быть наиболее бодрым и сосредоточенным в течение",
+        "5": "лишний сегмент"
+    }
+    ```"""
+    test_translated_segments = parse_translated_segments(test_translated_text)
+    print(validate_translated_segments(test_text_segments, test_translated_segments))
+
+    # A segment with a blank source text may be omitted by the model, it's neither missing nor merged
+    test_validation = validate_translated_segments({**test_text_segments, "2": "  "}, test_translated_segments)
+    assert test_validation.missing_ids == [] and test_validation.merged_ids == [], test_validation
+    print(test_validation)
@@ -0,0 +1,242 @@
+import io
+import os
+import shutil
+import threading
+from typing import BinaryIO, Callable, Dict, Set
+
+from configs.env import ARTIFACT_MEMORY_MAX_BYTES, ARTIFACT_TMPFS_DIR_PATH, ARTIFACT_TMPFS_MAX_BYTES
+from constants.files import PROCESSING_FILES_DIR_PATH
+from models.artifact_backend import ArtifactBackend
+
+
+class MemoryArtifactWriter(io.BytesIO):
+    """
+    Buffer which keeps the written data in its artifact when it's closed.
+    """
+
+    def __init__(self, artifact: "Artifact"):
+        super().__init__()
+        self.artifact = artifact
+
+    def close(self):
+        if not self.closed:
+            self.artifact.data = self.getvalue()
+        super().close()
+
+
+class Artifact:
+    """
+    Buffer which a stage passes to later stages, it's kept in memory or in a file on tmpfs or disk.
+    """
+
+    def __init__(self, name: str, backend: ArtifactBackend, reserved_bytes: int, path: str | None = None):
+        self.name = name
+        self.backend = backend
+        self.reserved_bytes = reserved_bytes
+        # Only artifacts on tmpfs or disk have a path
+        self.path = path
+        self.data = b""
+
+    def open_writer(self) -> BinaryIO:
+        if self.backend == ArtifactBackend.MEMORY:
+            return MemoryArtifactWriter(self)
+        return open(self.path, "wb")
+
+    def open_reader(self) -> BinaryIO:
+        if self.backend == ArtifactBackend.MEMORY:
+            # BytesIO shares the bytes until they are changed
+            return io.BytesIO(self.data)
+        return open(self.path, "rb")
+
+    def get_bytes(self) -> bytes:
+        if self.backend == ArtifactBackend.MEMORY:
+            return self.data
+        with self.open_reader() as f:
+            return f.read()
+
+    def get_size(self) -> int:
+        if self.backend == ArtifactBackend.MEMORY:
+            return len(self.data)
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+
+class ArtifactBudget:
+    """
+    Memory and tmpfs budget of artifacts, shared by the stores of all jobs in the process.
+
+    Concurrent jobs reserve from the same budget, so together they take no more memory or tmpfs than configured.
+    Free space of tmpfs is checked on every reservation as well, since other processes use it too and containers
+    often have a small one.
+    """
+
+    def __init__(self, memory_max_bytes: int, tmpfs_dir_path: str, tmpfs_max_bytes: int):
+        self.lock = threading.Lock()
+        self.tmpfs_dir_path = tmpfs_dir_path
+        self.used_bytes = {backend: 0 for backend in ArtifactBackend}
+        self.max_bytes = {
+            ArtifactBackend.MEMORY: memory_max_bytes,
+            # Without tmpfs the tier is skipped
+            ArtifactBackend.TMPFS: tmpfs_max_bytes if os.path.isdir(tmpfs_dir_path) else 0,
+        }
+        self.tmpfs_artifacts: Set[Artifact] = set()
+
+    def get_tmpfs_free_bytes(self) -> int:
+        # Reserved artifacts which are not written yet will take their space too
+        unwritten_bytes = sum(
+            max(artifact.reserved_bytes - artifact.get_size(), 0) for artifact in self.tmpfs_artifacts
+        )
+        return shutil.disk_usage(self.tmpfs_dir_path).free - unwritten_bytes
+
+    def fits(self, backend: ArtifactBackend, expected_bytes: int) -> bool:
+        if self.used_bytes[backend] + expected_bytes > self.max_bytes[backend]:
+            return False
+        return backend != ArtifactBackend.TMPFS or expected_bytes <= self.get_tmpfs_free_bytes()
+
+    def choose_backend(self, expected_bytes: int | None, needs_path: bool) -> ArtifactBackend:
+        if expected_bytes is None:
+            return ArtifactBackend.DISK
+
+        for backend in [ArtifactBackend.MEMORY, ArtifactBackend.TMPFS]:
+            if backend == ArtifactBackend.MEMORY and needs_path:
+                continue
+            if self.fits(backend, expected_bytes):
+                return backend
+        return ArtifactBackend.DISK
+
+    def reserve(
+        self,
+        expected_bytes: int | None,
+        needs_path: bool,
+        create_artifact: Callable[[ArtifactBackend], Artifact]
+    ) -> Artifact:
+        """
+        Choose the backend of a new artifact and reserve its expected size there.
+
+        :param expected_bytes: Expected size of the artifact, None if it's not known.
+        :param needs_path: Whether the artifact must be a file.
+        :param create_artifact: Creates the artifact on the chosen backend, it's called under the lock of the budget.
+
+        :return: The artifact.
+        """
+
+        with self.lock:
+            artifact = create_artifact(self.choose_backend(expected_bytes, needs_path))
+            self.used_bytes[artifact.backend] += artifact.reserved_bytes
+            if artifact.backend == ArtifactBackend.TMPFS:
+                self.tmpfs_artifacts.add(artifact)
+            return artifact
+
+    def release(self, artifact: Artifact):
+        with self.lock:
+            self.used_bytes[artifact.backend] -= artifact.reserved_bytes
+            self.tmpfs_artifacts.discard(artifact)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {backend.value: self.used_bytes[backend] for backend in ArtifactBackend}
+
+
+artifact_budget = ArtifactBudget(
+    memory_max_bytes=ARTIFACT_MEMORY_MAX_BYTES,
+    tmpfs_dir_path=ARTIFACT_TMPFS_DIR_PATH,
+    tmpfs_max_bytes=ARTIFACT_TMPFS_MAX_BYTES
+)
+
+
+class ArtifactStore:
+    """
+    Intermediate artifacts of one job: decoded audio, rendered shards, encoded results.
+
+    An artifact goes to memory if its expected size fits into the memory budget, otherwise to tmpfs if it fits
+    there, otherwise to disk. Budgets are shared by all jobs of the process. The backend is chosen when
+    the artifact is created, so a job spills only when its artifacts and those of concurrent jobs don't fit.
+    Artifacts which are read by path (memory-mapped files, ffmpeg output) skip memory, artifacts of unknown size
+    go to disk. Removed artifacts free their budget.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        budget: ArtifactBudget = artifact_budget,
+        disk_dir_path: str = PROCESSING_FILES_DIR_PATH
+    ):
+        self.lock = threading.Lock()
+        self.budget = budget
+        self.artifacts: Dict[str, Artifact] = {}
+        self.dir_paths = {
+            ArtifactBackend.TMPFS: f"{budget.tmpfs_dir_path}/artifacts-{job_id}",
+            ArtifactBackend.DISK: f"{disk_dir_path}/artifacts-{job_id}",
+        }
+
+    def create_artifact(self, name: str, backend: ArtifactBackend, expected_bytes: int | None) -> Artifact:
+        path = None
+        if backend != ArtifactBackend.MEMORY:
+            os.makedirs(self.dir_paths[backend], exist_ok=True)
+            path = f"{self.dir_paths[backend]}/{name}"
+        return Artifact(name=name, backend=backend, reserved_bytes=expected_bytes or 0, path=path)
+
+    def create(self, name: str, expected_bytes: int | None = None, needs_path: bool = False) -> Artifact:
+        """
+        Create an empty artifact, its data is written with open_writer or by path.
+
+        :param name: Name of the artifact, unique in the job.
+        :param expected_bytes: Expected size of the artifact, None if it's not known.
+        :param needs_path: Whether the artifact must be a file, e.g. to be memory-mapped or written by ffmpeg.
+
+        :return: The artifact.
+        """
+
+        with self.lock:
+            if name in self.artifacts:
+                raise ValueError(f"Artifact {name} already exists.")
+
+            artifact = self.budget.reserve(
+                expected_bytes=expected_bytes,
+                needs_path=needs_path,
+                create_artifact=lambda backend: self.create_artifact(name, backend, expected_bytes)
+            )
+            self.artifacts[name] = artifact
+            return artifact
+
+    def put_bytes(self, name: str, data: bytes) -> Artifact:
+        artifact = self.create(name, expected_bytes=len(data))
+        with artifact.open_writer() as f:
+            f.write(data)
+        return artifact
+
+    def get(self, name: str) -> Artifact:
+        with self.lock:
+            return self.artifacts[name]
+
+    def remove(self, name: str):
+        with self.lock:
+            artifact = self.artifacts.pop(name, None)
+            if artifact is None:
+                return
+        self.budget.release(artifact)
+
+        artifact.data = b""
+        if artifact.path is not None and os.path.exists(artifact.path):
+            os.remove(artifact.path)
+
+    def close(self):
+        """
+        Remove all artifacts of the job.
+        """
+
+        for name in list(self.artifacts):
+            self.remove(name)
+        for dir_path in self.dir_paths.values():
+            shutil.rmtree(dir_path, ignore_errors=True)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                backend.value: {
+                    "artifacts": sum(1 for artifact in self.artifacts.values() if artifact.backend == backend),
+                    "reserved_bytes": sum(
+                        artifact.reserved_bytes for artifact in self.artifacts.values() if artifact.backend == backend
+                    )
+                }
+                for backend in ArtifactBackend
+            }
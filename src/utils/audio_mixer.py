@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def add_samples_with_clipping(track_samples: np.ndarray, segment_samples: np.ndarray) -> int:
+    """
+    Add segment samples to track samples in place, sums are clipped to the sample range like audioop.add does.
+
+    :param track_samples: Samples of the track part, the same length and type as segment_samples.
+    :param segment_samples: Samples to add.
+
+    :return: The number of clipped samples.
+    """
+
+    # 8 and 16-bit sums fit into int32, 32-bit sums need int64
+    sum_type = np.int64 if track_samples.dtype == np.int32 else np.int32
+    type_info = np.iinfo(track_samples.dtype)
+    mixed_samples = track_samples.astype(sum_type) + segment_samples
+    clipped_samples_count = int(np.count_nonzero((mixed_samples > type_info.max) | (mixed_samples < type_info.min)))
+    np.clip(mixed_samples, type_info.min, type_info.max, out=mixed_samples)
+    track_samples[:] = mixed_samples
+    return clipped_samples_count
@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Set, TypeVar
+
+from configs.env import HEDGE_LATENCY_PERCENTILE, HEDGE_MAX_RATIO
+from utils.rate_limiter import RateLimitSlot
+
+T = TypeVar("T")
+
+# Latency samples kept for each provider and how many are needed before hedging starts
+LATENCY_WINDOW_SIZE = 200
+MIN_LATENCY_SAMPLES = 20
+
+# Providers which bill every request get a smaller hedge budget than HEDGE_MAX_RATIO
+PROVIDERS_MAX_HEDGE_RATIO = {
+    "elevenlabs": 0.02,
+}
+
+# Workers of every provider, a request and its hedge need two. Dropped requests run until their timeout,
+# so every provider has its own workers and its slow requests don't delay requests to other providers.
+HEDGING_MAX_WORKERS_PER_PROVIDER = 32
+
+
+class HedgingPolicy:
+    """
+    Rolling latency statistics of one provider and the budget of duplicate requests for it.
+    """
+
+    def __init__(self, provider: str, latency_percentile: float, max_hedge_ratio: float):
+        self.provider = provider
+        self.latency_percentile = latency_percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.executor = ThreadPoolExecutor(
+            max_workers=HEDGING_MAX_WORKERS_PER_PROVIDER,
+            thread_name_prefix=f"hedged-{provider}"
+        )
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW_SIZE)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped_hedges = 0
+
+    def get_hedge_delay(self) -> float | None:
+        """
+        Return seconds after which a duplicate request is sent, None while there are not enough samples.
+        """
+
+        with self.lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            sorted_latencies = sorted(self.latencies)
+            return sorted_latencies[min(int(len(sorted_latencies) * self.latency_percentile), len(sorted_latencies) - 1)]
+
+    def try_acquire_hedge(self) -> bool:
+        with self.lock:
+            # Allow the first hedge, then keep hedges under the share of all calls
+            if self.hedges + 1 > max(self.max_hedge_ratio * self.calls, 1):
+                return False
+            self.hedges += 1
+            return True
+
+    def skip_hedge(self):
+        # The hedge was allowed, but the rate limit has no free slot for it
+        with self.lock:
+            self.hedges -= 1
+            self.skipped_hedges += 1
+
+    def record_call(self, latency_seconds: float, hedge_won: bool):
+        with self.lock:
+            self.calls += 1
+            self.latencies.append(latency_seconds)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "skipped_hedges": self.skipped_hedges,
+                "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+                "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0,
+            }
+
+
+hedging_policies: Dict[str, HedgingPolicy] = {}
+hedging_policies_lock = threading.Lock()
+
+
+def get_hedging_policy(provider: str) -> HedgingPolicy:
+    with hedging_policies_lock:
+        if provider not in hedging_policies:
+            hedging_policies[provider] = HedgingPolicy(
+                provider=provider,
+                latency_percentile=HEDGE_LATENCY_PERCENTILE,
+                max_hedge_ratio=PROVIDERS_MAX_HEDGE_RATIO.get(provider.split(":")[0], HEDGE_MAX_RATIO)
+            )
+        return hedging_policies[provider]
+
+
+def get_hedging_stats() -> dict:
+    with hedging_policies_lock:
+        policies = list(hedging_policies.values())
+    return {policy.provider: policy.get_stats() for policy in policies}
+
+
+class TimedRequest:
+    """
+    Request which remembers when it started, so its elapsed time is known before it ends.
+    """
+
+    def __init__(self, request: Callable[[], T]):
+        self.request = request
+        self.start_time: float | None = None
+
+    def __call__(self) -> T:
+        self.start_time = time.monotonic()
+        return self.request()
+
+    def get_elapsed_seconds(self, now: float) -> float:
+        return now - self.start_time if self.start_time is not None else 0.0
+
+
+def hold_slot(future: Future, slot: RateLimitSlot | None):
+    # The slot is released when the request ends, even if its result is dropped
+    if slot is not None:
+        future.add_done_callback(lambda _: slot.release())
+
+
+def discard_future_result(future: Future, discard_result: Callable[[T], None]):
+    if not future.cancelled() and future.exception() is None:
+        discard_result(future.result())
+
+
+def cancel_futures(futures: Set[Future], discard_result: Callable[[T], None] | None = None):
+    for future in futures:
+        if future.cancel() or discard_result is None:
+            continue
+        # The request has already started, its result is released when it's done
+        future.add_done_callback(lambda done_future: discard_future_result(done_future, discard_result))
+
+
+def hedged_request(
+    provider: str,
+    request: Callable[[], T],
+    timeout_seconds: float | None = None,
+    discard_result: Callable[[T], None] | None = None,
+    primary_slot: RateLimitSlot | None = None,
+    try_acquire_hedge_slot: Callable[[], RateLimitSlot | None] | None = None
+) -> T:
+    """
+    Run an idempotent request and send its duplicate if it's slower than usual for the provider.
+
+    The duplicate is sent when the request takes longer than the rolling latency percentile of the provider
+    and the provider hedge budget allows it. The first successful result is returned, the other request is
+    cancelled if it has not started yet, otherwise its result is dropped with discard_result.
+
+    Requests of a rate limited provider hold their own slots: the caller waits for the slot of the first
+    request before the call, so the wait is not counted as latency, and the duplicate is sent only if a slot
+    is free at once.
+
+    The latency sample of the call is the time of the first request, when the duplicate wins it's the time
+    of the first request until then, so slow requests still count in the percentile.
+
+    :param provider: The name of the provider (e.g. "openai:gpt-4", "whisper"), statistics are kept per provider.
+    :param request: The function which sends the request, it must be safe to call it twice.
+    :param timeout_seconds: Maximum time to wait for any result, raises TimeoutError after it.
+    :param discard_result: Releases a result which is dropped, e.g. closes a streamed response.
+    :param primary_slot: The slot of the rate limit taken for the first request, released when it ends.
+    :param try_acquire_hedge_slot: Takes a slot for the duplicate without waiting, None if there is no free slot.
+
+    :return: The result of the first successful request.
+    """
+
+    policy = get_hedging_policy(provider)
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds is not None else None
+    primary_request = TimedRequest(request)
+    primary_future = policy.executor.submit(primary_request)
+    hold_slot(primary_future, primary_slot)
+    pending_futures = {primary_future}
+
+    hedge_delay = policy.get_hedge_delay()
+    if hedge_delay is not None:
+        done_futures, _ = wait(pending_futures, timeout=hedge_delay)
+        if not done_futures and policy.try_acquire_hedge():
+            hedge_slot = try_acquire_hedge_slot() if try_acquire_hedge_slot is not None else None
+            if try_acquire_hedge_slot is not None and hedge_slot is None:
+                policy.skip_hedge()
+            else:
+                hedge_future = policy.executor.submit(request)
+                hold_slot(hedge_future, hedge_slot)
+                pending_futures.add(hedge_future)
+
+    first_error: BaseException | None = None
+    while pending_futures:
+        remaining_seconds = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        done_futures, pending_futures = wait(pending_futures, timeout=remaining_seconds, return_when=FIRST_COMPLETED)
+        if not done_futures:
+            cancel_futures(pending_futures, discard_result)
+            raise TimeoutError(f"Request to {provider} took longer than {timeout_seconds} seconds")
+
+        for future in done_futures:
+            if future.exception() is not None:
+                first_error = first_error or future.exception()
+                continue
+
+            cancel_futures(pending_futures | (done_futures - {future}), discard_result)
+            policy.record_call(
+                latency_seconds=primary_request.get_elapsed_seconds(time.monotonic()),
+                hedge_won=future is not primary_future
+            )
+            return future.result()
+
+    raise first_error
@@ -0,0 +1,27 @@
+from pydub.utils import mediainfo_json
+
+from models.audio_stream_info import AudioStreamInfo
+
+
+def probe_audio_stream(path: str) -> AudioStreamInfo | None:
+    """
+    Read the format of the first audio stream of the file with ffprobe, without decoding it.
+
+    :param path: Path to the media file.
+
+    :return: Format of the audio stream, None if the file has no audio. Duration is None if it's not known.
+    """
+
+    media_info = mediainfo_json(path)
+    audio_streams = [stream for stream in media_info.get("streams", []) if stream.get("codec_type") == "audio"]
+    if not audio_streams:
+        return None
+
+    audio_stream = audio_streams[0]
+    # Some containers have the duration only in the format section, streamed ones may have none
+    duration = audio_stream.get("duration") or media_info.get("format", {}).get("duration")
+    return AudioStreamInfo(
+        frame_rate=int(audio_stream["sample_rate"]),
+        channels=int(audio_stream["channels"]),
+        duration=float(duration) if duration is not None else None
+    )
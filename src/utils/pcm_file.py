@@ -0,0 +1,146 @@
+import struct
+import subprocess
+import tempfile
+
+import numpy as np
+from pydub import AudioSegment
+
+# Header: magic, frame rate, channels, sample width, frames count, padded to 32 bytes so samples are aligned
+PCM_FILE_MAGIC = b"RPCM"
+PCM_FILE_HEADER_FORMAT = "<4sIHHQ12x"
+PCM_FILE_HEADER_SIZE = struct.calcsize(PCM_FILE_HEADER_FORMAT)
+
+# Samples are 16-bit, the format which ffmpeg decodes to and the mixer works with
+PCM_FILE_SAMPLE_WIDTH = 2
+
+# Bytes copied from ffmpeg to the file at once
+DECODE_CHUNK_BYTES = 1024 * 1024
+
+
+class PCMFile:
+    """
+    Decoded audio in a raw PCM file with a small header, samples are memory-mapped.
+
+    Slices of the samples are views of the mapped file, so stages read only the pages they need and share them
+    in the page cache instead of decoding the audio or holding copies of it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(PCM_FILE_HEADER_SIZE)
+
+        if len(header) < PCM_FILE_HEADER_SIZE or not header.startswith(PCM_FILE_MAGIC):
+            raise ValueError(f"{path} is not a PCM file.")
+        _, self.frame_rate, self.channels, self.sample_width, self.frames_count = struct.unpack(
+            PCM_FILE_HEADER_FORMAT, header
+        )
+
+        if self.frames_count == 0:
+            # Empty files can't be mapped
+            self.samples = np.zeros((0, self.channels), dtype=np.int16)
+        else:
+            self.samples = np.memmap(
+                path,
+                dtype=np.int16,
+                mode="r",
+                offset=PCM_FILE_HEADER_SIZE,
+                shape=(self.frames_count, self.channels)
+            )
+
+    @property
+    def duration(self) -> float:
+        return self.frames_count / self.frame_rate
+
+    def __len__(self) -> int:
+        # Duration in milliseconds, as len of AudioSegment
+        return round(1000 * self.frames_count / self.frame_rate)
+
+    def get_frame(self, position_ms: float) -> int:
+        # The same frame as AudioSegment slicing computes
+        return min(int(position_ms * self.frame_rate / 1000.0), self.frames_count)
+
+    def get_samples(self, start_frame: int, end_frame: int) -> np.ndarray:
+        """
+        Return samples of frames [start_frame, end_frame) shaped (frames, channels), a read-only view of the file.
+        """
+
+        return self.samples[start_frame:end_frame]
+
+    def get_audio_segment(self, start_ms: float = 0, end_ms: float | None = None) -> AudioSegment:
+        """
+        Return audio of [start_ms, end_ms) as AudioSegment, only this slice is copied from the file.
+        """
+
+        end_frame = self.frames_count if end_ms is None else self.get_frame(end_ms)
+        return AudioSegment(
+            data=self.get_samples(self.get_frame(start_ms), end_frame).tobytes(),
+            sample_width=PCM_FILE_SAMPLE_WIDTH,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+    def close(self):
+        # The file is unmapped when the last view of it is released
+        self.samples = np.zeros((0, self.channels), dtype=np.int16)
+
+
+def write_pcm_file_header(f, frame_rate: int, channels: int, frames_count: int):
+    f.seek(0)
+    f.write(struct.pack(
+        PCM_FILE_HEADER_FORMAT, PCM_FILE_MAGIC, frame_rate, channels, PCM_FILE_SAMPLE_WIDTH, frames_count
+    ))
+
+
+def decode_to_pcm_file(source_path: str, pcm_file_path: str, frame_rate: int, channels: int) -> PCMFile:
+    """
+    Decode the audio of the media file to a PCM file with ffmpeg, samples are streamed to the file
+    without being held in memory.
+
+    :param source_path: Path to the media file.
+    :param pcm_file_path: Path to the PCM file to write.
+    :param frame_rate: Frame rate of the PCM file, the audio is resampled by ffmpeg.
+    :param channels: Channels count of the PCM file.
+
+    :return: The PCM file.
+    """
+
+    command = [
+        AudioSegment.converter, "-loglevel", "error", "-i", source_path,
+        "-vn", "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "pipe:1"
+    ]
+    frame_bytes_count = channels * PCM_FILE_SAMPLE_WIDTH
+
+    # Errors go to a file, a full stderr pipe would block ffmpeg while samples are read
+    with tempfile.TemporaryFile() as stderr_file, open(pcm_file_path, "wb") as pcm_file:
+        write_pcm_file_header(pcm_file, frame_rate, channels, frames_count=0)
+
+        decoder = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        samples_bytes_count = 0
+        while chunk_data := decoder.stdout.read(DECODE_CHUNK_BYTES):
+            pcm_file.write(chunk_data)
+            samples_bytes_count += len(chunk_data)
+        return_code = decoder.wait()
+
+        if return_code != 0:
+            stderr_file.seek(0)
+            raise Exception(f"ffmpeg error ({return_code}): {stderr_file.read().decode(errors='replace').strip()}")
+
+        # An incomplete frame at the end is dropped
+        frames_count = samples_bytes_count // frame_bytes_count
+        pcm_file.truncate(PCM_FILE_HEADER_SIZE + frames_count * frame_bytes_count)
+        write_pcm_file_header(pcm_file, frame_rate, channels, frames_count)
+
+    return PCMFile(pcm_file_path)
+
+
+def write_audio_to_pcm_file(audio: AudioSegment, pcm_file_path: str) -> PCMFile:
+    """
+    Write the audio, which is already decoded, to a PCM file.
+    """
+
+    audio = audio.set_sample_width(PCM_FILE_SAMPLE_WIDTH)
+    with open(pcm_file_path, "wb") as pcm_file:
+        write_pcm_file_header(pcm_file, audio.frame_rate, audio.channels, int(audio.frame_count()))
+        pcm_file.write(audio.raw_data)
+    return PCMFile(pcm_file_path)
@@ -0,0 +1,234 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+
+class TokenBucket:
+    """
+    Bucket which is refilled evenly up to the per-minute quota.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.refill_per_second = per_minute / 60
+        self.refill_time = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.refill_time) * self.refill_per_second)
+        self.refill_time = now
+
+    def get_wait_seconds(self, amount: int) -> float:
+        # A request bigger than the whole quota waits for the full bucket, otherwise it would never pass
+        amount = min(amount, self.capacity)
+        return max(amount - self.tokens, 0) / self.refill_per_second
+
+
+class RateLimitSlot:
+    """
+    Concurrent slot of one request, it's held until released, so it may outlive the call which took it.
+    """
+
+    def __init__(self, semaphore: threading.BoundedSemaphore | None):
+        self.semaphore = semaphore
+        self.lock = threading.Lock()
+        self.released = False
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    def __enter__(self) -> "RateLimitSlot":
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class ProviderRateLimiter:
+    """
+    Process-wide limits of one provider API key: requests, tokens and characters per minute and concurrent requests.
+
+    Callers wait until every quota allows the request, so concurrent jobs share the quota instead of hitting it.
+    When the provider answers with 429, pause() stops all requests until the time from Retry-After.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        characters_per_minute: int = 0,
+        max_concurrency: int = 0
+    ):
+        self.name = name
+        self.lock = threading.Lock()
+        # Limit 0 means no limit
+        self.buckets: Dict[str, TokenBucket] = {
+            quota_name: TokenBucket(per_minute)
+            for quota_name, per_minute in [
+                ("requests", requests_per_minute),
+                ("tokens", tokens_per_minute),
+                ("characters", characters_per_minute),
+            ]
+            if per_minute > 0
+        }
+        self.concurrency_semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.paused_until = 0.0
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.pauses = 0
+
+    def take_quota(self, amounts: Dict[str, int]) -> float:
+        """
+        Take the quota of one request if every quota allows it now.
+
+        :return: 0 if the quota is taken, otherwise seconds to wait before the next try.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+
+            wait_seconds = max(
+                [self.paused_until - now] + [
+                    bucket.get_wait_seconds(amounts.get(quota_name, 0))
+                    for quota_name, bucket in self.buckets.items()
+                ]
+            )
+            if wait_seconds > 0:
+                return wait_seconds
+
+            for quota_name, bucket in self.buckets.items():
+                bucket.tokens -= min(amounts.get(quota_name, 0), bucket.capacity)
+            self.requests += 1
+            return 0
+
+    def wait_for_quota(self, amounts: Dict[str, int]):
+        waited = False
+        start_time = time.monotonic()
+        while wait_seconds := self.take_quota(amounts):
+            waited = True
+            time.sleep(wait_seconds)
+
+        if waited:
+            with self.lock:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - start_time
+
+    def acquire_slot(self, tokens: int = 0, characters: int = 0) -> RateLimitSlot:
+        """
+        Wait for a free concurrent slot and for the quota of one request.
+
+        :param tokens: Tokens count of the request (prompt and expected answer).
+        :param characters: Characters count of the request (text to synthesize).
+
+        :return: The slot, it must be released when the request is finished.
+        """
+
+        if self.concurrency_semaphore is not None:
+            self.concurrency_semaphore.acquire()
+        slot = RateLimitSlot(self.concurrency_semaphore)
+        try:
+            self.wait_for_quota({"requests": 1, "tokens": tokens, "characters": characters})
+        except BaseException:
+            slot.release()
+            raise
+        return slot
+
+    def try_acquire_slot(self, tokens: int = 0, characters: int = 0) -> RateLimitSlot | None:
+        """
+        Take a concurrent slot and the quota of one request without waiting, e.g. for a duplicate request.
+
+        :return: The slot, None if there is no free slot or quota now.
+        """
+
+        if self.concurrency_semaphore is not None and not self.concurrency_semaphore.acquire(blocking=False):
+            return None
+        slot = RateLimitSlot(self.concurrency_semaphore)
+        if self.take_quota({"requests": 1, "tokens": tokens, "characters": characters}):
+            slot.release()
+            return None
+        return slot
+
+    @contextmanager
+    def acquire(self, tokens: int = 0, characters: int = 0):
+        """
+        Wait for a free concurrent slot and for the quota of one request, the slot is released on exit.
+        """
+
+        with self.acquire_slot(tokens=tokens, characters=characters):
+            yield
+
+    def pause(self, seconds: float):
+        """
+        Stop all requests for the given time, used when the provider answers that the quota is exceeded.
+        """
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.pauses += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "pauses": self.pauses
+            }
+
+
+rate_limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    provider: str,
+    api_key: str | None,
+    requests_per_minute: int = 0,
+    tokens_per_minute: int = 0,
+    characters_per_minute: int = 0,
+    max_concurrency: int = 0
+) -> ProviderRateLimiter:
+    """
+    Return the limiter of the provider API key, it's created with given limits on the first call.
+    """
+
+    # Quotas belong to the API key, but the key itself is not kept in names and metrics
+    api_key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+    with rate_limiters_lock:
+        if (provider, api_key_hash) not in rate_limiters:
+            rate_limiters[(provider, api_key_hash)] = ProviderRateLimiter(
+                name=f"{provider}:{api_key_hash}",
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                characters_per_minute=characters_per_minute,
+                max_concurrency=max_concurrency
+            )
+        return rate_limiters[(provider, api_key_hash)]
+
+
+def get_retry_after_seconds(headers, default_seconds: float) -> float:
+    """
+    Read Retry-After header (seconds) of 429 response, default_seconds if there is no such header.
+    """
+
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return default_seconds
+
+
+def get_rate_limiters_stats() -> dict:
+    with rate_limiters_lock:
+        limiters = list(rate_limiters.values())
+    return {limiter.name: limiter.get_stats() for limiter in limiters}
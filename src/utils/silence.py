@@ -0,0 +1,197 @@
+from typing import List
+
+import numpy as np
+from pydub import AudioSegment
+from pydub import silence as pydub_silence
+from pydub.utils import db_to_float
+
+# Milliseconds of audio converted to samples at once, so an hour-long track doesn't need an array of all squares
+SQUARES_CHUNK_DURATION_MS = 60 * 1000
+
+SAMPLE_TYPES = {
+    1: np.int8,
+    2: np.int16,
+}
+
+
+def get_window_rms_values(
+    audio_segment: AudioSegment,
+    window_starts_ms: np.ndarray,
+    window_duration_ms: int
+) -> np.ndarray:
+    """
+    Compute RMS of audio_segment[start:start + window_duration_ms] for every start, the same way as pydub does it.
+
+    Sums of squares are taken from cumulative sums per millisecond, so every window costs the same
+    regardless of its length. The result matches audioop.rms of the slice: integer samples of all channels,
+    window boundaries in frames truncated like in AudioSegment slicing, frames past the end counted as silence.
+    """
+
+    frame_rate = audio_segment.frame_rate
+    channels = audio_segment.channels
+    duration_ms = len(audio_segment)
+    samples = np.frombuffer(audio_segment.raw_data, dtype=SAMPLE_TYPES[audio_segment.sample_width])
+    frames_count = len(samples) // channels
+
+    # The first frame of every millisecond, as AudioSegment._parse_position computes it
+    milliseconds_frames = (np.arange(duration_ms + 1) * (frame_rate / 1000.0)).astype(np.int64)
+    clipped_milliseconds_frames = np.minimum(milliseconds_frames, frames_count)
+
+    # Sum of squares of every millisecond, int64 is exact for 16-bit samples of tracks up to hundreds of hours
+    milliseconds_squares_sums = np.zeros(duration_ms, dtype=np.int64)
+    for chunk_start_ms in range(0, duration_ms, SQUARES_CHUNK_DURATION_MS):
+        chunk_end_ms = min(chunk_start_ms + SQUARES_CHUNK_DURATION_MS, duration_ms)
+        chunk_start_frame = clipped_milliseconds_frames[chunk_start_ms]
+        chunk_end_frame = clipped_milliseconds_frames[chunk_end_ms]
+
+        chunk_samples = samples[chunk_start_frame * channels:chunk_end_frame * channels].astype(np.int64)
+        chunk_squares_cumsum = np.concatenate(([0], np.cumsum(chunk_samples * chunk_samples)))
+        chunk_boundaries = (clipped_milliseconds_frames[chunk_start_ms:chunk_end_ms + 1] - chunk_start_frame) * channels
+        milliseconds_squares_sums[chunk_start_ms:chunk_end_ms] = np.diff(chunk_squares_cumsum[chunk_boundaries])
+
+    squares_cumsum = np.concatenate(([0], np.cumsum(milliseconds_squares_sums)))
+    window_ends_ms = window_starts_ms + window_duration_ms
+    squares_sums = squares_cumsum[window_ends_ms] - squares_cumsum[window_starts_ms]
+    # Missing frames at the end are added as silence, so they count in the number of samples
+    samples_counts = (milliseconds_frames[window_ends_ms] - milliseconds_frames[window_starts_ms]) * channels
+
+    rms_values = np.zeros(len(window_starts_ms), dtype=np.float64)
+    np.divide(squares_sums, samples_counts, out=rms_values, where=samples_counts > 0)
+    return np.floor(np.sqrt(rms_values))
+
+
+def detect_silence(
+    audio_segment: AudioSegment,
+    min_silence_len: int = 1000,
+    silence_thresh: float = -16,
+    seek_step: int = 1,
+    hysteresis_db: float = 0
+) -> List[List[int]]:
+    """
+    Returns a list of all silent sections [start, end] in milliseconds of audio_segment.
+
+    Vectorized version of pydub.silence.detect_silence, with hysteresis_db=0 the result is the same.
+
+    :param audio_segment: The segment to find silence in.
+    :param min_silence_len: The minimum length for any silent section in milliseconds.
+    :param silence_thresh: The upper bound for how quiet is silent in dBFS.
+    :param seek_step: Step size for iterating over the segment in milliseconds.
+    :param hysteresis_db: Silence lasts until the window is louder than silence_thresh + hysteresis_db,
+        so noise around the threshold does not split a pause.
+    """
+
+    if audio_segment.sample_width not in SAMPLE_TYPES:
+        return pydub_silence.detect_silence(audio_segment, min_silence_len, silence_thresh, seek_step)
+
+    seg_len = len(audio_segment)
+
+    # You can't have a silent portion of a sound that is longer than the sound
+    if seg_len < min_silence_len:
+        return []
+
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step, dtype=np.int64)
+    # Guarantee last_slice_start is included, to make sure the last portion of the audio is searched
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+
+    rms_values = get_window_rms_values(audio_segment, slice_starts, min_silence_len)
+    max_possible_amplitude = audio_segment.max_possible_amplitude
+    is_silent = rms_values <= db_to_float(silence_thresh) * max_possible_amplitude
+
+    if hysteresis_db:
+        # Windows between the thresholds keep the state of the previous window
+        is_loud = rms_values > db_to_float(silence_thresh + hysteresis_db) * max_possible_amplitude
+        is_decided = is_silent | is_loud
+        last_decided_indexes = np.maximum.accumulate(np.where(is_decided, np.arange(len(is_decided)), -1))
+        is_silent = np.where(last_decided_indexes >= 0, is_silent[np.maximum(last_decided_indexes, 0)], False)
+
+    silence_starts = slice_starts[is_silent]
+
+    # Short circuit when there is no silence
+    if len(silence_starts) == 0:
+        return []
+
+    # Combine overlapping and continuous silent windows into ranges (start ms - end ms)
+    previous_starts = silence_starts[:-1]
+    next_starts = silence_starts[1:]
+    is_range_break = (next_starts != previous_starts + seek_step) & (next_starts > previous_starts + min_silence_len)
+    break_indexes = np.flatnonzero(is_range_break)
+
+    range_starts = np.concatenate(([silence_starts[0]], next_starts[break_indexes]))
+    range_ends = np.concatenate((previous_starts[break_indexes], [silence_starts[-1]])) + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(
+    audio_segment: AudioSegment,
+    min_silence_len: int = 1000,
+    silence_thresh: float = -16,
+    seek_step: int = 1,
+    hysteresis_db: float = 0
+) -> List[List[int]]:
+    """
+    Returns a list of all nonsilent sections [start, end] in milliseconds of audio_segment.
+
+    Vectorized version of pydub.silence.detect_nonsilent, parameters are the same as in detect_silence().
+    """
+
+    silent_ranges = detect_silence(audio_segment, min_silence_len, silence_thresh, seek_step, hysteresis_db)
+    len_seg = len(audio_segment)
+
+    # If there is no silence, the whole thing is nonsilent
+    if not silent_ranges:
+        return [[0, len_seg]]
+
+    # Short circuit when the whole audio segment is silent
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end_i = 0
+    nonsilent_ranges = []
+    for start_i, end_i in silent_ranges:
+        nonsilent_ranges.append([prev_end_i, start_i])
+        prev_end_i = end_i
+
+    if silent_ranges[-1][1] != len_seg:
+        nonsilent_ranges.append([prev_end_i, len_seg])
+
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+
+    return nonsilent_ranges
+
+
+# Benchmark on synthetic speech-like track: tone bursts with pauses
+if __name__ == "__main__":
+    import time
+
+    from pydub.generators import Sine, WhiteNoise
+
+    def create_test_track(duration_minutes: int) -> AudioSegment:
+        phrase = Sine(220).to_audio_segment(duration=2300, volume=-12).overlay(
+            WhiteNoise().to_audio_segment(duration=2300, volume=-30)
+        )
+        pause = AudioSegment.silent(duration=3000) + WhiteNoise().to_audio_segment(duration=700, volume=-60)
+        block = (phrase + pause).set_frame_rate(24000).set_channels(1).set_sample_width(2)
+        return block * (duration_minutes * 60 * 1000 // len(block))
+
+    test_min_silence_len = 2000
+    test_silence_thresh = -30
+
+    comparison_track = create_test_track(duration_minutes=5)
+    start_time = time.perf_counter()
+    pydub_ranges = pydub_silence.detect_nonsilent(comparison_track, test_min_silence_len, test_silence_thresh)
+    pydub_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    numpy_ranges = detect_nonsilent(comparison_track, test_min_silence_len, test_silence_thresh)
+    numpy_seconds = time.perf_counter() - start_time
+    print(f"5 min track: pydub {pydub_seconds:.2f}s, numpy {numpy_seconds:.3f}s, "
+          f"speedup x{pydub_seconds / numpy_seconds:.0f}, identical ranges: {pydub_ranges == numpy_ranges}")
+
+    hour_track = create_test_track(duration_minutes=60)
+    start_time = time.perf_counter()
+    numpy_ranges = detect_nonsilent(hour_track, test_min_silence_len, test_silence_thresh)
+    numpy_seconds = time.perf_counter() - start_time
+    print(f"60 min track: numpy {numpy_seconds:.2f}s for {len(numpy_ranges)} ranges, "
+          f"pydub estimate {pydub_seconds * 12:.0f}s")
@@ -0,0 +1,9 @@
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for cache keys - unicode form, outer and repeated whitespaces.
+    """
+
+    return " ".join(unicodedata.normalize("NFC", text).split())